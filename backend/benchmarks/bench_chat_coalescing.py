@@ -0,0 +1,137 @@
+"""
+Websocket frames per streamed answer with and without token coalescing.
+
+    cd backend && python benchmarks/bench_chat_coalescing.py --answers 20 --tokens 2000 --token-interval 0.0005
+
+Answers are streamed from a fake LangGraph run through the chat handler's run/sender tasks; frames are written
+to a real socket pair so each frame costs a send syscall, as it would on a websocket.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from langgraph_sdk.schema import StreamPart
+
+from app.api import chat
+from app.core import langgraph_client
+from app.core.coalescer import ChunkCoalescer
+from app.core.config import CHAT_COALESCE_WINDOW_SECONDS
+from app.db.models import Thread
+
+
+class FakeRuns:
+    def __init__(self, tokens: int, interval: float):
+        self.tokens = tokens
+        self.interval = interval
+
+    async def stream(self, thread_id, assistant_id, **kwargs):
+        yield StreamPart("metadata", {"run_id": "bench"})
+        for i in range(self.tokens):
+            # Model tokens arrive spread out; sleep(0) still yields between them
+            await asyncio.sleep(self.interval)
+            yield StreamPart("messages", [{"content": f" tok{i}", "type": "AIMessageChunk"}, {}])
+
+    async def cancel(self, thread_id, run_id, **kwargs):
+        pass
+
+
+class FakeLangGraphClient:
+    def __init__(self, runs):
+        self.runs = runs
+
+
+class SocketWebSocket:
+    """send_text over a socket pair; the receiving end is drained after every frame"""
+
+    def __init__(self):
+        self.writer, self.reader = socket.socketpair()
+        self.reader.setblocking(False)
+        self.frames = 0
+        self.first_frame_at = None
+
+    async def send_text(self, text: str):
+        if self.first_frame_at is None:
+            self.first_frame_at = time.perf_counter()
+        self.writer.sendall(text.encode())
+        self.frames += 1
+        try:
+            while self.reader.recv(1 << 16):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        self.writer.close()
+        self.reader.close()
+
+
+async def answer(websocket, window: float) -> dict:
+    outbound = asyncio.Queue(maxsize=chat.CHAT_OUTBOUND_QUEUE_SIZE)
+    sender = asyncio.create_task(chat.send_outbound(websocket, outbound, ChunkCoalescer(window=window)))
+    run = chat.ChatRun("bench", outbound=outbound)
+    thread = Thread(id=1, user_id=1, langgraph_thread_id="bench")
+    start = time.perf_counter()
+    run.task = asyncio.create_task(chat.run_agent(run, "hi", thread, 1))
+    await run.task
+    while not outbound.empty():
+        await asyncio.sleep(0.001)
+    # Let the last window expire
+    await asyncio.sleep(window + 0.01)
+    sender.cancel()
+    return {"ttft": websocket.first_frame_at - start}
+
+
+async def run(answers: int, tokens: int, interval: float, window: float) -> dict:
+    async def discard(thread_id, role, content):
+        pass
+
+    chat.transcript_writer.add = discard
+    langgraph_client._client = FakeLangGraphClient(FakeRuns(tokens, interval))
+
+    frames = 0
+    ttft = 0.0
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for _ in range(answers):
+        websocket = SocketWebSocket()
+        result = await answer(websocket, window)
+        frames += websocket.frames
+        ttft += result["ttft"]
+        websocket.close()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    return {
+        "frames_per_answer": frames / answers,
+        "frames_per_second": frames / wall,
+        "cpu_ms_per_answer": cpu / answers * 1000,
+        "ttft_ms": ttft / answers * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--answers", type=int, default=20)
+    parser.add_argument("--tokens", type=int, default=2000, help="tokens per answer")
+    parser.add_argument("--token-interval", type=float, default=0.0005, help="seconds between upstream tokens")
+    parser.add_argument("--window", type=float, default=CHAT_COALESCE_WINDOW_SECONDS)
+    args = parser.parse_args()
+
+    print(f"{args.answers} answers x {args.tokens} tokens, one token every {args.token_interval * 1000:.2f}ms")
+    for label, window in (("one frame per token", 0.0), (f"coalesced {args.window * 1000:.0f}ms  ", args.window)):
+        result = asyncio.run(run(args.answers, args.tokens, args.token_interval, window))
+        print(
+            f"{label}: {result['frames_per_answer']:8.1f} frames/answer  "
+            f"{result['frames_per_second']:9.1f} frames/s  "
+            f"{result['cpu_ms_per_answer']:7.2f}ms CPU/answer  "
+            f"ttft {result['ttft_ms']:.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Login throughput on a file-backed SQLite database with and without the production profile
+(WAL + pragmas + single serialized writer connection).
+
+    cd backend && python benchmarks/bench_sqlite_profile.py --logins 500 --concurrency 50
+
+Google is replaced by an in-process MockTransport, so the numbers measure the app and the database only.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core import http_client
+from app.core.config import GOOGLE_TOKEN_URL, GOOGLE_USERINFO_URL
+from app.db.database import Base, create_async_engines, get_async_db, get_async_write_db
+from app.main import app
+
+
+def fake_google():
+    def handler(request: httpx.Request) -> httpx.Response:
+        if str(request.url) == GOOGLE_TOKEN_URL:
+            code = dict(pair.split("=") for pair in request.content.decode().split("&"))["code"]
+            return httpx.Response(200, json={
+                "access_token": f"access_{code}",
+                "refresh_token": f"refresh_{code}",
+                "expires_in": 3599,
+            })
+        if str(request.url) == GOOGLE_USERINFO_URL:
+            code = request.headers["Authorization"].split("access_")[1]
+            return httpx.Response(200, json={"email": f"{code}@example.com", "name": code})
+        return httpx.Response(404, json={})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+async def run(production_mode: bool, logins: int, concurrency: int, users: int) -> dict:
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    url = f"sqlite:///{path}"
+    Base.metadata.create_all(bind=create_engine(url))
+    read_engine, write_engine = create_async_engines(url, sqlite_production_mode=production_mode)
+    read_sessions = async_sessionmaker(bind=read_engine, expire_on_commit=False)
+    write_sessions = async_sessionmaker(bind=write_engine, expire_on_commit=False)
+
+    async def override_read():
+        async with read_sessions() as db:
+            yield db
+
+    async def override_write():
+        async with write_sessions() as db:
+            yield db
+
+    app.dependency_overrides[get_async_db] = override_read
+    app.dependency_overrides[get_async_write_db] = override_write
+    http_client._client = fake_google()
+
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def login(i):
+            nonlocal failures
+            async with semaphore:
+                response = await client.get("/auth/google", params={"code": f"user{i % users}"})
+                if response.status_code != 307:
+                    failures += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(login(i) for i in range(logins)))
+        elapsed = time.perf_counter() - start
+
+    app.dependency_overrides.clear()
+    await http_client.close_http_client()
+    await read_engine.dispose()
+    if write_engine is not read_engine:
+        await write_engine.dispose()
+    return {"elapsed": elapsed, "per_second": logins / elapsed, "failures": failures}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=100, help="distinct accounts; repeats exercise the update path")
+    args = parser.parse_args()
+
+    print(f"{args.logins} logins, concurrency {args.concurrency}, {args.users} users")
+    for production_mode in (False, True):
+        result = asyncio.run(run(production_mode, args.logins, args.concurrency, args.users))
+        label = "production profile" if production_mode else "default sqlite   "
+        print(
+            f"{label}: {result['per_second']:8.1f} logins/s  "
+            f"({result['elapsed']:.2f}s, {result['failures']} failed)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""Added expires_at to Token Table for proactive refresh
+
+Revision ID: 4b7e2f91c0a3
+Revises: dc9305e7df55
+Create Date: 2026-10-18 09:12:40.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b7e2f91c0a3'
+down_revision: Union[str, None] = 'dc9305e7df55'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('tokens', sa.Column('expires_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_tokens_expires_at'), 'tokens', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_tokens_expires_at'), table_name='tokens')
+    op.drop_column('tokens', 'expires_at')
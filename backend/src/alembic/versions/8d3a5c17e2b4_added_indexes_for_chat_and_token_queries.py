@@ -0,0 +1,41 @@
+"""Added indexes for the chat and token access patterns
+
+Revision ID: 8d3a5c17e2b4
+Revises: 4b7e2f91c0a3
+Create Date: 2026-10-18 11:03:27.551930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d3a5c17e2b4'
+down_revision: Union[str, None] = '4b7e2f91c0a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Keep only the newest token per (user, provider) so the unique index can be built
+    op.execute(
+        "DELETE FROM tokens WHERE id NOT IN "
+        "(SELECT MAX(id) FROM tokens GROUP BY user_id, token_authenticator)"
+    )
+    op.create_index('uq_tokens_user_id_token_authenticator', 'tokens', ['user_id', 'token_authenticator'], unique=True)
+    op.create_index('ix_messages_thread_id_created_at', 'messages', ['thread_id', 'created_at'], unique=False)
+    op.create_index('ix_threads_user_id_created_at', 'threads', ['user_id', 'created_at'], unique=False)
+    op.create_index('ix_files_store_id', 'files', ['store_id'], unique=False)
+    op.create_index('ix_knowledge_stores_user_id', 'knowledge_stores', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_knowledge_stores_user_id', table_name='knowledge_stores')
+    op.drop_index('ix_files_store_id', table_name='files')
+    op.drop_index('ix_threads_user_id_created_at', table_name='threads')
+    op.drop_index('ix_messages_thread_id_created_at', table_name='messages')
+    op.drop_index('uq_tokens_user_id_token_authenticator', table_name='tokens')
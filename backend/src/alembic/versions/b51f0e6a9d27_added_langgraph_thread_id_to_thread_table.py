@@ -0,0 +1,30 @@
+"""Added langgraph_thread_id to Thread Table
+
+Revision ID: b51f0e6a9d27
+Revises: 8d3a5c17e2b4
+Create Date: 2026-10-18 13:41:05.204117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b51f0e6a9d27'
+down_revision: Union[str, None] = '8d3a5c17e2b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('threads', sa.Column('langgraph_thread_id', sa.String(), nullable=True))
+    op.create_index('uq_threads_langgraph_thread_id', 'threads', ['langgraph_thread_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_threads_langgraph_thread_id', table_name='threads')
+    op.drop_column('threads', 'langgraph_thread_id')
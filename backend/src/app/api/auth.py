@@ -1,17 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 import jwt
 from datetime import datetime, timedelta
-import requests
 import os
 import httpx
-from fastapi import FastAPI, HTTPException, status
+from fastapi import status
 from fastapi.responses import RedirectResponse
 import json
 
-from app.db.database import get_db
-from app.db.models import User as UserDB
-from app.models.schemas import OAuthCode
+from app.db.database import AsyncSessionLocal, AsyncWriteSessionLocal, get_async_write_db
+from app.db.upserts import upsert_user, upsert_token
+from app.models.UserService import UserService
+from app.core.http_client import get_http_client
+from app.core.singleflight import SingleFlight
+from app.core.dependencies import invalidate_user
 from app.core.config import (
     JWT_SECRET_KEY, 
     JWT_ALGORITHM,
@@ -19,18 +22,23 @@ from app.core.config import (
     GOOGLE_CLIENT_ID,
     GOOGLE_CLIENT_SECRET,
     GOOGLE_TOKEN_URL,
-    GOOGLE_REDIRECT_URI
+    GOOGLE_USERINFO_URL,
+    GOOGLE_REDIRECT_URI,
+    GOOGLE_TOKEN_DEFAULT_EXPIRES_SECONDS,
 )
 
 router = APIRouter()
 
+# In-flight session refreshes, keyed by user id
+refresh_flights = SingleFlight()
+
 def create_session_token(user_id: str) -> str:
     """Create a JWT session token"""
     expire = datetime.utcnow() + timedelta(minutes=JWT_ACCESS_TOKEN_EXPIRE_MINUTES)
     data = {"user_id": user_id, "exp": expire}
     return jwt.encode(data, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
 
-def exchange_google_code(auth_code: str) -> dict:
+async def exchange_google_code(auth_code: str) -> dict:
     """Exchange Google auth code for tokens"""
     payload = {
         "code": auth_code,
@@ -39,25 +47,31 @@ def exchange_google_code(auth_code: str) -> dict:
         "redirect_uri": GOOGLE_REDIRECT_URI,
         "grant_type": "authorization_code"
     }
-    response = requests.post(GOOGLE_TOKEN_URL, data=payload)
+    try:
+        response = await get_http_client().post(GOOGLE_TOKEN_URL, data=payload)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Google token endpoint unreachable: {e}")
     if response.status_code != 200:
         raise HTTPException(
             status_code=response.status_code,
-            detail="Failed to obtain token from Google"
+            detail=f"Failed to obtain token from Google: {response.text}"
         )
     return response.json()
 
-def get_google_user_info(access_token: str) -> dict:
+async def get_google_user_info(access_token: str) -> dict:
     """Get user info from Google"""
-    response = requests.get(
-        "https://www.googleapis.com/oauth2/v1/userinfo",
-        headers={"Authorization": f"Bearer {access_token}"}
-    )
+    try:
+        response = await get_http_client().get(
+            GOOGLE_USERINFO_URL,
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Google userinfo endpoint unreachable: {e}")
     if response.status_code != 200:
         raise HTTPException(status_code=401, detail="Failed to get user info")
     return response.json()
 
-def refresh_google_token(refresh_token: str) -> dict:
+async def refresh_google_token(refresh_token: str) -> dict:
     """Refresh Google access token"""
     payload = {
         "client_id": GOOGLE_CLIENT_ID,
@@ -65,13 +79,24 @@ def refresh_google_token(refresh_token: str) -> dict:
         "refresh_token": refresh_token,
         "grant_type": "refresh_token"
     }
-    response = requests.post(GOOGLE_TOKEN_URL, data=payload)
+    try:
+        response = await get_http_client().post(GOOGLE_TOKEN_URL, data=payload)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Google token endpoint unreachable: {e}")
     if response.status_code != 200:
         raise HTTPException(status_code=401, detail="Failed to refresh Google token")
     return response.json()
 
+def google_token_expiry(token_data: dict) -> datetime:
+    """
+    Absolute (UTC) expiry of a Google access token from its `expires_in` field.
+    Without one, assume Google's usual hour so the token is still refreshed in time.
+    """
+    expires_in = token_data.get("expires_in") or GOOGLE_TOKEN_DEFAULT_EXPIRES_SECONDS
+    return datetime.utcnow() + timedelta(seconds=int(expires_in))
+
 @router.get("/google")
-async def auth_callback(code: str = None, state: str = None, db: Session = Depends(get_db)):
+async def auth_callback(code: str = None, state: str = None, db: AsyncSession = Depends(get_async_write_db)):
     """
     - Identify user from the authorization code provided
         1. If exists update the Token table with new access token and refresh token 
@@ -97,84 +122,32 @@ async def auth_callback(code: str = None, state: str = None, db: Session = Depen
             pass
 
     # Exchange code for tokens
-    payload = {
-        "code": code,
-        "client_id": GOOGLE_CLIENT_ID,
-        "client_secret": GOOGLE_CLIENT_SECRET,
-        "redirect_uri": GOOGLE_REDIRECT_URI,
-        "grant_type": "authorization_code"
-    }
-
-    response = requests.post(GOOGLE_TOKEN_URL, data=payload)
-    if response.status_code != 200:
-        raise HTTPException(
-            status_code=response.status_code,
-            detail=f"Failed to obtain token from Google: {response.text}"
-        )
-    
-    token_data = response.json()
+    token_data = await exchange_google_code(code)
     access_token = token_data.get("access_token")
     refresh_token = token_data.get("refresh_token")
+    expires_at = google_token_expiry(token_data)
     
     # Get user info from Google
-    user_info = get_google_user_info(access_token)
+    user_info = await get_google_user_info(access_token)
     print("check if access token is obtainining user info : \n", user_info)
-    # Check if user exists in database
-    from datetime import datetime
-    from app.db.models import User, Token
-    
-    # Query for existing user by email
-    existing_user = db.query(User).filter(User.email == user_info["email"]).first()
-    print("check if User email is being queries properly in the database : \n", existing_user)
-    
-    if existing_user:
-        # User exists, update tokens
-        user_id = existing_user.id
-        print("check if existing user is being queried in the database : \n", existing_user)
-        # Check if token exists
-        existing_token = db.query(Token).filter(Token.user_id == user_id).first()
-        
-        if existing_token:
-            # Update existing token
-            existing_token.access_token = access_token
-            existing_token.refresh_token = refresh_token
-            existing_token.created_at = datetime.utcnow().isoformat()
-        else:
-            # Create new token
-            new_token = Token(
-                user_id=user_id,
-                access_token=access_token,
-                refresh_token=refresh_token,
-                token_authenticator="google",
-                created_at=datetime.utcnow().isoformat()
-            )
-            print("Issue new tokens to the existing user: \n", new_token)
-            db.add(new_token)
-    else:
-        # Create new user
-        new_user = User(
-            email=user_info["email"],
-            username=user_info.get("name", user_info["email"].split("@")[0]),
-            created_at=datetime.utcnow().isoformat()
-        )
-        print("check if a new User is being created in the database : \n", new_user)
-        db.add(new_user)
-        db.flush()  # Flush to get the new user ID
-        
-        # Create token for new user
-        new_token = Token(
-            user_id=new_user.id,
-            access_token=access_token,
-            refresh_token=refresh_token,
-            token_authenticator="google",
-            created_at=datetime.utcnow().isoformat()
-        )
-        print("check if a Token is being issued to newly created user in the database : \n", new_user)
-        db.add(new_token)
-        user_id = new_user.id
-    
+    # Create the user if new and store their tokens: two statements, one commit
+    user_id = await upsert_user(
+        db,
+        email=user_info["email"],
+        username=user_info.get("name", user_info["email"].split("@")[0]),
+    )
+    await upsert_token(
+        db,
+        user_id,
+        "google",
+        access_token=access_token,
+        refresh_token=refresh_token,
+        expires_at=expires_at,
+    )
+
     # Commit changes to database
-    db.commit()
+    await db.commit()
+    invalidate_user(user_id)
     
     # Create session token
     session_token = create_session_token(str(user_id))
@@ -186,9 +159,53 @@ async def auth_callback(code: str = None, state: str = None, db: Session = Depen
     
     return RedirectResponse(url=redirect_with_token)
 
+async def refresh_user_session(user_id: int) -> dict:
+    """
+    Refresh a user's stored Google tokens and issue a new session token.
+    Runs as a shared single flight, so it opens its own sessions rather than
+    borrowing one caller's, which would close if that client went away. The
+    write session (a single connection on SQLite in production mode) is only
+    taken for the final UPDATE, not held across the Google round trip.
+    """
+    from app.db.models import User, Token
+
+    # Get user and check refresh token
+    async with AsyncSessionLocal() as db:
+        user = (await db.execute(select(User).where(User.id == user_id))).scalars().first()
+        token = None
+        if user:
+            token = (await db.execute(select(Token).where(
+                Token.user_id == user.id, Token.token_authenticator == "google"
+            ))).scalars().first()
+    if not token or not token.refresh_token:
+        raise HTTPException(status_code=401, detail="Invalid user or no refresh token")
+
+    # Get new Google tokens
+    new_tokens = await refresh_google_token(token.refresh_token)
+
+    # Update user's tokens (Google usually omits the refresh token on refresh)
+    values = {"access_token": new_tokens["access_token"], "expires_at": google_token_expiry(new_tokens)}
+    if new_tokens.get("refresh_token"):
+        values["refresh_token"] = new_tokens["refresh_token"]
+    async with AsyncWriteSessionLocal() as db:
+        await db.execute(update(Token).where(Token.id == token.id).values(**values))
+        await db.commit()
+
+    # Create new session token
+    session_token = create_session_token(str(user.id))
+
+    return {
+        "session_token": session_token,
+        "user": UserService._load_from_model(user).to_dict()
+    }
+
 @router.post("/refresh")
-def refresh_session(expired_token: str, db: Session = Depends(get_db)):
-    """Refresh session using stored Google refresh token"""
+async def refresh_session(expired_token: str):
+    """
+    Refresh session using stored Google refresh token.
+    Concurrent refreshes for the same user (several tabs, reconnecting websockets) share
+    one Google exchange and one DB write, and all of them get the same response.
+    """
     try:
         # Decode expired token without verification
         payload = jwt.decode(
@@ -197,29 +214,12 @@ def refresh_session(expired_token: str, db: Session = Depends(get_db)):
             algorithms=[JWT_ALGORITHM],
             options={"verify_exp": False}
         )
-        
-        user_id = payload.get("user_id")
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Invalid token format")
-
-        # Get user and check refresh token
-        user = UserDB(db).get_by_id(user_id)
-        if not user or not user.google_refresh_token:
-            raise HTTPException(status_code=401, detail="Invalid user or no refresh token")
-
-        # Get new Google tokens
-        new_tokens = refresh_google_token(user.google_refresh_token)
-        
-        # Update user's tokens
-        user.update_tokens(new_tokens)
-        
-        # Create new session token
-        session_token = create_session_token(user.id)
-        
-        return {
-            "session_token": session_token,
-            "user": user.to_dict()
-        }
-
     except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token format")
\ No newline at end of file
+        raise HTTPException(status_code=401, detail="Invalid token format")
+
+    try:
+        user_id = int(payload.get("user_id"))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=401, detail="Invalid token format")
+
+    return await refresh_flights.do(str(user_id), refresh_user_session, user_id)
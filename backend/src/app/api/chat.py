@@ -1,46 +1,515 @@
-from fastapi import APIRouter, Depends, HTTPException, WebSocket
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import select
 import asyncio
+import json
+import uuid
 
-from app.db.database import get_db
-from app.agents.react_agent import LangGraphAgent 
-from app.core.dependencies import get_current_user
-from langgraph_sdk import get_client
-from app.core.config import (LANGGRAPH_SERVER)
+from app.db.database import AsyncSessionLocal, AsyncWriteSessionLocal
+from app.db.models import Thread
+from app.agents.react_agent import LangGraphAgent
+from app.core.dependencies import get_current_user, get_current_http_user
+from app.core.langgraph_client import get_langgraph_client
+from app.core.transcript_writer import transcript_writer
+from app.core.coalescer import ChunkCoalescer
+from app.core.framing import frame_codec
+from app.core.replay import ReplayBuffer, replay_store, utf16_length
+from app.core.config import (
+    LANGGRAPH_ASSISTANT_ID,
+    CHAT_OUTBOUND_QUEUE_SIZE,
+    CHAT_MAX_STREAMS,
+    CHAT_SSE_KEEPALIVE_SECONDS,
+    CHAT_RESUME_GRACE_SECONDS,
+)
+from app.models.UserService import UserService
+from app.models.schemas import ChatRequest
 from langchain_core.messages import HumanMessage
 
 
 router = APIRouter()
 react_agent = LangGraphAgent()
 
-async def stream_response(user_input: str):
-    """Stream response from LangGraph agent."""
-    # Replace this with the URL of your own deployed graph
-    client = get_client(url=LANGGRAPH_SERVER)
+async def get_or_create_thread(user_id: int, thread_id: int = None) -> Thread:
+    """
+    Conversation thread for a chat session.
+    - With `thread_id`, continue that conversation (it must belong to the user)
+    - Otherwise start a new one
+    The LangGraph thread id is generated here and the thread is created on the server
+    by the first run (if_not_exists="create"), so no extra round trip is needed.
+    """
+    thread = None
+    if thread_id is not None:
+        async with AsyncSessionLocal() as db:
+            thread = (await db.execute(
+                select(Thread).where(Thread.id == thread_id, Thread.user_id == user_id)
+            )).scalars().first()
+        if thread is None:
+            raise HTTPException(status_code=404, detail="Thread not found")
+        if thread.langgraph_thread_id:
+            return thread
+
+    async with AsyncWriteSessionLocal() as db:
+        if thread is None:
+            thread = Thread(user_id=user_id)
+            db.add(thread)
+        else:
+            thread = await db.merge(thread)
+        thread.langgraph_thread_id = str(uuid.uuid4())
+        await db.commit()
+    return thread
+
+class ChatRun:
+    """One agent run streaming its answer to a chat client"""
+
+    def __init__(self, thread_id: str, stream_id=None, outbound: asyncio.Queue = None):
+        self.id = uuid.uuid4().hex  # what clients resume by
+        self.thread_id = thread_id
+        self.stream_id = stream_id  # client's stream id on a multiplexed connection
+        self.outbound = outbound  # connection queue the answer goes to; None while detached
+        self.replay: ReplayBuffer = None  # set for resumable runs
+        self.thread: Thread = None
+        self.run_id = None  # LangGraph's run id, known once the server reports the run's metadata
+        self.task: asyncio.Task = None
+        self.abandon: asyncio.Task = None  # cancels the run unless a client resumes it
+        self.cancelled = False
+        # Orders chunks against a client resuming the run
+        self.lock = asyncio.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+class ChatStream:
+    """A conversation carried on a multiplexed connection"""
+
+    def __init__(self, stream_id):
+        self.stream_id = stream_id
+        self.thread: Thread = None
+        self.run: ChatRun = None
+
+async def cancel_run(run: ChatRun) -> bool:
+    """Stop a run locally and on the LangGraph server so it stops spending tokens"""
+    if run is None or not run.active:
+        return False
+    run.cancelled = True
+    run.task.cancel()
+    if run.run_id:
+        try:
+            await get_langgraph_client().runs.cancel(run.thread_id, run.run_id)
+        except Exception as e:
+            print(f"Failed to cancel run {run.run_id}: {e}")
+    # Let the run record its partial answer before anything else reaches the transcript
+    await asyncio.gather(run.task, return_exceptions=True)
+    return True
+
+async def emit(run: ChatRun, item):
+    """Record a chunk or event of a run and pass it to the connection it is attached to"""
+    async with run.lock:
+        if run.replay is not None:
+            run.replay.add(item)
+        if run.outbound is not None:
+            # Waits while the client is slow to read, which in turn slows the upstream stream
+            await run.outbound.put((run, item))
+
+async def cancel_and_notify(run: ChatRun):
+    """Cancel a run and tell the client, after the chunks it already has queued"""
+    if await cancel_run(run):
+        await emit(run, {"type": "cancelled"})
+
+def make_resumable(run: ChatRun, thread: Thread, user_id: int) -> ChatRun:
+    run.thread = thread
+    run.replay = replay_store.add(ReplayBuffer(run.id, user_id, owner=run))
+    return run
+
+def detach_runs(runs, outbound: asyncio.Queue):
+    """
+    Let a closing connection's runs finish without it, so their clients can resume them.
+    Runs meanwhile attached to another connection are left alone.
+    """
+    for run in runs:
+        if run is not None and run.outbound is outbound:
+            run.outbound = None
+    # Nobody reads the queue anymore: release runs waiting to put on it
+    while not outbound.empty():
+        outbound.get_nowait()
+
+def abandon_run(run: ChatRun, outbound: asyncio.Queue, grace: float = None):
+    """
+    Detach the run of a client that went away, and cancel it unless a client
+    resumes it within `grace` seconds
+    """
+    if run is None:
+        return
+    detach_runs([run], outbound)
+    if run.active and run.outbound is None:
+        run.abandon = asyncio.create_task(cancel_if_detached(
+            run, CHAT_RESUME_GRACE_SECONDS if grace is None else grace
+        ))
+
+async def cancel_if_detached(run: ChatRun, grace: float):
+    await asyncio.sleep(grace)
+    if run.outbound is None:
+        await cancel_run(run)
+
+async def resume_run(run: ChatRun, stream_id, offset: int, outbound: asyncio.Queue):
+    """Send a run's answer from `offset` (UTF-16 code units) on, then attach it to this connection"""
+    async with run.lock:
+        if run.abandon is not None:
+            run.abandon.cancel()
+            run.abandon = None
+        run.stream_id = stream_id
+        await outbound.put((run, {
+            "type": "resumed", "run": run.id, "thread_id": run.thread.id, "offset": offset,
+        }))
+        tail = run.replay.text_from(offset)
+        if tail:
+            await outbound.put((run, tail))
+        if run.replay.final is not None:
+            await outbound.put((run, run.replay.final))
+        else:
+            run.outbound = outbound
+
+async def cancel_detached_runs():
+    """At shutdown: stop runs still going with no client attached"""
+    await asyncio.gather(*(
+        cancel_run(buffer.owner) for buffer in replay_store.buffers() if buffer.owner.outbound is None
+    ))
+
+def latest_run(user_id: int, thread_id: int) -> ChatRun:
+    """The most recently written answer on a thread that can still be resumed"""
+    for buffer in reversed(replay_store.buffers()):
+        run = buffer.owner
+        if run.thread is not None and run.thread.id == thread_id and replay_store.get(run.id, user_id) is buffer:
+            return run
+    return None
+
+def is_cancel_frame(data: str) -> bool:
+    """Clients cancel the answer in progress by sending {"type": "cancel"}"""
+    if not data.startswith("{"):
+        return False
+    try:
+        return json.loads(data).get("type") == "cancel"
+    except (ValueError, AttributeError):
+        return False
+
+async def stream_response(user_input: str, thread_id: str, user_id: str, run: ChatRun = None):
+    """Stream response from LangGraph agent on an existing conversation thread."""
+    client = get_langgraph_client()
     input_message = HumanMessage(content=user_input)
-    thread = await client.threads.create()
-    # Start conversation with the initial message
-    async for event in client.runs.stream(thread["thread_id"], 
-                                        assistant_id="agent", 
-                                        input={"messages": [input_message],"user_id":"1"}, 
-                                        stream_mode="messages-tuple"):
-        if event.event == 'messages':
+    # Continue the conversation on the thread (created on first use). A run still going on
+    # the thread is interrupted: the new message supersedes it.
+    async for event in client.runs.stream(thread_id,
+                                        assistant_id=LANGGRAPH_ASSISTANT_ID,
+                                        input={"messages": [input_message],"user_id":str(user_id)},
+                                        stream_mode="messages-tuple",
+                                        if_not_exists="create",
+                                        multitask_strategy="interrupt"):
+        if event.event == 'metadata' and run is not None:
+            run.run_id = event.data.get("run_id")
+        elif event.event == 'messages':
             yield event.data[0]["content"]
 
+async def run_agent(run: ChatRun, user_input: str, thread: Thread, user_id: int):
+    """Stream one answer into the run's connection queue and record it in the transcript"""
+    reply = []
+    try:
+        async for response in stream_response(user_input, thread.langgraph_thread_id, user_id, run):
+            reply.append(response)
+            await emit(run, response)
+        await emit(run, {"type": "done"})
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"Error: {e}")
+        await emit(run, {"type": "error", "detail": "The agent failed to answer"})
+    finally:
+        # Keep what the user actually saw, even for a cancelled answer
+        if reply:
+            await transcript_writer.add(thread.id, "assistant", "".join(reply))
+
+async def send_outbound(websocket: WebSocket, outbound: asyncio.Queue, coalescer: ChunkCoalescer = None, codec=None):
+    """
+    Forward queued chunks to the client in coalesced frames, skipping those of cancelled runs.
+    Without a codec chunks are sent as plain text and events are dropped; with one every
+    chunk and event is a frame tagged with its stream id.
+    """
+    coalescer = coalescer or ChunkCoalescer()
+    async for run, item in coalescer.frames_from(outbound):
+        if isinstance(item, str):
+            if run.cancelled:
+                continue
+            if codec is None:
+                await websocket.send_text(item)  # Send each frame back to the client
+                continue
+            item = {"type": "chunk", "content": item}
+        if codec is not None:
+            await codec.send(websocket, {"stream": run.stream_id, **item})
+
 @router.websocket("/ws")
-async def chat_websocket(websocket: WebSocket):
-    """WebSocket endpoint for users to interact with the LangGraph agent."""
-    await websocket.accept()
+async def chat_websocket(websocket: WebSocket, thread_id: int = None, offset: int = None, protocol: str = None,
+                         user: UserService = Depends(get_current_user)):
+    """
+    WebSocket endpoint for users to interact with the LangGraph agent.
+
+    Without `?protocol=`, every text message on the connection goes to one conversation
+    thread (pass `?thread_id=` to continue an earlier one) and the answer comes back as
+    plain text. A new message cancels the answer still streaming, and {"type": "cancel"}
+    cancels it without sending a new one. A client whose connection dropped reconnects
+    with `?thread_id=` and `?offset=`, the length of the answer it had received in UTF-16
+    code units: the thread's last answer is sent from there on, without a new run.
+    An answer whose connection drops is aborted, unless CHAT_RESUME_GRACE_SECONDS keeps
+    it running that long for the client to come back; finished answers can always be resumed.
+
+    With `?protocol=json` or `?protocol=msgpack`, the connection carries several
+    conversations at once; see `multiplexed_chat`.
+    """
+    # get_current_user has already accepted the connection
+    if protocol is None:
+        await plain_chat(websocket, user, thread_id, offset)
+        return
+    try:
+        codec = frame_codec(protocol)
+    except ValueError as e:
+        await websocket.close(code=1003, reason=str(e))
+        return
+    await multiplexed_chat(websocket, user, codec)
+
+async def plain_chat(websocket: WebSocket, user: UserService, thread_id: int = None, offset: int = None):
+    """One conversation per connection, answers streamed as plain text"""
+    outbound = asyncio.Queue(maxsize=CHAT_OUTBOUND_QUEUE_SIZE)
+    sender = asyncio.create_task(send_outbound(websocket, outbound))
+    thread = None
+    run = None
     try:
+        if thread_id is not None and offset is not None:
+            thread = await get_or_create_thread(user.id, thread_id)
+            run = latest_run(user.id, thread.id)
+            if run is not None:
+                await resume_run(run, None, offset, outbound)
         while True:
             # Receive a message from the WebSocket
             data = await websocket.receive_text()
             print(data)
+            if is_cancel_frame(data):
+                await cancel_and_notify(run)
+                continue
+            if thread is None:
+                thread = await get_or_create_thread(user.id, thread_id)
+            await cancel_and_notify(run)
+            await transcript_writer.add(thread.id, "user", data)
             # Stream the response from the LangGraph agent
-            async for response in stream_response(user_input=data):
-                await websocket.send_text(response)  # Send each chunk back to the client
+            run = make_resumable(ChatRun(thread.langgraph_thread_id, outbound=outbound), thread, user.id)
+            run.task = asyncio.create_task(run_agent(run, data, thread, user.id))
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"Error: {e}")
+    finally:
+        # Aborts the answer, or with a grace period lets it carry on in case the client comes back
+        abandon_run(run, outbound)
+        sender.cancel()
+        try:
+            await websocket.close()
+        except RuntimeError:
+            pass  # already closed by the client
+
+async def multiplexed_chat(websocket: WebSocket, user: UserService, codec):
+    """
+    Several conversations over one connection. Every frame carries a client-chosen `stream` id.
+
+    Client frames:
+        {"type": "message", "stream": s, "content": text, "thread_id": optional}
+            Send a message on stream s. The first message of a stream starts a new thread,
+            or continues `thread_id`. A message cancels the answer still streaming on s.
+        {"type": "cancel", "stream": s}    cancel the answer streaming on s
+        {"type": "close", "stream": s}     cancel it and forget stream s
+        {"type": "resume", "stream": s, "run": r, "offset": n}
+            Continue answer r (e.g. after a dropped connection) on stream s, n UTF-16
+            code units into its text (JavaScript string length, not code points).
+            Later messages on s continue r's thread.
+
+    Server frames:
+        {"type": "start", "stream": s, "thread_id": id, "run": r}    an answer begins
+        {"type": "resumed", "stream": s, "thread_id": id, "run": r, "offset": n}
+        {"type": "chunk", "stream": s, "content": text}    part of the answer
+        {"type": "done" | "cancelled", "stream": s}        the answer ended
+        {"type": "error", "stream": s, "detail": text}     s is None for connection-level errors
+
+    Answers in progress when the connection drops keep running and are kept in memory
+    for a while (see `replay_store`) so they can be resumed without a new run.
+    """
+    outbound = asyncio.Queue(maxsize=CHAT_OUTBOUND_QUEUE_SIZE)
+    sender = asyncio.create_task(send_outbound(websocket, outbound, codec=codec))
+    connection = ChatRun(None)  # key for events that belong to no stream
+    streams = {}
+
+    async def error(stream_id, detail):
+        await outbound.put((ChatRun(None, stream_id) if stream_id is not None else connection,
+                            {"type": "error", "detail": detail}))
+
+    try:
+        while True:
+            try:
+                frame = await codec.receive(websocket)
+            except ValueError:
+                await error(None, "Invalid frame")
+                continue
+            if not isinstance(frame, dict) or frame.get("type") not in ("message", "cancel", "close", "resume"):
+                await error(None, "Invalid frame")
+                continue
+            stream_id = frame.get("stream")
+            if not isinstance(stream_id, (str, int)):
+                await error(None, "Frame without a stream id")
+                continue
+            stream = streams.get(stream_id)
+
+            if frame["type"] == "cancel":
+                if stream is not None:
+                    await cancel_and_notify(stream.run)
+                continue
+            if frame["type"] == "close":
+                if stream is not None:
+                    await cancel_and_notify(stream.run)
+                    del streams[stream_id]
+                continue
+            if frame["type"] == "resume":
+                buffer = replay_store.get(frame.get("run"), user.id)
+                if buffer is None:
+                    # Gone or never ours: the client has to send its message again
+                    await error(stream_id, "Run not found or expired")
+                    continue
+                if stream is None and len(streams) >= CHAT_MAX_STREAMS:
+                    await error(stream_id, "Too many open streams")
+                    continue
+                if stream is not None and stream.run is not buffer.owner:
+                    await cancel_and_notify(stream.run)
+                offset = frame.get("offset")
+                stream = streams[stream_id] = ChatStream(stream_id)
+                stream.run = buffer.owner
+                stream.thread = stream.run.thread
+                await resume_run(stream.run, stream_id, offset if isinstance(offset, int) else 0, outbound)
+                continue
+
+            content = frame.get("content")
+            if not isinstance(content, str):
+                await error(stream_id, "Message without content")
+                continue
+            if stream is None:
+                if len(streams) >= CHAT_MAX_STREAMS:
+                    await error(stream_id, "Too many open streams")
+                    continue
+                stream = ChatStream(stream_id)
+                try:
+                    stream.thread = await get_or_create_thread(user.id, frame.get("thread_id"))
+                except HTTPException as e:
+                    await error(stream_id, e.detail)
+                    continue
+                streams[stream_id] = stream
+            await cancel_and_notify(stream.run)
+            await transcript_writer.add(stream.thread.id, "user", content)
+            run = stream.run = make_resumable(
+                ChatRun(stream.thread.langgraph_thread_id, stream_id, outbound), stream.thread, user.id
+            )
+            await outbound.put((run, {"type": "start", "thread_id": stream.thread.id, "run": run.id}))
+            run.task = asyncio.create_task(run_agent(run, content, stream.thread, user.id))
+    except WebSocketDisconnect:
+        pass
     except Exception as e:
         print(f"Error: {e}")
     finally:
-        await websocket.close()
\ No newline at end of file
+        # Answers still streaming carry on for a client that comes back
+        detach_runs([stream.run for stream in streams.values()], outbound)
+        sender.cancel()
+        try:
+            await websocket.close()
+        except RuntimeError:
+            pass  # already closed by the client
+
+def sse_event(event: str, data: dict, id: int = None) -> str:
+    field = f"id: {id}\n" if id is not None else ""
+    return f"{field}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def send_keepalives(run: ChatRun, outbound: asyncio.Queue, interval: float):
+    """Queue a keep-alive marker every `interval` seconds unless data is already waiting"""
+    while True:
+        await asyncio.sleep(interval)
+        if outbound.empty():
+            await outbound.put((run, {"type": "keepalive"}))
+
+async def sse_events(request: Request, run: ChatRun, outbound: asyncio.Queue, offset: int = 0):
+    """
+    A run's queued chunks and events as Server-Sent Events. Every chunk's id is the
+    length of the answer so far in UTF-16 code units, the offset to resume from.
+    """
+    keepalive = asyncio.create_task(send_keepalives(run, outbound, CHAT_SSE_KEEPALIVE_SECONDS))
+    try:
+        async for _, item in ChunkCoalescer().frames_from(outbound):
+            if isinstance(item, str):
+                offset += utf16_length(item)
+                yield sse_event("chunk", {"content": item}, id=offset)
+            elif item["type"] == "keepalive":
+                # Idle: a good moment to notice a client that went away without us writing to it
+                if await request.is_disconnected():
+                    break
+                yield ": keep-alive\n\n"
+            else:
+                yield sse_event(item["type"], {k: v for k, v in item.items() if k != "type"})
+                if item["type"] != "resumed":
+                    break
+    finally:
+        keepalive.cancel()
+        # Runs when the client disconnects too: the answer is aborted, or carries on for the grace period
+        abandon_run(run, outbound)
+
+async def sse_stream(request: Request, run: ChatRun, thread: Thread, user_id: int, message: str):
+    """Server-Sent Events for one answer: start, chunk..., then done or error"""
+    make_resumable(run, thread, user_id)
+    outbound = run.outbound = asyncio.Queue(maxsize=CHAT_OUTBOUND_QUEUE_SIZE)
+    run.task = asyncio.create_task(run_agent(run, message, thread, user_id))
+    yield sse_event("start", {"thread_id": thread.id, "run": run.id})
+    async for event in sse_events(request, run, outbound):
+        yield event
+
+async def sse_resume(request: Request, run: ChatRun, offset: int):
+    """Server-Sent Events continuing an answer: resumed, chunk..., then done or error"""
+    outbound = asyncio.Queue(maxsize=CHAT_OUTBOUND_QUEUE_SIZE)
+    await resume_run(run, None, offset, outbound)
+    async for event in sse_events(request, run, outbound, offset):
+        yield event
+
+def sse_response(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        # No caching, and no response buffering in proxies (nginx) so every event is flushed
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/stream")
+async def chat_stream(body: ChatRequest, request: Request, user: UserService = Depends(get_current_http_user)):
+    """
+    Stream one answer from the LangGraph agent as Server-Sent Events.
+    Pass `thread_id` to continue a conversation; the `start` event names the thread used
+    and the run, which GET /chat/stream/{run} resumes. A run whose client disconnects
+    is aborted, at once unless CHAT_RESUME_GRACE_SECONDS is set and then if it is not
+    resumed within that time.
+    """
+    thread = await get_or_create_thread(user.id, body.thread_id)
+    await transcript_writer.add(thread.id, "user", body.message)
+    run = ChatRun(thread.langgraph_thread_id)
+    return sse_response(sse_stream(request, run, thread, user.id, body.message))
+
+@router.get("/stream/{run_id}")
+async def resume_chat_stream(run_id: str, request: Request, offset: int = None,
+                             last_event_id: str = Header(None),
+                             user: UserService = Depends(get_current_http_user)):
+    """
+    Resume an answer streamed by POST /chat/stream, from `offset` or else from the
+    `Last-Event-ID` header: the id of the last chunk received.
+    """
+    buffer = replay_store.get(run_id, user.id)
+    if buffer is None:
+        raise HTTPException(status_code=404, detail="Run not found or expired")
+    if offset is None:
+        offset = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+    return sse_response(sse_resume(request, buffer.owner, offset))
@@ -0,0 +1,78 @@
+import asyncio
+from typing import AsyncIterator, Hashable, Tuple
+
+from app.core.config import CHAT_COALESCE_WINDOW_SECONDS, CHAT_COALESCE_MAX_BYTES
+
+class ChunkCoalescer:
+    """
+    Batches streamed tokens into fewer, larger frames.
+
+    Reads `(key, item)` pairs from a queue, where `key` identifies the stream
+    (run) an item belongs to and `item` is either a token (str) or an event
+    (any other object, e.g. a "done" dict). The first token of each stream is
+    passed through at once so time-to-first-token is unaffected; later tokens
+    are joined per stream for up to `window` seconds or `max_bytes` bytes,
+    whichever comes first. Events are passed through on their own, after the
+    tokens queued before them, and end the stream: its next token is again
+    sent at once.
+    """
+
+    def __init__(self, window: float = CHAT_COALESCE_WINDOW_SECONDS, max_bytes: int = CHAT_COALESCE_MAX_BYTES):
+        self.window = window
+        self.max_bytes = max_bytes
+        self.chunks = 0
+        self.frames = 0
+        self._started = set()  # streams whose first token has been sent
+
+    async def frames_from(self, queue: asyncio.Queue) -> AsyncIterator[Tuple[Hashable, object]]:
+        loop = asyncio.get_running_loop()
+        carried = None  # item read while filling frames that has to go out after them
+        while True:
+            if carried is not None:
+                key, item = carried
+                carried = None
+            else:
+                key, item = await queue.get()
+            if not isinstance(item, str):
+                self._started.discard(key)
+                self.frames += 1
+                yield key, item
+                continue
+            self.chunks += 1
+            if key not in self._started or self.window <= 0:
+                self._started.add(key)
+                self.frames += 1
+                yield key, item
+                continue
+
+            # Fill frames for every started stream until the window closes or one of them is full
+            parts = {key: [item]}
+            sizes = {key: len(item.encode())}
+            deadline = loop.time() + self.window
+            while sizes[key] < self.max_bytes:
+                if queue.empty():
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    # Let the producers run for the rest of the window, then take what they queued
+                    await asyncio.sleep(remaining)
+                    continue
+                next_key, next_item = queue.get_nowait()
+                if not isinstance(next_item, str) or next_key not in self._started:
+                    carried = (next_key, next_item)
+                    break
+                self.chunks += 1
+                parts.setdefault(next_key, []).append(next_item)
+                sizes[next_key] = sizes.get(next_key, 0) + len(next_item.encode())
+                if sizes[next_key] >= self.max_bytes:
+                    break
+            for frame_key, frame_parts in parts.items():
+                self.frames += 1
+                yield frame_key, "".join(frame_parts)
+
+    def stats(self) -> dict:
+        return {
+            "chunks": self.chunks,
+            "frames": self.frames,
+            "chunks_per_frame": self.chunks / self.frames if self.frames else 0.0,
+        }
@@ -28,6 +28,17 @@ GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID", "your_google_client_id")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET", "your_google_client_secret")
 GOOGLE_REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI", "your_redirect_uri")
 GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
+GOOGLE_USERINFO_URL = "https://www.googleapis.com/oauth2/v1/userinfo"
+# Lifetime assumed for a Google access token whose response has no `expires_in`
+GOOGLE_TOKEN_DEFAULT_EXPIRES_SECONDS = int(os.getenv("GOOGLE_TOKEN_DEFAULT_EXPIRES_SECONDS", 3600))
+
+# Outbound HTTP client (shared, pooled)
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5.0))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 10.0))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", 5.0))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30.0))
 
 # JWT configuration
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your_secret_key_here")
@@ -35,8 +46,61 @@ JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 JWT_ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRE_MINUTES", 60))
 JWT_REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("JWT_REFRESH_TOKEN_EXPIRE_DAYS", 7))
 
+# Verified session token / user principal caches used by get_current_user
+SESSION_TOKEN_CACHE_SIZE = int(os.getenv("SESSION_TOKEN_CACHE_SIZE", 10000))
+SESSION_TOKEN_CACHE_TTL_SECONDS = float(os.getenv("SESSION_TOKEN_CACHE_TTL_SECONDS", 3600))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", 300))
+
+# Background refresh of stored Google access tokens
+TOKEN_REFRESH_ENABLED = os.getenv("TOKEN_REFRESH_ENABLED", "true").lower() == "true"
+TOKEN_REFRESH_INTERVAL_SECONDS = float(os.getenv("TOKEN_REFRESH_INTERVAL_SECONDS", 60))
+TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", 300))
+TOKEN_REFRESH_BATCH_SIZE = int(os.getenv("TOKEN_REFRESH_BATCH_SIZE", 100))
+TOKEN_REFRESH_CONCURRENCY = int(os.getenv("TOKEN_REFRESH_CONCURRENCY", 10))
+TOKEN_REFRESH_RETRY_SECONDS = int(os.getenv("TOKEN_REFRESH_RETRY_SECONDS", 300))
+
 #LangGraph Server
 LANGGRAPH_SERVER= os.getenv("LANGGRAPH_SERVER","your_langgraph_server")
+LANGGRAPH_ASSISTANT_ID = os.getenv("LANGGRAPH_ASSISTANT_ID", "agent")
+
+# Chat websocket: chunks buffered per connection before the sender applies backpressure
+CHAT_OUTBOUND_QUEUE_SIZE = int(os.getenv("CHAT_OUTBOUND_QUEUE_SIZE", 64))
+# Tokens are batched into frames for up to this long (0 sends one frame per token) ...
+CHAT_COALESCE_WINDOW_SECONDS = float(os.getenv("CHAT_COALESCE_WINDOW_SECONDS", 0.025))
+# ... or until a frame reaches this many bytes
+CHAT_COALESCE_MAX_BYTES = int(os.getenv("CHAT_COALESCE_MAX_BYTES", 4096))
+# Conversations one multiplexed chat connection may carry at once
+CHAT_MAX_STREAMS = int(os.getenv("CHAT_MAX_STREAMS", 16))
+# Idle seconds before POST /chat/stream sends an SSE keep-alive comment
+CHAT_SSE_KEEPALIVE_SECONDS = float(os.getenv("CHAT_SSE_KEEPALIVE_SECONDS", 15))
+# Resumable answers are kept this long after their last chunk ...
+CHAT_REPLAY_MAX_AGE_SECONDS = float(os.getenv("CHAT_REPLAY_MAX_AGE_SECONDS", 600))
+# ... and within this much memory in total
+CHAT_REPLAY_MAX_BYTES = int(os.getenv("CHAT_REPLAY_MAX_BYTES", 64 * 1024 * 1024))
+# Answers on plain websocket and SSE connections that drop are aborted at once; set this to keep them
+# running (and spending tokens) this long for the client to resume
+CHAT_RESUME_GRACE_SECONDS = float(os.getenv("CHAT_RESUME_GRACE_SECONDS", 0))
+
+# Write-behind persistence of chat transcripts
+TRANSCRIPT_BATCH_SIZE = int(os.getenv("TRANSCRIPT_BATCH_SIZE", 100))
+TRANSCRIPT_FLUSH_INTERVAL_SECONDS = float(os.getenv("TRANSCRIPT_FLUSH_INTERVAL_SECONDS", 1.0))
+TRANSCRIPT_MAX_PENDING = int(os.getenv("TRANSCRIPT_MAX_PENDING", 10000))
+TRANSCRIPT_FLUSH_RETRIES = int(os.getenv("TRANSCRIPT_FLUSH_RETRIES", 3))
+TRANSCRIPT_STOP_TIMEOUT_SECONDS = float(os.getenv("TRANSCRIPT_STOP_TIMEOUT_SECONDS", 30))
 
 #SQLALCHEMY Database
-SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app.db")
\ No newline at end of file
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app.db")
+
+# Connection pool (applies to both the sync and the async engine)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+
+# SQLite production profile: WAL + pragmas on every connection and a single serialized writer
+SQLITE_PRODUCTION_MODE = os.getenv("SQLITE_PRODUCTION_MODE", "true").lower() == "true"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", -64000))  # negative = KiB
\ No newline at end of file
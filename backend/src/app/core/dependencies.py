@@ -1,40 +1,107 @@
-from fastapi import Depends, HTTPException, WebSocket
-from sqlalchemy.orm import Session
+from datetime import datetime, timezone
+
+from fastapi import HTTPException, Request, WebSocket
+from sqlalchemy import event, select
 import jwt
 
-from app.db.database import get_db
+from app.db.database import AsyncSessionLocal
+from app.db.models import User
 from app.models.UserService import UserService
-from app.core.config import JWT_SECRET_KEY, JWT_ALGORITHM
+from app.core.cache import TTLCache
+from app.core.singleflight import SingleFlight
+from app.core.config import (
+    JWT_SECRET_KEY,
+    JWT_ALGORITHM,
+    SESSION_TOKEN_CACHE_SIZE,
+    SESSION_TOKEN_CACHE_TTL_SECONDS,
+    USER_CACHE_SIZE,
+    USER_CACHE_TTL_SECONDS,
+)
 
-async def get_current_user(websocket: WebSocket, db: Session = Depends(get_db)) -> UserService:
-    """Dependency to get the current user from the session token in WebSocket headers."""
-    # Accept the WebSocket connection
-    await websocket.accept()
+# Verified session token -> user id. Entries never outlive the token's `exp`.
+session_token_cache = TTLCache(maxsize=SESSION_TOKEN_CACHE_SIZE, ttl=SESSION_TOKEN_CACHE_TTL_SECONDS)
+# User id -> UserService principal. Dropped whenever the user row changes.
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+# Concurrent cache misses for the same user share one query
+_user_loads = SingleFlight()
 
-    # Extract the token from the headers
-    token = websocket.headers.get("Authorization")  # Expecting "Bearer YOUR_TOKEN"
+def invalidate_user(user_id):
+    """Forget the cached principal for a user. Call after writing to the users row."""
+    user_cache.pop(int(user_id))
 
-    if not token or not token.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Token not provided")
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target):
+    invalidate_user(target.id)
 
-    token = token.split(" ")[1]  # Extract the token part
+def cache_stats() -> dict:
+    return {
+        "session_tokens": session_token_cache.stats(),
+        "users": user_cache.stats(),
+    }
+
+def verify_session_token(token: str) -> int:
+    """Return the user id of a valid session token, verifying each token's signature only once"""
+    user_id = session_token_cache.get(token)
+    if user_id is not None:
+        return user_id
 
     try:
         # Decode the token to get the user ID
         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        user_id = payload.get("user_id")
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token has expired")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token")
 
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
+    user_id = payload.get("user_id")
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    user_id = int(user_id)
 
-        # Retrieve the user from the database
-        user = db.query(UserService).filter(UserService.id == user_id).first()
-        if user is None:
-            raise HTTPException(status_code=404, detail="User not found")
+    ttl = None
+    if "exp" in payload:
+        ttl = payload["exp"] - datetime.now(tz=timezone.utc).timestamp()
+    session_token_cache.set(token, user_id, ttl=ttl)
+    return user_id
 
-        return user
+async def _load_user(user_id: int) -> UserService:
+    # Retrieve the user from the database, on a session of its own: the load is shared by
+    # every request waiting for this user, and must not end with the first one's session
+    async with AsyncSessionLocal() as db:
+        user = (await db.execute(select(User).where(User.id == user_id))).scalars().first()
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    principal = UserService._load_from_model(user)
+    user_cache.set(user_id, principal)
+    return principal
 
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token has expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
\ No newline at end of file
+async def get_user_for_token(token: str) -> UserService:
+    """Resolve a session token to its user, from cache when possible"""
+    user_id = verify_session_token(token)
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await _user_loads.do(user_id, _load_user, user_id)
+    return user
+
+def bearer_token(authorization: str) -> str:
+    """Session token from an Authorization header ("Bearer YOUR_TOKEN")"""
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Token not provided")
+    return authorization.split(" ")[1]  # Extract the token part
+
+async def get_current_user(websocket: WebSocket) -> UserService:
+    """Dependency to get the current user from the session token in WebSocket headers."""
+    # Accept the WebSocket connection
+    await websocket.accept()
+
+    # Extract the token from the headers
+    token = bearer_token(websocket.headers.get("Authorization"))
+
+    # The session used on a cache miss is closed before returning, so none is held
+    # for the lifetime of the websocket, which may stay open for hours
+    return await get_user_for_token(token)
+
+async def get_current_http_user(request: Request) -> UserService:
+    """Dependency to get the current user from the session token of an HTTP request."""
+    return await get_user_for_token(bearer_token(request.headers.get("Authorization")))
@@ -0,0 +1,48 @@
+import json
+
+from fastapi import WebSocket
+
+try:
+    import ormsgpack
+except ImportError:  # msgpack framing is optional
+    ormsgpack = None
+
+class JsonFrames:
+    """One JSON object per text frame"""
+
+    name = "json"
+
+    async def send(self, websocket: WebSocket, frame: dict):
+        await websocket.send_text(json.dumps(frame))
+
+    async def receive(self, websocket: WebSocket) -> dict:
+        try:
+            text = await websocket.receive_text()
+        except KeyError:  # a binary frame
+            raise ValueError("Expected a text frame") from None
+        return json.loads(text)
+
+class MsgpackFrames:
+    """One msgpack map per binary frame"""
+
+    name = "msgpack"
+
+    async def send(self, websocket: WebSocket, frame: dict):
+        await websocket.send_bytes(ormsgpack.packb(frame))
+
+    async def receive(self, websocket: WebSocket) -> dict:
+        try:
+            data = await websocket.receive_bytes()
+        except KeyError:  # a text frame
+            raise ValueError("Expected a binary frame") from None
+        return ormsgpack.unpackb(data)
+
+def frame_codec(protocol: str):
+    """Codec for a `?protocol=` value. Raises ValueError if it is unknown or unavailable."""
+    if protocol == JsonFrames.name:
+        return JsonFrames()
+    if protocol == MsgpackFrames.name:
+        if ormsgpack is None:
+            raise ValueError("msgpack framing needs the ormsgpack package")
+        return MsgpackFrames()
+    raise ValueError(f"Unknown chat protocol: {protocol}")
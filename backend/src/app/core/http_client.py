@@ -0,0 +1,61 @@
+import httpx
+
+from app.core.config import (
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    HTTP_POOL_TIMEOUT,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY,
+)
+
+# Shared client for outbound calls (Google OAuth, userinfo, ...).
+# Created in the app lifespan so every request reuses the same connection pool.
+_client: httpx.AsyncClient = None
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (pip install httpx[http2])"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def create_http_client(**kwargs) -> httpx.AsyncClient:
+    """Build an AsyncClient with keep-alive pooling and the configured timeouts"""
+    timeout = httpx.Timeout(
+        connect=HTTP_CONNECT_TIMEOUT,
+        read=HTTP_READ_TIMEOUT,
+        write=HTTP_READ_TIMEOUT,
+        pool=HTTP_POOL_TIMEOUT,
+    )
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    kwargs.setdefault("timeout", timeout)
+    kwargs.setdefault("limits", limits)
+    kwargs.setdefault("http2", _http2_available())
+    return httpx.AsyncClient(**kwargs)
+
+async def init_http_client(**kwargs) -> httpx.AsyncClient:
+    """Open the shared client. Called from the app lifespan on startup."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client(**kwargs)
+    return _client
+
+async def close_http_client():
+    """Close the shared client and release pooled connections. Called on shutdown."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it lazily when used outside the lifespan"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    return _client
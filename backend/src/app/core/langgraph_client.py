@@ -0,0 +1,28 @@
+from langgraph_sdk import get_client
+from langgraph_sdk.client import LangGraphClient
+
+from app.core.config import LANGGRAPH_SERVER
+
+# One SDK client (and so one pooled httpx client) per process, opened in the app lifespan
+_client: LangGraphClient = None
+
+async def init_langgraph_client(**kwargs) -> LangGraphClient:
+    """Open the shared LangGraph client. Called from the app lifespan on startup."""
+    global _client
+    if _client is None:
+        _client = get_client(url=LANGGRAPH_SERVER, **kwargs)
+    return _client
+
+async def close_langgraph_client():
+    """Close the shared client. Called on shutdown."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def get_langgraph_client() -> LangGraphClient:
+    """Return the shared client, creating it lazily when used outside the lifespan"""
+    global _client
+    if _client is None:
+        _client = get_client(url=LANGGRAPH_SERVER)
+    return _client
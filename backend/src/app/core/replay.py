@@ -0,0 +1,121 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+from app.core.config import CHAT_REPLAY_MAX_AGE_SECONDS, CHAT_REPLAY_MAX_BYTES
+
+def utf16_length(text: str) -> int:
+    """Length of `text` in UTF-16 code units"""
+    return len(text) + sum(1 for c in text if ord(c) > 0xFFFF)
+
+class ReplayBuffer:
+    """
+    Everything one streamed answer has produced so far: its text and, once it
+    has ended, the final event ("done", "error" or "cancelled"). A client that
+    lost its connection resumes from the length of the text it received, in
+    UTF-16 code units as JavaScript's `String.length` counts them (an emoji
+    is 2). Once evicted from its store the buffer stops recording text.
+    """
+
+    def __init__(self, run_id: str, user_id: int, owner: Any = None):
+        self.run_id = run_id
+        self.user_id = user_id
+        self.owner = owner  # whatever produces the answer (the chat run)
+        self.chunks = []
+        self.length = 0
+        self.size = 0
+        self.final: Optional[dict] = None
+        self.evicted = False
+        self._store: "ReplayStore" = None
+
+    def add(self, item):
+        """Record a chunk of text, or the event ending the answer"""
+        if not isinstance(item, str):
+            self.final = item
+            return
+        if self.evicted:
+            return  # nobody can resume it anymore
+        self.chunks.append(item)
+        self.length += utf16_length(item)
+        size = len(item.encode())
+        self.size += size
+        if self._store is not None:
+            self._store._grew(self, size)
+
+    def text_from(self, offset: int) -> str:
+        offset = min(max(offset, 0), self.length)
+        text = "".join(self.chunks).encode("utf-16-le")[2 * offset:]
+        # An offset inside a surrogate pair drops the half the client already has
+        return text.decode("utf-16-le", errors="ignore")
+
+class ReplayStore:
+    """
+    Replay buffers by run id, bounded by age and by total memory.
+
+    Buffers are kept in order of their last write. Those not written to for
+    `max_age` seconds are dropped, and while the buffers together hold more
+    than `max_bytes`, the least recently written ones are dropped too.
+    """
+
+    def __init__(self, max_age: float = CHAT_REPLAY_MAX_AGE_SECONDS, max_bytes: int = CHAT_REPLAY_MAX_BYTES,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.size = 0
+        self.evictions = 0
+        self._buffers: "OrderedDict[str, tuple]" = OrderedDict()  # run id -> (buffer, last write)
+
+    def add(self, buffer: ReplayBuffer) -> ReplayBuffer:
+        buffer._store = self
+        self._buffers[buffer.run_id] = (buffer, self.clock())
+        self.size += buffer.size
+        self._evict()
+        return buffer
+
+    def get(self, run_id: str, user_id: int) -> Optional[ReplayBuffer]:
+        """The buffer of a run, if it is still kept and belongs to the user"""
+        self._evict()
+        entry = self._buffers.get(run_id)
+        if entry is None or entry[0].user_id != user_id:
+            return None
+        return entry[0]
+
+    def buffers(self) -> list:
+        return [buffer for buffer, _ in self._buffers.values()]
+
+    def __len__(self) -> int:
+        return len(self._buffers)
+
+    def stats(self) -> dict:
+        return {
+            "buffers": len(self._buffers),
+            "size": self.size,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+
+    def _grew(self, buffer: ReplayBuffer, size: int):
+        if self._buffers.get(buffer.run_id, (None,))[0] is not buffer:
+            return  # already evicted
+        self._buffers[buffer.run_id] = (buffer, self.clock())
+        self._buffers.move_to_end(buffer.run_id)
+        self.size += size
+        self._evict()
+
+    def _evict(self):
+        expired = self.clock() - self.max_age
+        while self._buffers:
+            run_id, (buffer, written) = next(iter(self._buffers.items()))
+            if written > expired and self.size <= self.max_bytes:
+                break
+            del self._buffers[run_id]
+            buffer._store = None
+            self.size -= buffer.size
+            # A run still going keeps writing to it: let the memory go for good
+            buffer.evicted = True
+            buffer.chunks = []
+            self.evictions += 1
+
+# Shared store of the answers chat clients can resume
+replay_store = ReplayStore()
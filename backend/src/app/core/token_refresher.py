@@ -0,0 +1,136 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, select
+
+from app.db.database import AsyncSessionLocal, AsyncWriteSessionLocal
+from app.db.models import Token
+from app.core.config import (
+    TOKEN_REFRESH_INTERVAL_SECONDS,
+    TOKEN_REFRESH_MARGIN_SECONDS,
+    TOKEN_REFRESH_BATCH_SIZE,
+    TOKEN_REFRESH_CONCURRENCY,
+    TOKEN_REFRESH_RETRY_SECONDS,
+)
+
+class TokenRefresher:
+    """
+    Background job that refreshes stored Google access tokens before they expire.
+
+    Every `interval` seconds it selects tokens whose `expires_at` falls within
+    `margin` seconds (an indexed range query on tokens.expires_at) or is unknown
+    (rows stored before expiries were recorded), refreshes
+    them against Google at most `concurrency` at a time and writes each batch
+    back in a single transaction.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        write_session_factory=AsyncWriteSessionLocal,
+        refresh_fn=None,
+        interval: float = TOKEN_REFRESH_INTERVAL_SECONDS,
+        margin: int = TOKEN_REFRESH_MARGIN_SECONDS,
+        batch_size: int = TOKEN_REFRESH_BATCH_SIZE,
+        concurrency: int = TOKEN_REFRESH_CONCURRENCY,
+        retry_after: int = TOKEN_REFRESH_RETRY_SECONDS,
+    ):
+        if refresh_fn is None:
+            from app.api.auth import refresh_google_token
+            refresh_fn = refresh_google_token
+        self.session_factory = session_factory
+        self.write_session_factory = write_session_factory or session_factory
+        self.refresh_fn = refresh_fn
+        self.interval = interval
+        self.margin = timedelta(seconds=margin)
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.retry_after = timedelta(seconds=retry_after)
+        # token id -> earliest time we try again after a failed refresh
+        self._backoff = {}
+        self._task = None
+
+    def start(self):
+        """Start the refresh loop on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Cancel the refresh loop and wait for it to finish"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Token refresher error: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> int:
+        """Refresh every token that is due. Returns the number of tokens refreshed."""
+        refreshed = 0
+        while True:
+            now = datetime.utcnow()
+            self._backoff = {k: v for k, v in self._backoff.items() if v > now}
+            due = await self._find_due_tokens(now + self.margin, list(self._backoff))
+            if not due:
+                return refreshed
+
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def refresh(token_id, refresh_token):
+                async with semaphore:
+                    try:
+                        return token_id, await self.refresh_fn(refresh_token)
+                    except Exception as e:
+                        print(f"Failed to refresh token {token_id}: {e}")
+                        self._backoff[token_id] = datetime.utcnow() + self.retry_after
+                        return token_id, None
+
+            results = await asyncio.gather(*(refresh(*t) for t in due))
+            updates = {token_id: data for token_id, data in results if data}
+            if updates:
+                await self._store_tokens(updates)
+                for token_id in updates:
+                    self._backoff.pop(token_id, None)
+            refreshed += len(updates)
+
+            # A short batch means nothing else is due; otherwise pick up the next one
+            if len(due) < self.batch_size or not updates:
+                return refreshed
+
+    async def _find_due_tokens(self, horizon: datetime, skip_ids: list) -> list:
+        query = select(Token.id, Token.refresh_token).where(
+            or_(Token.expires_at <= horizon, Token.expires_at.is_(None)),
+            Token.refresh_token.isnot(None),
+        )
+        if skip_ids:
+            query = query.where(Token.id.notin_(skip_ids))
+        # Unknown expiries first: they may have lapsed already
+        query = query.order_by(Token.expires_at.is_(None).desc(), Token.expires_at).limit(self.batch_size)
+        async with self.session_factory() as db:
+            rows = (await db.execute(query)).all()
+        return [(row.id, row.refresh_token) for row in rows]
+
+    async def _store_tokens(self, updates: dict):
+        from app.api.auth import google_token_expiry
+
+        async with self.write_session_factory() as db:
+            tokens = (await db.execute(select(Token).where(Token.id.in_(list(updates))))).scalars().all()
+            for token in tokens:
+                data = updates[token.id]
+                token.access_token = data["access_token"]
+                # Google usually omits the refresh token on refresh; keep the stored one
+                if data.get("refresh_token"):
+                    token.refresh_token = data["refresh_token"]
+                token.expires_at = google_token_expiry(data)
+            await db.commit()
@@ -0,0 +1,132 @@
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from app.db.database import AsyncWriteSessionLocal
+from app.db.models import Message
+from app.core.config import (
+    TRANSCRIPT_BATCH_SIZE,
+    TRANSCRIPT_FLUSH_INTERVAL_SECONDS,
+    TRANSCRIPT_MAX_PENDING,
+    TRANSCRIPT_FLUSH_RETRIES,
+    TRANSCRIPT_STOP_TIMEOUT_SECONDS,
+)
+
+class TranscriptWriter:
+    """
+    Write-behind queue for chat transcripts.
+
+    Chat handlers enqueue messages and move on; a background task inserts them
+    into `messages` in batches, whenever `batch_size` messages are pending or
+    `flush_interval` seconds have passed. The queue is bounded: once
+    `max_pending` messages are waiting, `add` blocks until the database
+    catches up. `stop` flushes whatever is left, giving up after
+    `stop_timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncWriteSessionLocal,
+        batch_size: int = TRANSCRIPT_BATCH_SIZE,
+        flush_interval: float = TRANSCRIPT_FLUSH_INTERVAL_SECONDS,
+        max_pending: int = TRANSCRIPT_MAX_PENDING,
+        retries: int = TRANSCRIPT_FLUSH_RETRIES,
+        stop_timeout: float = TRANSCRIPT_STOP_TIMEOUT_SECONDS,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.retries = retries
+        self.stop_timeout = stop_timeout
+        self.flushed = 0
+        self.dropped = 0
+        self._queue: asyncio.Queue = None
+        self._task: asyncio.Task = None
+
+    def start(self):
+        """Start the flusher on the running event loop"""
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued, then stop the flusher"""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._drain(), self.stop_timeout)
+        except asyncio.TimeoutError:
+            # The flusher is cancelled with the wait; what it had not written is lost
+            lost = self._queue.qsize()
+            self.dropped += lost
+            print(f"Transcript writer did not finish within {self.stop_timeout}s, dropped {lost} queued messages")
+        self._task = None
+        self._queue = None
+
+    async def _drain(self):
+        # The sentinel needs room in the queue, which only a running flusher makes
+        sentinel = asyncio.ensure_future(self._queue.put(None))
+        await asyncio.wait({sentinel, self._task}, return_when=asyncio.FIRST_COMPLETED)
+        sentinel.cancel()
+        await self._task
+
+    async def add(self, thread_id: int, role: str, content: str):
+        """Queue a message for `messages`. Waits while the queue is full."""
+        self.start()
+        await self._queue.put({
+            "thread_id": thread_id,
+            "role": role,
+            "content": content,
+            "created_at": datetime.utcnow(),
+        })
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            item = await self._queue.get()
+            if item is None:
+                stopping = True
+            else:
+                batch.append(item)
+                deadline = asyncio.get_running_loop().time() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    timeout = deadline - asyncio.get_running_loop().time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+            if stopping:
+                # Drain without waiting so shutdown flushes everything
+                while not self._queue.empty():
+                    item = self._queue.get_nowait()
+                    if item is not None:
+                        batch.append(item)
+            for start in range(0, len(batch), self.batch_size):
+                await self._flush(batch[start:start + self.batch_size])
+
+    async def _flush(self, batch: list):
+        if not batch:
+            return
+        for attempt in range(1, self.retries + 1):
+            try:
+                async with self.session_factory() as db:
+                    await db.execute(insert(Message), batch)
+                    await db.commit()
+                self.flushed += len(batch)
+                return
+            except Exception as e:
+                print(f"Failed to write {len(batch)} transcript messages (attempt {attempt}): {e}")
+                await asyncio.sleep(0.1 * attempt)
+        self.dropped += len(batch)
+
+# Shared writer, started and flushed by the app lifespan
+transcript_writer = TranscriptWriter()
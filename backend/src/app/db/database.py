@@ -1,18 +1,107 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from app.core.config import SQLALCHEMY_DATABASE_URL
+from app.core.config import (
+    SQLALCHEMY_DATABASE_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    SQLITE_PRODUCTION_MODE,
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_MMAP_SIZE,
+    SQLITE_CACHE_SIZE,
+)
+
+# Async driver for each backend, replacing whatever driver the URL names
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+def async_database_url(url: str) -> str:
+    """Map a database URL (e.g. sqlite:, postgresql+psycopg2:) onto its async driver (aiosqlite / asyncpg)"""
+    scheme, sep, rest = url.partition(":")
+    backend = scheme.split("+", 1)[0]
+    if not sep or backend not in ASYNC_DRIVERS:
+        return url
+    return f"{ASYNC_DRIVERS[backend]}:{rest}"
+
+def is_sqlite_memory(url: str) -> bool:
+    return url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith(":"))
+
+def pool_options(url: str) -> dict:
+    """Pool settings from config. In-memory SQLite keeps SQLAlchemy's single-connection pool."""
+    if is_sqlite_memory(url):
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Production pragmas, applied to every new SQLite connection"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")  # readers no longer block the writer
+    cursor.execute("PRAGMA synchronous=NORMAL")  # safe with WAL, far fewer fsyncs
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+    cursor.close()
+
+def use_sqlite_production_profile(engine):
+    """Register the production pragmas on a sync or async SQLite engine"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "connect", _set_sqlite_pragmas)
+    return engine
+
+def create_async_engines(url: str, sqlite_production_mode: bool = SQLITE_PRODUCTION_MODE):
+    """
+    Build the (read, write) async engines for a database URL.
+
+    For SQLite in production mode the write engine holds a single connection, so
+    writes are serialized in-process instead of fighting over the file lock, while
+    reads go through the regular pool. Elsewhere both are the same engine.
+    """
+    url = async_database_url(url)
+    read_engine = create_async_engine(url, **pool_options(url))
+    if not url.startswith("sqlite") or is_sqlite_memory(url) or not sqlite_production_mode:
+        return read_engine, read_engine
+
+    write_options = dict(pool_options(url), pool_size=1, max_overflow=0)
+    write_engine = create_async_engine(url, **write_options)
+    use_sqlite_production_profile(read_engine)
+    use_sqlite_production_profile(write_engine)
+    return read_engine, write_engine
 
 # Create engine
 if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
     engine = create_engine(
-        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False},
+        **pool_options(SQLALCHEMY_DATABASE_URL)
     )
+    if SQLITE_PRODUCTION_MODE and not is_sqlite_memory(SQLALCHEMY_DATABASE_URL):
+        use_sqlite_production_profile(engine)
 else:
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, **pool_options(SQLALCHEMY_DATABASE_URL))
+
+# Async engines for the request path (routes and background jobs)
+async_engine, async_write_engine = create_async_engines(SQLALCHEMY_DATABASE_URL)
 
 # Create session
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+AsyncWriteSessionLocal = async_sessionmaker(
+    bind=async_write_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
 
 # Base class for models
 Base = declarative_base()
@@ -25,4 +114,14 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    """Async session for reads"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_async_write_db():
+    """Async session for routes that write (serialized on SQLite in production mode)"""
+    async with AsyncWriteSessionLocal() as db:
+        yield db
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, ForeignKey, Integer, Text, DateTime
+from sqlalchemy import Column, String, ForeignKey, Integer, Text, DateTime, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func 
 from app.db.database import Base
@@ -19,6 +19,10 @@ class User(Base):
 class KnowledgeStore(Base):
     __tablename__ = "knowledge_stores"
 
+    __table_args__ = (
+        Index("ix_knowledge_stores_user_id", "user_id"),
+    )
+
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     created_at = Column(DateTime, default=func.now(), nullable=False)   # timestamptz
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -32,6 +36,10 @@ class KnowledgeStore(Base):
 class File(Base):
     __tablename__ = "files"
 
+    __table_args__ = (
+        Index("ix_files_store_id", "store_id"),
+    )
+
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     created_at = Column(DateTime, default=func.now(), nullable=False)   # timestamptz
     store_id = Column(Integer, ForeignKey("knowledge_stores.id"), nullable=False)
@@ -43,10 +51,17 @@ class File(Base):
 class Thread(Base):
     __tablename__ = "threads"
 
+    __table_args__ = (
+        # A user's threads, newest first
+        Index("ix_threads_user_id_created_at", "user_id", "created_at"),
+        Index("uq_threads_langgraph_thread_id", "langgraph_thread_id", unique=True),
+    )
+
     id = Column(Integer, primary_key=True, index=True)
     created_at = Column(DateTime, default=func.now(), nullable=False)   # timestamptz
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     store_id = Column(Integer, ForeignKey("knowledge_stores.id"), nullable=True)
+    langgraph_thread_id = Column(String, nullable=True)  # Thread on the LangGraph server
     
     # Relationships
     user = relationship("User", back_populates="threads")
@@ -56,18 +71,29 @@ class Thread(Base):
 class Token(Base):
     __tablename__ = "tokens"
 
+    __table_args__ = (
+        # One token row per user and provider; also serves lookups by user_id alone
+        Index("uq_tokens_user_id_token_authenticator", "user_id", "token_authenticator", unique=True),
+    )
+
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     created_at = Column(DateTime, default=func.now(), nullable=False)   # timestamptz
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     access_token = Column(Text, nullable=False)
     refresh_token = Column(Text, nullable=True)
     token_authenticator = Column(String, nullable=False)  # TODO: Update Type
+    expires_at = Column(DateTime, nullable=True, index=True)  # When the access token stops being valid (UTC)
     # Relationships
     user = relationship("User", back_populates="tokens")
 
 class Message(Base):
     __tablename__ = "messages"
 
+    __table_args__ = (
+        # Loading a thread's history in order
+        Index("ix_messages_thread_id_created_at", "thread_id", "created_at"),
+    )
+
     id = Column(Integer, primary_key=True, index=True)
     thread_id = Column(Integer, ForeignKey("threads.id"), nullable=False)
     content = Column(Text, nullable=False)
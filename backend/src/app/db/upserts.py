@@ -0,0 +1,79 @@
+from datetime import datetime
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import User, Token
+
+_INSERTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+def dialect_insert(dialect_name: str, table):
+    """INSERT construct supporting ON CONFLICT for the given dialect"""
+    try:
+        return _INSERTS[dialect_name](table)
+    except KeyError:
+        raise NotImplementedError(f"Upserts are not supported on {dialect_name}")
+
+def user_upsert(dialect_name: str, email: str, username: str, created_at: datetime = None):
+    """
+    INSERT ... ON CONFLICT (email) DO UPDATE ... RETURNING users.id
+
+    An existing user is left as is; the no-op update only makes RETURNING
+    yield the id of the row that was already there.
+    """
+    stmt = dialect_insert(dialect_name, User.__table__).values(
+        email=email,
+        username=username,
+        created_at=created_at or datetime.utcnow(),
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[User.email],
+        set_={"email": stmt.excluded.email},
+    ).returning(User.id)
+
+def token_upsert(
+    dialect_name: str,
+    user_id: int,
+    token_authenticator: str,
+    access_token: str,
+    refresh_token: str = None,
+    expires_at: datetime = None,
+    created_at: datetime = None,
+):
+    """
+    INSERT ... ON CONFLICT (user_id, token_authenticator) DO UPDATE ... RETURNING tokens.id
+
+    Google only sends a refresh token on first consent, so a missing one keeps
+    the refresh token already stored.
+    """
+    stmt = dialect_insert(dialect_name, Token.__table__).values(
+        user_id=user_id,
+        token_authenticator=token_authenticator,
+        access_token=access_token,
+        refresh_token=refresh_token,
+        expires_at=expires_at,
+        created_at=created_at or datetime.utcnow(),
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[Token.user_id, Token.token_authenticator],
+        set_={
+            "access_token": stmt.excluded.access_token,
+            "refresh_token": func.coalesce(stmt.excluded.refresh_token, Token.__table__.c.refresh_token),
+            "expires_at": stmt.excluded.expires_at,
+            "created_at": stmt.excluded.created_at,
+        },
+    ).returning(Token.id)
+
+async def upsert_user(db: AsyncSession, email: str, username: str) -> int:
+    """Create the user if the email is new. Returns the user id."""
+    stmt = user_upsert(db.get_bind().dialect.name, email, username)
+    return (await db.execute(stmt)).scalar_one()
+
+async def upsert_token(db: AsyncSession, user_id: int, token_authenticator: str, **values) -> int:
+    """Create or replace the user's token for a provider. Returns the token id."""
+    stmt = token_upsert(db.get_bind().dialect.name, user_id, token_authenticator, **values)
+    return (await db.execute(stmt)).scalar_one()
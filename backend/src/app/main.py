@@ -3,11 +3,27 @@ from fastapi import FastAPI, WebSocket
 from app.api import auth, chat
 from fastapi.middleware.cors import CORSMiddleware
 from app.db.database import init_db
+from app.core.http_client import init_http_client, close_http_client
+from app.core.langgraph_client import init_langgraph_client, close_langgraph_client
+from app.core.token_refresher import TokenRefresher
+from app.core.transcript_writer import transcript_writer
+from app.core.config import TOKEN_REFRESH_ENABLED
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_db()  # This will create the tables only if they don't exist
+    await init_http_client()  # Shared pooled client for Google calls
+    await init_langgraph_client()  # Shared pooled client for the LangGraph server
+    token_refresher = TokenRefresher()
+    if TOKEN_REFRESH_ENABLED:
+        token_refresher.start()  # Refresh Google tokens ahead of expiry
+    transcript_writer.start()  # Batched writes of chat messages
     yield
+    await chat.cancel_detached_runs()  # Answers nobody is waiting for anymore
+    await transcript_writer.stop()  # Flush pending messages before shutdown
+    await token_refresher.stop()
+    await close_langgraph_client()
+    await close_http_client()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -2,7 +2,6 @@ from sqlalchemy.orm import Session
 from typing import Optional, Dict
 from datetime import datetime, timedelta
 from fastapi import HTTPException
-import requests
 
 from app.db.models import User as UserDB
 
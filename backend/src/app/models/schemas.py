@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel
 
 class OAuthCode(BaseModel):
@@ -5,3 +7,7 @@ class OAuthCode(BaseModel):
 
 class RefreshTokenRequest(BaseModel):
     refresh_token: str
+
+class ChatRequest(BaseModel):
+    message: str
+    thread_id: Optional[int] = None
@@ -0,0 +1,591 @@
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import jwt
+import ormsgpack
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+from langgraph_sdk.schema import StreamPart
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.api import chat
+from app.core import dependencies, langgraph_client
+from app.core.transcript_writer import transcript_writer
+from app.core.config import JWT_SECRET_KEY, JWT_ALGORITHM
+from app.db.database import Base, get_async_db
+from app.db.models import User as UserDB, Thread, Message
+from app.main import app
+
+
+class FakeRuns:
+    """Stands in for the LangGraph SDK runs client: answers every message with a few chunks."""
+
+    def __init__(self, chunks=("Hello", ", ", "world")):
+        self.chunks = list(chunks)
+        self.streams = []
+        self.cancelled = []
+
+    async def stream(self, thread_id, assistant_id, *, input=None, **kwargs):
+        run_id = str(uuid.uuid4())
+        self.streams.append({"thread_id": thread_id, "run_id": run_id, "input": input, **kwargs})
+        yield StreamPart("metadata", {"run_id": run_id})
+        for chunk in self.chunks:
+            await asyncio.sleep(0)
+            yield StreamPart("messages", [{"content": chunk, "type": "AIMessageChunk"}, {}])
+
+    async def cancel(self, thread_id, run_id, **kwargs):
+        self.cancelled.append(run_id)
+
+
+class FakeThreads:
+    def __init__(self):
+        self.created = 0
+
+    async def create(self, **kwargs):
+        self.created += 1
+        return {"thread_id": str(uuid.uuid4())}
+
+
+class FakeLangGraphClient:
+    def __init__(self, runs=None):
+        self.runs = runs or FakeRuns()
+        self.threads = FakeThreads()
+
+    async def aclose(self):
+        pass
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """File-backed SQLite database; the chat and dependencies modules' session factories point at it."""
+    path = tmp_path / "test.db"
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    TestingAsyncSessionLocal = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+    Base.metadata.create_all(bind=engine)
+
+    async def override_get_async_db():
+        async with TestingAsyncSessionLocal() as db_session:
+            yield db_session
+
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    monkeypatch.setattr(chat, "AsyncSessionLocal", TestingAsyncSessionLocal)
+    monkeypatch.setattr(chat, "AsyncWriteSessionLocal", TestingAsyncSessionLocal)
+    monkeypatch.setattr(dependencies, "AsyncSessionLocal", TestingAsyncSessionLocal)
+    monkeypatch.setattr(transcript_writer, "session_factory", TestingAsyncSessionLocal)
+    dependencies.session_token_cache.clear()
+    dependencies.user_cache.clear()
+    db_session = sessionmaker(bind=engine)()
+    try:
+        yield db_session
+    finally:
+        db_session.close()
+        app.dependency_overrides.clear()
+        engine.dispose()
+        asyncio.run(async_engine.dispose())
+
+
+@pytest.fixture
+def fake_langgraph(monkeypatch):
+    client = FakeLangGraphClient()
+    monkeypatch.setattr(langgraph_client, "_client", client)
+    return client
+
+
+@pytest.fixture
+def user_token(db):
+    user = UserDB(username="testuser", email="test@example.com")
+    db.add(user)
+    db.commit()
+    token = jwt.encode(
+        {"user_id": str(user.id), "exp": datetime.utcnow() + timedelta(hours=1)},
+        JWT_SECRET_KEY,
+        algorithm=JWT_ALGORITHM,
+    )
+    return user.id, token
+
+
+def receive_reply(websocket, reply="Hello, world"):
+    """Read frames until the whole reply has arrived (tokens may be coalesced into fewer frames)"""
+    received = ""
+    while len(received) < len(reply):
+        received += websocket.receive_text()
+    return received
+
+
+def test_follow_up_messages_reuse_one_thread(db, fake_langgraph, user_token):
+    """All messages on a connection go to one LangGraph thread, without any threads.create round trip."""
+    user_id, token = user_token
+    with TestClient(app) as client:
+        with client.websocket_connect("/chat/ws", headers={"Authorization": f"Bearer {token}"}) as websocket:
+            websocket.send_text("first")
+            assert receive_reply(websocket) == "Hello, world"
+            websocket.send_text("second")
+            assert receive_reply(websocket) == "Hello, world"
+
+    streams = fake_langgraph.runs.streams
+    assert len(streams) == 2
+    assert streams[0]["thread_id"] == streams[1]["thread_id"]
+    assert streams[0]["if_not_exists"] == "create"
+    assert fake_langgraph.threads.created == 0
+
+    thread = db.query(Thread).one()
+    assert thread.user_id == user_id
+    assert thread.langgraph_thread_id == streams[0]["thread_id"]
+
+
+def test_transcript_is_persisted(db, fake_langgraph, user_token):
+    """User messages and assembled replies reach `messages` (flushed at shutdown at the latest)."""
+    _, token = user_token
+    with TestClient(app) as client:
+        with client.websocket_connect("/chat/ws", headers={"Authorization": f"Bearer {token}"}) as websocket:
+            websocket.send_text("first")
+            receive_reply(websocket)
+            websocket.send_text("second")
+            receive_reply(websocket)
+
+    thread = db.query(Thread).one()
+    messages = db.query(Message).order_by(Message.created_at, Message.id).all()
+    assert [(m.thread_id, m.role, m.content) for m in messages] == [
+        (thread.id, "user", "first"),
+        (thread.id, "assistant", "Hello, world"),
+        (thread.id, "user", "second"),
+        (thread.id, "assistant", "Hello, world"),
+    ]
+
+
+def test_reconnect_continues_existing_thread(db, fake_langgraph, user_token):
+    _, token = user_token
+    with TestClient(app) as client:
+        with client.websocket_connect("/chat/ws", headers={"Authorization": f"Bearer {token}"}) as websocket:
+            websocket.send_text("first")
+            receive_reply(websocket)
+        thread = db.query(Thread).one()
+        with client.websocket_connect(
+            f"/chat/ws?thread_id={thread.id}", headers={"Authorization": f"Bearer {token}"}
+        ) as websocket:
+            websocket.send_text("again")
+            receive_reply(websocket)
+
+    streams = fake_langgraph.runs.streams
+    assert [s["thread_id"] for s in streams] == [thread.langgraph_thread_id] * 2
+    assert db.query(Thread).count() == 1
+
+
+class StallingRuns(FakeRuns):
+    """Sends one chunk, then keeps the run open until it is cancelled."""
+
+    async def stream(self, thread_id, assistant_id, *, input=None, **kwargs):
+        run_id = str(uuid.uuid4())
+        self.streams.append({"thread_id": thread_id, "run_id": run_id, "input": input, **kwargs})
+        yield StreamPart("metadata", {"run_id": run_id})
+        yield StreamPart("messages", [{"content": "partial", "type": "AIMessageChunk"}, {}])
+        await asyncio.sleep(3600)
+
+
+@pytest.fixture
+def stalling_langgraph(monkeypatch):
+    client = FakeLangGraphClient(runs=StallingRuns())
+    monkeypatch.setattr(langgraph_client, "_client", client)
+    return client
+
+
+def test_new_message_cancels_run_in_flight(db, stalling_langgraph, user_token):
+    _, token = user_token
+    with TestClient(app) as client:
+        with client.websocket_connect("/chat/ws", headers={"Authorization": f"Bearer {token}"}) as websocket:
+            websocket.send_text("first")
+            assert websocket.receive_text() == "partial"
+            websocket.send_text("second")
+            assert websocket.receive_text() == "partial"
+
+    runs = stalling_langgraph.runs
+    assert [s["multitask_strategy"] for s in runs.streams] == ["interrupt", "interrupt"]
+    # The first run is cancelled by the second message, the second one by the disconnect
+    assert runs.cancelled == [s["run_id"] for s in runs.streams]
+
+    contents = [(m.role, m.content) for m in db.query(Message).order_by(Message.created_at, Message.id)]
+    assert contents == [
+        ("user", "first"),
+        ("assistant", "partial"),
+        ("user", "second"),
+        ("assistant", "partial"),
+    ]
+
+
+def test_cancel_frame_stops_the_answer(db, stalling_langgraph, user_token):
+    _, token = user_token
+    with TestClient(app) as client:
+        with client.websocket_connect("/chat/ws", headers={"Authorization": f"Bearer {token}"}) as websocket:
+            websocket.send_text("first")
+            assert websocket.receive_text() == "partial"
+            websocket.send_text('{"type": "cancel"}')
+            websocket.send_text("second")
+            assert websocket.receive_text() == "partial"
+
+    runs = stalling_langgraph.runs
+    assert len(runs.streams) == 2
+    assert runs.cancelled[0] == runs.streams[0]["run_id"]
+    # The cancel frame is a control message, not part of the conversation
+    assert [m.content for m in db.query(Message).filter(Message.role == "user")] == ["first", "second"]
+
+
+def test_slow_client_applies_backpressure(fake_langgraph, monkeypatch):
+    """A full outbound queue pauses the run instead of buffering the whole answer."""
+    fake_langgraph.runs.chunks = [str(i) for i in range(20)]
+    saved = []
+
+    async def record(thread_id, role, content):
+        saved.append(content)
+
+    monkeypatch.setattr(chat.transcript_writer, "add", record)
+
+    async def scenario():
+        outbound = asyncio.Queue(maxsize=2)
+        run = chat.ChatRun("thread", outbound=outbound)
+        thread = Thread(id=1, user_id=1, langgraph_thread_id="thread")
+        run.task = asyncio.create_task(chat.run_agent(run, "hi", thread, 1))
+        for _ in range(50):
+            await asyncio.sleep(0)
+        assert outbound.full() and run.active
+        await chat.cancel_run(run)
+        return run
+
+    run = asyncio.run(scenario())
+    assert fake_langgraph.runs.cancelled == [run.run_id]
+    # Only the chunks that fit in the queue (plus the one waiting on it) were pulled from upstream
+    assert saved == ["012"]
+
+
+def receive_until(websocket, predicate, decode=json.loads, receive="receive_text"):
+    """Read frames of a multiplexed connection until `predicate(frame)` holds; return them all"""
+    frames = []
+    while True:
+        frames.append(decode(getattr(websocket, receive)()))
+        if predicate(frames[-1]):
+            return frames
+
+
+def answers_by_stream(frames):
+    answers = {}
+    for frame in frames:
+        if frame["type"] == "chunk":
+            answers[frame["stream"]] = answers.get(frame["stream"], "") + frame["content"]
+    return answers
+
+
+def test_multiplexed_streams_share_one_connection(db, fake_langgraph, user_token):
+    user_id, token = user_token
+    with TestClient(app) as client:
+        with client.websocket_connect(
+            "/chat/ws?protocol=json", headers={"Authorization": f"Bearer {token}"}
+        ) as websocket:
+            websocket.send_json({"type": "message", "stream": "a", "content": "first"})
+            websocket.send_json({"type": "message", "stream": "b", "content": "other"})
+            done = set()
+            frames = receive_until(
+                websocket, lambda f: f["type"] == "done" and (done.add(f["stream"]) or done == {"a", "b"})
+            )
+
+    assert answers_by_stream(frames) == {"a": "Hello, world", "b": "Hello, world"}
+    for stream in ("a", "b"):
+        types = [f["type"] for f in frames if f["stream"] == stream]
+        assert types[0] == "start" and types[-1] == "done"
+    started = {f["stream"]: f["thread_id"] for f in frames if f["type"] == "start"}
+    threads = {t.id: t for t in db.query(Thread).filter(Thread.user_id == user_id)}
+    # Each stream is its own conversation
+    assert set(started.values()) == set(threads)
+    assert sorted(s["thread_id"] for s in fake_langgraph.runs.streams) == sorted(
+        t.langgraph_thread_id for t in threads.values()
+    )
+
+
+def test_multiplexed_cancel_is_per_stream(db, stalling_langgraph, user_token):
+    _, token = user_token
+    with TestClient(app) as client:
+        with client.websocket_connect(
+            "/chat/ws?protocol=json", headers={"Authorization": f"Bearer {token}"}
+        ) as websocket:
+            websocket.send_json({"type": "message", "stream": "a", "content": "first"})
+            websocket.send_json({"type": "message", "stream": "b", "content": "other"})
+            chunks = set()
+            receive_until(websocket, lambda f: f["type"] == "chunk" and (chunks.add(f["stream"]) or len(chunks) == 2))
+            websocket.send_json({"type": "cancel", "stream": "a"})
+            frames = receive_until(websocket, lambda f: f["type"] == "cancelled")
+            assert frames[-1]["stream"] == "a"
+
+            runs = stalling_langgraph.runs
+            run_ids = {s["input"]["messages"][0].content: s["run_id"] for s in runs.streams}
+            assert runs.cancelled == [run_ids["first"]]
+
+            # Stream a continues on its thread; b is untouched
+            websocket.send_json({"type": "message", "stream": "a", "content": "again"})
+            frames = receive_until(websocket, lambda f: f["type"] == "chunk")
+            assert frames[-1] == {"type": "chunk", "stream": "a", "content": "partial"}
+            assert runs.streams[2]["thread_id"] == runs.streams[0]["thread_id"]
+            assert run_ids["other"] not in runs.cancelled
+
+
+def test_multiplexed_msgpack_frames(db, fake_langgraph, user_token):
+    _, token = user_token
+    with TestClient(app) as client:
+        with client.websocket_connect(
+            "/chat/ws?protocol=msgpack", headers={"Authorization": f"Bearer {token}"}
+        ) as websocket:
+            websocket.send_text("{}")
+            assert ormsgpack.unpackb(websocket.receive_bytes()) == {
+                "type": "error", "stream": None, "detail": "Invalid frame"
+            }
+            websocket.send_bytes(ormsgpack.packb({"type": "message", "stream": 1, "content": "first"}))
+            frames = receive_until(
+                websocket, lambda f: f["type"] == "done", decode=ormsgpack.unpackb, receive="receive_bytes"
+            )
+    assert answers_by_stream(frames) == {1: "Hello, world"}
+
+
+def test_multiplexed_errors_are_reported_per_stream(db, fake_langgraph, user_token):
+    _, token = user_token
+    with TestClient(app) as client:
+        with client.websocket_connect(
+            "/chat/ws?protocol=json", headers={"Authorization": f"Bearer {token}"}
+        ) as websocket:
+            websocket.send_text("not json")
+            assert websocket.receive_json() == {"type": "error", "stream": None, "detail": "Invalid frame"}
+            websocket.send_bytes(b"{}")
+            assert websocket.receive_json() == {"type": "error", "stream": None, "detail": "Invalid frame"}
+            websocket.send_json({"type": "message", "stream": "a", "content": "hi", "thread_id": 999})
+            assert websocket.receive_json() == {"type": "error", "stream": "a", "detail": "Thread not found"}
+            # The connection stays usable
+            websocket.send_json({"type": "message", "stream": "a", "content": "hi"})
+            frames = receive_until(websocket, lambda f: f["type"] == "done")
+            assert answers_by_stream(frames) == {"a": "Hello, world"}
+
+
+def test_unknown_protocol_is_refused(db, fake_langgraph, user_token):
+    _, token = user_token
+    with TestClient(app) as client:
+        with client.websocket_connect(
+            "/chat/ws?protocol=xml", headers={"Authorization": f"Bearer {token}"}
+        ) as websocket:
+            with pytest.raises(WebSocketDisconnect) as disconnect:
+                websocket.receive_text()
+    assert disconnect.value.code == 1003
+
+
+def parse_sse(body: str):
+    """(event, data) pairs of an SSE body; comments come back as (None, comment)"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        if block.startswith(":"):
+            events.append((None, block[1:].strip()))
+            continue
+        fields = dict(line.split(": ", 1) for line in block.split("\n") if not line.startswith("id: "))
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_sse_stream(db, fake_langgraph, user_token):
+    _, token = user_token
+    with TestClient(app) as client:
+        response = client.post(
+            "/chat/stream", json={"message": "first"}, headers={"Authorization": f"Bearer {token}"}
+        )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["cache-control"] == "no-cache"
+
+    events = parse_sse(response.text)
+    thread = db.query(Thread).one()
+    assert events[0] == ("start", {"thread_id": thread.id, "run": events[0][1]["run"]})
+    assert events[-1] == ("done", {})
+    assert "".join(data["content"] for event, data in events if event == "chunk") == "Hello, world"
+    assert fake_langgraph.runs.streams[0]["thread_id"] == thread.langgraph_thread_id
+    assert [(m.role, m.content) for m in db.query(Message).order_by(Message.id)] == [
+        ("user", "first"),
+        ("assistant", "Hello, world"),
+    ]
+
+
+def test_sse_stream_requires_a_token_and_an_owned_thread(db, fake_langgraph, user_token):
+    _, token = user_token
+    with TestClient(app) as client:
+        assert client.post("/chat/stream", json={"message": "hi"}).status_code == 401
+        response = client.post(
+            "/chat/stream", json={"message": "hi", "thread_id": 999}, headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 404
+    assert fake_langgraph.runs.streams == []
+
+
+class FakeRequest:
+    def __init__(self):
+        self.disconnected = False
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+def test_sse_keepalive_and_disconnect_abort_the_run(stalling_langgraph, monkeypatch):
+    monkeypatch.setattr(chat, "CHAT_SSE_KEEPALIVE_SECONDS", 0.01)
+    monkeypatch.setattr(chat, "CHAT_RESUME_GRACE_SECONDS", 0.05)
+
+    async def discard(thread_id, role, content):
+        pass
+
+    monkeypatch.setattr(chat.transcript_writer, "add", discard)
+
+    async def scenario():
+        request = FakeRequest()
+        run = chat.ChatRun("thread")
+        thread = Thread(id=1, user_id=1, langgraph_thread_id="thread")
+        received = []
+        async for event in chat.sse_stream(request, run, thread, 1, "hi"):
+            received.append(event)
+            if event.startswith(": keep-alive"):
+                # The client goes away while the run is still going
+                request.disconnected = True
+        # It could still come back for the answer ...
+        assert not run.cancelled and run.outbound is None
+        # ... until the grace period is over
+        await asyncio.sleep(0.1)
+        return run, received
+
+    run, received = asyncio.run(scenario())
+    assert received[0].startswith("event: start")
+    assert received[1] == 'id: 7\nevent: chunk\ndata: {"content": "partial"}\n\n'
+    assert ": keep-alive\n\n" in received
+    assert run.cancelled
+    assert stalling_langgraph.runs.cancelled == [run.run_id]
+
+
+class GatedRuns(FakeRuns):
+    """Sends "Hello", then holds the rest of the answer until the gate opens."""
+
+    def __init__(self):
+        super().__init__()
+        self.gate = None
+
+    async def stream(self, thread_id, assistant_id, *, input=None, **kwargs):
+        self.gate = asyncio.Event()
+        run_id = str(uuid.uuid4())
+        self.streams.append({"thread_id": thread_id, "run_id": run_id, "input": input, **kwargs})
+        yield StreamPart("metadata", {"run_id": run_id})
+        yield StreamPart("messages", [{"content": "Hello", "type": "AIMessageChunk"}, {}])
+        await self.gate.wait()
+        for chunk in (", ", "world"):
+            yield StreamPart("messages", [{"content": chunk, "type": "AIMessageChunk"}, {}])
+
+
+def test_dropped_connection_resumes_the_same_run(db, monkeypatch, user_token):
+    runs = GatedRuns()
+    monkeypatch.setattr(langgraph_client, "_client", FakeLangGraphClient(runs=runs))
+    _, token = user_token
+    headers = {"Authorization": f"Bearer {token}"}
+    with TestClient(app) as client:
+        with client.websocket_connect("/chat/ws?protocol=json", headers=headers) as websocket:
+            websocket.send_json({"type": "message", "stream": "a", "content": "first"})
+            frames = receive_until(websocket, lambda f: f["type"] == "chunk")
+            run = frames[0]["run"]
+            assert frames[-1]["content"] == "Hello"
+        # The connection dropped halfway through the answer; the run goes on
+        client.portal.call(runs.gate.set)
+
+        with client.websocket_connect("/chat/ws?protocol=json", headers=headers) as websocket:
+            websocket.send_json({"type": "resume", "stream": "b", "run": run, "offset": len("Hello")})
+            frames = receive_until(websocket, lambda f: f["type"] == "done")
+
+    assert frames[0]["type"] == "resumed" and frames[0]["run"] == run and frames[0]["stream"] == "b"
+    assert answers_by_stream(frames) == {"b": ", world"}
+    # No new LangGraph run, nothing cancelled
+    assert len(runs.streams) == 1
+    assert runs.cancelled == []
+    assert db.query(Message).filter(Message.role == "assistant").one().content == "Hello, world"
+
+
+def test_resume_replays_a_finished_answer(db, fake_langgraph, user_token):
+    _, token = user_token
+    headers = {"Authorization": f"Bearer {token}"}
+    with TestClient(app) as client:
+        with client.websocket_connect("/chat/ws?protocol=json", headers=headers) as websocket:
+            websocket.send_json({"type": "message", "stream": "a", "content": "first"})
+            run = receive_until(websocket, lambda f: f["type"] == "start")[-1]["run"]
+            receive_until(websocket, lambda f: f["type"] == "done")
+
+        with client.websocket_connect("/chat/ws?protocol=json", headers=headers) as websocket:
+            websocket.send_json({"type": "resume", "stream": "a", "run": run, "offset": 0})
+            frames = receive_until(websocket, lambda f: f["type"] == "done")
+            assert answers_by_stream(frames) == {"a": "Hello, world"}
+
+            websocket.send_json({"type": "resume", "stream": "c", "run": "unknown", "offset": 0})
+            assert websocket.receive_json() == {"type": "error", "stream": "c", "detail": "Run not found or expired"}
+
+            # Follow-ups on the resumed stream continue the same conversation
+            websocket.send_json({"type": "message", "stream": "a", "content": "second"})
+            receive_until(websocket, lambda f: f["type"] == "done")
+
+    streams = fake_langgraph.runs.streams
+    assert len(streams) == 2
+    assert streams[1]["thread_id"] == streams[0]["thread_id"]
+
+
+def test_dropped_connection_aborts_the_run_by_default(db, monkeypatch, user_token):
+    runs = GatedRuns()
+    monkeypatch.setattr(langgraph_client, "_client", FakeLangGraphClient(runs=runs))
+    _, token = user_token
+    headers = {"Authorization": f"Bearer {token}"}
+    with TestClient(app) as client:
+        with client.websocket_connect("/chat/ws", headers=headers) as websocket:
+            websocket.send_text("first")
+            assert websocket.receive_text() == "Hello"
+        for _ in range(100):
+            if runs.cancelled:
+                break
+            time.sleep(0.01)
+        # Before shutdown, which cancels detached runs anyway
+        assert runs.cancelled == [runs.streams[0]["run_id"]]
+
+
+def test_plain_websocket_resumes_the_answer_of_its_thread(db, monkeypatch, user_token):
+    monkeypatch.setattr(chat, "CHAT_RESUME_GRACE_SECONDS", 60)
+    runs = GatedRuns()
+    monkeypatch.setattr(langgraph_client, "_client", FakeLangGraphClient(runs=runs))
+    _, token = user_token
+    headers = {"Authorization": f"Bearer {token}"}
+    with TestClient(app) as client:
+        with client.websocket_connect("/chat/ws", headers=headers) as websocket:
+            websocket.send_text("first")
+            assert websocket.receive_text() == "Hello"
+        client.portal.call(runs.gate.set)
+        thread = db.query(Thread).one()
+
+        with client.websocket_connect(f"/chat/ws?thread_id={thread.id}&offset=5", headers=headers) as websocket:
+            assert receive_reply(websocket, ", world") == ", world"
+
+    assert len(runs.streams) == 1
+    assert runs.cancelled == []
+
+
+def test_sse_resumes_from_last_event_id(db, fake_langgraph, user_token):
+    _, token = user_token
+    headers = {"Authorization": f"Bearer {token}"}
+    with TestClient(app) as client:
+        response = client.post("/chat/stream", json={"message": "first"}, headers=headers)
+        run = parse_sse(response.text)[0][1]["run"]
+        first_id = response.text.split("id: ", 1)[1].split("\n", 1)[0]
+
+        resumed = client.get(f"/chat/stream/{run}", headers={**headers, "Last-Event-ID": first_id})
+        assert resumed.status_code == 200
+        events = parse_sse(resumed.text)
+        assert events[0] == ("resumed", {"run": run, "thread_id": db.query(Thread).one().id, "offset": int(first_id)})
+        assert events[-1] == ("done", {})
+        first = "Hello, world"[:int(first_id)]
+        assert first + "".join(data["content"] for event, data in events if event == "chunk") == "Hello, world"
+
+        assert client.get("/chat/stream/unknown", headers=headers).status_code == 404
+    assert len(fake_langgraph.runs.streams) == 1
@@ -0,0 +1,214 @@
+import asyncio
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs
+
+import httpx
+import jwt
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.api import auth
+from app.core import http_client
+from app.core.config import (
+    JWT_SECRET_KEY,
+    JWT_ALGORITHM,
+    GOOGLE_TOKEN_URL,
+)
+from app.core.singleflight import SingleFlight
+from app.db.database import Base, get_async_db, get_async_write_db
+from app.db.models import User as UserDB, Token
+from app.main import app
+
+
+@pytest.fixture(scope="function")
+def db(tmp_path, monkeypatch):
+    """
+    File-backed SQLite database. The test uses a sync session for setup and assertions,
+    the app gets async sessions on the same file through the get_async_db override
+    and, for the refresh itself, the patched session factories.
+    """
+    path = tmp_path / "test.db"
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    TestingAsyncSessionLocal = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+    Base.metadata.create_all(bind=engine)
+
+    async def override_get_async_db():
+        async with TestingAsyncSessionLocal() as db_session:
+            yield db_session
+
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_async_write_db] = override_get_async_db
+    monkeypatch.setattr(auth, "AsyncSessionLocal", TestingAsyncSessionLocal)
+    monkeypatch.setattr(auth, "AsyncWriteSessionLocal", TestingAsyncSessionLocal)
+    db_session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield db_session
+    finally:
+        db_session.close()
+        app.dependency_overrides.clear()
+        engine.dispose()
+        asyncio.run(async_engine.dispose())
+
+
+@pytest.fixture
+def fake_token_endpoint(monkeypatch):
+    """
+    Local fake of Google's token endpoint. Each refresh is slow enough that concurrent
+    callers overlap, and every call is counted.
+    """
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.method != "POST" or str(request.url) != GOOGLE_TOKEN_URL:
+            return httpx.Response(404, json={})
+        data = {k: v[0] for k, v in parse_qs(request.content.decode()).items()}
+        calls.append(data)
+        await asyncio.sleep(0.05)
+        if data.get("refresh_token") != "stored_refresh_token":
+            return httpx.Response(400, json={"error": "invalid_grant"})
+        return httpx.Response(200, json={
+            "access_token": f"new_access_token_{len(calls)}",
+            "expires_in": 3599,
+        })
+
+    monkeypatch.setattr(http_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return calls
+
+
+def make_user(db, refresh_token="stored_refresh_token"):
+    user = UserDB(username="testuser", email="test@example.com")
+    db.add(user)
+    db.flush()
+    db.add(Token(
+        user_id=user.id,
+        access_token="old_access_token",
+        refresh_token=refresh_token,
+        token_authenticator="google",
+    ))
+    db.commit()
+    expired = jwt.encode(
+        {"user_id": str(user.id), "exp": datetime.utcnow() - timedelta(minutes=5)},
+        JWT_SECRET_KEY,
+        algorithm=JWT_ALGORITHM,
+    )
+    return user.id, expired
+
+
+async def refresh_concurrently(expired_token, n):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await asyncio.gather(*(
+            client.post("/auth/refresh", params={"expired_token": expired_token})
+            for _ in range(n)
+        ))
+
+
+def test_concurrent_refreshes_share_one_google_call(db, fake_token_endpoint):
+    """Ten simultaneous refreshes for one user make a single Google call and a single token write."""
+    user_id, expired = make_user(db)
+
+    responses = asyncio.run(refresh_concurrently(expired, 10))
+
+    assert [r.status_code for r in responses] == [200] * 10
+    assert len(fake_token_endpoint) == 1
+    bodies = [r.json() for r in responses]
+    assert all(body == bodies[0] for body in bodies)
+    assert bodies[0]["user"]["id"] == user_id
+
+    db.expire_all()
+    token = db.query(Token).filter(Token.user_id == user_id).one()
+    assert token.access_token == "new_access_token_1"
+    assert token.refresh_token == "stored_refresh_token"
+    assert token.expires_at > datetime.utcnow()
+
+
+def test_sequential_refreshes_are_not_collapsed(db, fake_token_endpoint):
+    """Once a refresh completes, the next one goes to Google again."""
+    _, expired = make_user(db)
+
+    asyncio.run(refresh_concurrently(expired, 3))
+    asyncio.run(refresh_concurrently(expired, 3))
+
+    assert len(fake_token_endpoint) == 2
+
+
+def test_concurrent_failures_are_shared(db, fake_token_endpoint):
+    """A failed exchange is reported to every waiter without retrying per caller."""
+    _, expired = make_user(db, refresh_token="revoked_refresh_token")
+
+    responses = asyncio.run(refresh_concurrently(expired, 5))
+
+    assert [r.status_code for r in responses] == [401] * 5
+    assert len(fake_token_endpoint) == 1
+
+
+def test_refresh_survives_the_first_caller_going_away(db, fake_token_endpoint):
+    """The shared refresh has its own session, so the first caller disconnecting does not fail the others."""
+    user_id, expired = make_user(db)
+
+    async def main():
+        first = asyncio.create_task(auth.refresh_session(expired))
+        await asyncio.sleep(0.01)
+        others = [asyncio.create_task(auth.refresh_session(expired)) for _ in range(3)]
+        first.cancel()
+        return await asyncio.gather(*others)
+
+    bodies = asyncio.run(main())
+    assert [body["user"]["id"] for body in bodies] == [user_id] * 3
+    assert len(fake_token_endpoint) == 1
+    db.expire_all()
+    assert db.query(Token).filter(Token.user_id == user_id).one().access_token == "new_access_token_1"
+
+
+def test_write_session_is_not_held_during_the_google_call(db, fake_token_endpoint, monkeypatch):
+    """The single write connection is only taken for the UPDATE, after Google has answered."""
+    user_id, expired = make_user(db)
+    write_factory = auth.AsyncWriteSessionLocal
+    events = []
+
+    def tracked_write_session():
+        events.append(("write session", len(fake_token_endpoint)))
+        return write_factory()
+
+    monkeypatch.setattr(auth, "AsyncWriteSessionLocal", tracked_write_session)
+
+    asyncio.run(refresh_concurrently(expired, 1))
+
+    assert events == [("write session", 1)]
+
+
+def test_non_numeric_subject_is_rejected(db, fake_token_endpoint):
+    expired = jwt.encode(
+        {"user_id": "not-a-number", "exp": datetime.utcnow() - timedelta(minutes=5)},
+        JWT_SECRET_KEY,
+        algorithm=JWT_ALGORITHM,
+    )
+
+    responses = asyncio.run(refresh_concurrently(expired, 1))
+
+    assert responses[0].status_code == 401
+    assert fake_token_endpoint == []
+
+
+def test_singleflight_releases_key_after_completion():
+    flights = SingleFlight()
+    started = 0
+
+    async def work():
+        nonlocal started
+        started += 1
+        await asyncio.sleep(0.01)
+        return started
+
+    async def main():
+        first = await asyncio.gather(*(flights.do("user", work) for _ in range(5)))
+        assert not flights.in_flight("user")
+        second = await flights.do("user", work)
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first == [1] * 5
+    assert second == 2
@@ -0,0 +1,78 @@
+import asyncio
+
+from app.core.coalescer import ChunkCoalescer
+
+
+async def collect(coalescer, items, n_frames, gap=0.0):
+    """Feed `items` to the coalescer (with `gap` seconds between them) and return the first `n_frames` frames."""
+    queue = asyncio.Queue()
+
+    async def produce():
+        for item in items:
+            await queue.put(item)
+            await asyncio.sleep(gap)
+
+    producer = asyncio.create_task(produce())
+    frames = []
+    async for frame in coalescer.frames_from(queue):
+        frames.append(frame)
+        if len(frames) == n_frames:
+            break
+    await producer
+    return frames
+
+
+def test_first_token_is_sent_alone_then_tokens_are_joined():
+    coalescer = ChunkCoalescer(window=0.05, max_bytes=1024)
+    items = [("run", t) for t in ["Hel", "lo", ", ", "wor", "ld"]]
+    frames = asyncio.run(collect(coalescer, items, 2))
+    assert frames == [("run", "Hel"), ("run", "lo, world")]
+    assert coalescer.stats()["chunks"] == 5
+    assert coalescer.stats()["frames"] == 2
+
+
+def test_frame_is_closed_at_max_bytes():
+    coalescer = ChunkCoalescer(window=1.0, max_bytes=4)
+    items = [("run", t) for t in ["a", "bb", "cc", "dd", "e"]]
+    frames = asyncio.run(collect(coalescer, items, 3))
+    assert frames == [("run", "a"), ("run", "bbcc"), ("run", "dde")]
+
+
+def test_window_bounds_the_delay():
+    coalescer = ChunkCoalescer(window=0.02, max_bytes=1024)
+    items = [("run", str(i)) for i in range(6)]
+    # One token every 15ms: a 20ms window holds at most two of them
+    frames = asyncio.run(collect(coalescer, items, 4, gap=0.015))
+    assert frames[0] == ("run", "0")
+    assert "012345".startswith("".join(text for _, text in frames))
+    assert all(len(text) <= 2 for _, text in frames)
+
+
+def test_streams_are_not_mixed():
+    coalescer = ChunkCoalescer(window=0.05, max_bytes=1024)
+    items = [("a", "1"), ("a", "2"), ("a", "3"), ("b", "x"), ("b", "y")]
+    frames = asyncio.run(collect(coalescer, items, 4))
+    # The first token of every stream goes out immediately
+    assert frames == [("a", "1"), ("a", "23"), ("b", "x"), ("b", "y")]
+
+
+def test_zero_window_sends_every_token():
+    coalescer = ChunkCoalescer(window=0, max_bytes=1024)
+    items = [("run", t) for t in "abc"]
+    assert asyncio.run(collect(coalescer, items, 3)) == items
+
+
+def test_interleaved_streams_are_coalesced_separately():
+    coalescer = ChunkCoalescer(window=0.05, max_bytes=1024)
+    items = [("a", "1"), ("b", "1"), ("a", "2"), ("b", "2"), ("a", "3"), ("b", "3")]
+    frames = asyncio.run(collect(coalescer, items, 4))
+    assert frames == [("a", "1"), ("b", "1"), ("a", "23"), ("b", "23")]
+
+
+def test_events_follow_the_tokens_before_them():
+    coalescer = ChunkCoalescer(window=0.05, max_bytes=1024)
+    done = {"type": "done"}
+    items = [("a", "1"), ("a", "2"), ("a", "3"), ("a", done), ("a", "4")]
+    frames = asyncio.run(collect(coalescer, items, 4))
+    # After the event the stream starts over: its next token is sent at once
+    assert frames == [("a", "1"), ("a", "23"), ("a", done), ("a", "4")]
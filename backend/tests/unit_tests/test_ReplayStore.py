@@ -0,0 +1,74 @@
+from app.core.replay import ReplayBuffer, ReplayStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_text_from_offset():
+    buffer = ReplayBuffer("run", user_id=1)
+    for chunk in ("Hel", "lo", ", world"):
+        buffer.add(chunk)
+    buffer.add({"type": "done"})
+    assert buffer.text_from(0) == "Hello, world"
+    assert buffer.text_from(5) == ", world"
+    assert buffer.text_from(100) == ""
+    assert buffer.final == {"type": "done"}
+
+
+def test_offsets_count_utf16_code_units():
+    buffer = ReplayBuffer("run", user_id=1)
+    buffer.add("a\U0001F600")
+    buffer.add("b")
+    # "a" plus a surrogate pair, as a JavaScript client counts them
+    assert buffer.length == 4
+    assert buffer.text_from(1) == "\U0001F600b"
+    assert buffer.text_from(3) == "b"
+    assert buffer.text_from(2) == "b"  # inside the pair
+
+
+def test_buffers_belong_to_their_user():
+    store = ReplayStore(max_age=60, max_bytes=1024)
+    store.add(ReplayBuffer("run", user_id=1))
+    assert store.get("run", 1) is not None
+    assert store.get("run", 2) is None
+    assert store.get("other", 1) is None
+
+
+def test_evicted_by_age_since_last_write():
+    clock = FakeClock()
+    store = ReplayStore(max_age=60, max_bytes=1024, clock=clock)
+    idle = store.add(ReplayBuffer("idle", user_id=1))
+    busy = store.add(ReplayBuffer("busy", user_id=1))
+    clock.now = 50
+    busy.add("still going")
+    clock.now = 70
+    assert store.get("idle", 1) is None
+    assert store.get("busy", 1) is busy
+    clock.now = 111
+    assert store.get("busy", 1) is None
+    assert store.evictions == 2
+    assert store.size == 0
+    # Writes to an evicted buffer no longer count against the store, nor are they kept
+    idle.add("late")
+    assert store.size == 0
+    assert idle.evicted and idle.chunks == [] and idle.length == 0
+
+
+def test_evicted_by_total_size_least_recently_written_first():
+    store = ReplayStore(max_age=60, max_bytes=10)
+    first = store.add(ReplayBuffer("first", user_id=1))
+    second = store.add(ReplayBuffer("second", user_id=1))
+    first.add("aaaa")
+    second.add("bbbb")
+    first.add("aa")
+    assert store.size == 10 and len(store) == 2
+    second.add("b")
+    # "first" was written before "second": it goes
+    assert store.get("first", 1) is None
+    assert store.get("second", 1) is second
+    assert store.size == 5
@@ -0,0 +1,139 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.database import Base
+from app.db.models import User as UserDB, Token
+from app.core.token_refresher import TokenRefresher
+
+@pytest.fixture(scope="function")
+def sessions(tmp_path):
+    """
+    A file-backed SQLite database shared by a sync session (test setup and assertions)
+    and an async session factory (used by the refresher).
+    """
+    path = tmp_path / "test.db"
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    db_session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield db_session, async_sessionmaker(bind=async_engine, expire_on_commit=False)
+    finally:
+        db_session.close()
+        engine.dispose()
+        asyncio.run(async_engine.dispose())
+
+
+@pytest.fixture(scope="function")
+def db(sessions):
+    return sessions[0]
+
+
+@pytest.fixture(scope="function")
+def async_session_factory(sessions):
+    return sessions[1]
+
+
+def add_token(db, email, expires_in_seconds, refresh_token="refresh"):
+    """A token expiring in `expires_in_seconds`, or with no recorded expiry if None"""
+    user = UserDB(username=email, email=email)
+    db.add(user)
+    db.flush()
+    token = Token(
+        user_id=user.id,
+        access_token="old_access_token",
+        refresh_token=refresh_token,
+        token_authenticator="google",
+        expires_at=None if expires_in_seconds is None else datetime.utcnow() + timedelta(seconds=expires_in_seconds),
+    )
+    db.add(token)
+    db.commit()
+    return token.id
+
+
+def test_refreshes_only_tokens_close_to_expiry(db, async_session_factory):
+    """Tokens inside the margin are refreshed; fresh ones and ones without a refresh token are left alone."""
+    due = add_token(db, "due@example.com", 60)
+    expired = add_token(db, "expired@example.com", -60)
+    fresh = add_token(db, "fresh@example.com", 3600)
+    no_refresh = add_token(db, "none@example.com", 60, refresh_token=None)
+    calls = []
+
+    async def fake_refresh(refresh_token):
+        calls.append(refresh_token)
+        return {"access_token": "new_access_token", "expires_in": 3599}
+
+    refresher = TokenRefresher(
+        session_factory=async_session_factory,
+        write_session_factory=async_session_factory,
+        refresh_fn=fake_refresh,
+        margin=300,
+    )
+    assert asyncio.run(refresher.run_once()) == 2
+    assert len(calls) == 2
+
+    db.expire_all()
+    tokens = {t.id: t for t in db.query(Token).all()}
+    for token_id in (due, expired):
+        assert tokens[token_id].access_token == "new_access_token"
+        assert tokens[token_id].refresh_token == "refresh"  # kept when Google omits it
+        assert tokens[token_id].expires_at > datetime.utcnow() + timedelta(minutes=50)
+    assert tokens[fresh].access_token == "old_access_token"
+    assert tokens[no_refresh].access_token == "old_access_token"
+
+
+def test_batches_are_bounded_and_failures_back_off(db, async_session_factory):
+    """Work is split into batches with bounded concurrency; a failing token is not retried immediately."""
+    for i in range(5):
+        add_token(db, f"user{i}@example.com", 30, refresh_token=f"refresh{i}")
+    in_flight = 0
+    max_in_flight = 0
+
+    async def fake_refresh(refresh_token):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        if refresh_token == "refresh0":
+            raise RuntimeError("revoked")
+        return {"access_token": f"new_{refresh_token}", "expires_in": 3599}
+
+    refresher = TokenRefresher(
+        session_factory=async_session_factory,
+        write_session_factory=async_session_factory,
+        refresh_fn=fake_refresh,
+        batch_size=2,
+        concurrency=2,
+    )
+    assert asyncio.run(refresher.run_once()) == 4
+    assert max_in_flight <= 2
+    # The failed token is in backoff, so a second pass does nothing
+    assert asyncio.run(refresher.run_once()) == 0
+
+
+def test_unknown_expiry_is_due_and_missing_expires_in_gets_a_default(db, async_session_factory):
+    """Rows without an expiry are refreshed, and a response without `expires_in` still records one."""
+    unknown = add_token(db, "unknown@example.com", None)
+
+    async def fake_refresh(refresh_token):
+        return {"access_token": "new_access_token"}
+
+    refresher = TokenRefresher(
+        session_factory=async_session_factory,
+        write_session_factory=async_session_factory,
+        refresh_fn=fake_refresh,
+    )
+    assert asyncio.run(refresher.run_once()) == 1
+
+    db.expire_all()
+    token = db.get(Token, unknown)
+    assert token.access_token == "new_access_token"
+    assert datetime.utcnow() + timedelta(minutes=50) < token.expires_at < datetime.utcnow() + timedelta(minutes=70)
+    # Now known and an hour away, so not picked up again
+    assert asyncio.run(refresher.run_once()) == 0
@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.transcript_writer import TranscriptWriter
+from app.db.database import Base
+from app.db.models import Message, Thread, User as UserDB
+
+
+@pytest.fixture
+def sessions(tmp_path):
+    path = tmp_path / "test.db"
+    engine = create_engine(f"sqlite:///{path}")
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    db_session = sessionmaker(bind=engine)()
+    user = UserDB(username="testuser", email="test@example.com")
+    db_session.add(user)
+    db_session.flush()
+    thread = Thread(user_id=user.id)
+    db_session.add(thread)
+    db_session.commit()
+    try:
+        yield db_session, thread.id, async_sessionmaker(bind=async_engine, expire_on_commit=False)
+    finally:
+        db_session.close()
+        engine.dispose()
+        asyncio.run(async_engine.dispose())
+
+
+class CountingSessions:
+    """Wraps a session factory and counts the transactions opened on it"""
+
+    def __init__(self, factory, delay=0.0):
+        self.factory = factory
+        self.delay = delay
+        self.opened = 0
+
+    def __call__(self):
+        self.opened += 1
+        return self
+
+    async def __aenter__(self):
+        await asyncio.sleep(self.delay)
+        self.session = self.factory()
+        return await self.session.__aenter__()
+
+    async def __aexit__(self, *exc):
+        return await self.session.__aexit__(*exc)
+
+
+def test_flushes_in_batches_by_size_and_on_stop(sessions):
+    db, thread_id, factory = sessions
+    counting = CountingSessions(factory)
+    writer = TranscriptWriter(session_factory=counting, batch_size=100, flush_interval=60)
+
+    async def main():
+        writer.start()
+        for i in range(250):
+            await writer.add(thread_id, "user", f"message {i}")
+        await asyncio.sleep(0.05)
+        flushed_before_stop = writer.flushed
+        await writer.stop()
+        return flushed_before_stop
+
+    # Two full batches go out right away, the remainder at shutdown
+    assert asyncio.run(main()) == 200
+    assert writer.flushed == 250
+    assert counting.opened == 3
+    contents = [m.content for m in db.query(Message).order_by(Message.id)]
+    assert contents == [f"message {i}" for i in range(250)]
+
+
+def test_flushes_on_interval(sessions):
+    db, thread_id, factory = sessions
+    writer = TranscriptWriter(session_factory=factory, batch_size=100, flush_interval=0.05)
+
+    async def main():
+        writer.start()
+        await writer.add(thread_id, "user", "hello")
+        await asyncio.sleep(0.2)
+        flushed = writer.flushed
+        await writer.stop()
+        return flushed
+
+    assert asyncio.run(main()) == 1
+
+
+def test_backpressure_when_database_falls_behind(sessions):
+    """With a slow database, add() waits once max_pending messages are queued."""
+    _, thread_id, factory = sessions
+    writer = TranscriptWriter(
+        session_factory=CountingSessions(factory, delay=0.2), batch_size=1, flush_interval=0, max_pending=2
+    )
+
+    async def main():
+        writer.start()
+        await writer.add(thread_id, "user", "0")  # picked up by the flusher
+        await asyncio.sleep(0.01)
+        await writer.add(thread_id, "user", "1")
+        await writer.add(thread_id, "user", "2")  # queue is now full
+        blocked = asyncio.create_task(writer.add(thread_id, "user", "3"))
+        await asyncio.sleep(0.05)
+        was_blocked = not blocked.done()
+        await blocked
+        await writer.stop()
+        return was_blocked
+
+    assert asyncio.run(main())
+    assert writer.flushed == 4
+
+
+def test_stop_gives_up_when_the_database_never_catches_up(sessions):
+    """A full queue and a stuck flusher must not hold up shutdown."""
+    _, thread_id, factory = sessions
+    writer = TranscriptWriter(
+        session_factory=CountingSessions(factory, delay=60), batch_size=1, flush_interval=0, max_pending=2,
+        stop_timeout=0.1,
+    )
+
+    async def main():
+        writer.start()
+        await writer.add(thread_id, "user", "0")  # stuck in the flusher
+        await asyncio.sleep(0.01)
+        await writer.add(thread_id, "user", "1")
+        await writer.add(thread_id, "user", "2")  # queue is now full
+        await asyncio.wait_for(writer.stop(), 1)
+
+    asyncio.run(main())
+    assert writer.flushed == 0
+    assert writer.dropped == 2
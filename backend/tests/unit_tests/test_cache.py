@@ -0,0 +1,153 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import jwt
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core import dependencies
+from app.core.cache import TTLCache
+from app.core.config import JWT_SECRET_KEY, JWT_ALGORITHM
+from app.db.database import Base
+from app.db.models import User as UserDB
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeWebSocket:
+    def __init__(self, token):
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+    async def accept(self):
+        pass
+
+
+def test_ttl_cache_lru_and_expiry():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=2, ttl=10, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" is now most recently used
+    cache.set("c", 3)  # evicts "b"
+    assert cache.get("b") is None
+    cache.set("short", 4, ttl=1)  # evicts "a"; per-entry ttl shorter than the default
+    clock.now = 2
+    assert cache.get("short") is None
+    assert cache.get("c") == 3
+    clock.now = 20
+    assert cache.get("c") is None
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 3
+    assert cache.stats()["evictions"] == 2
+
+
+@pytest.fixture
+def sessions(tmp_path, monkeypatch):
+    path = tmp_path / "test.db"
+    engine = create_engine(f"sqlite:///{path}")
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(dependencies, "AsyncSessionLocal", async_sessionmaker(bind=async_engine, expire_on_commit=False))
+    dependencies.session_token_cache.clear()
+    dependencies.user_cache.clear()
+    db_session = sessionmaker(bind=engine)()
+    try:
+        yield db_session, async_engine
+    finally:
+        db_session.close()
+        engine.dispose()
+        asyncio.run(async_engine.dispose())
+        dependencies.session_token_cache.clear()
+        dependencies.user_cache.clear()
+
+
+def session_token(user_id, expires_in=timedelta(hours=1)):
+    return jwt.encode(
+        {"user_id": str(user_id), "exp": datetime.now(tz=timezone.utc) + expires_in},
+        JWT_SECRET_KEY,
+        algorithm=JWT_ALGORITHM,
+    )
+
+
+def test_reconnects_hit_the_cache(sessions):
+    """Only the first connection verifies the JWT and queries the users table."""
+    db, async_engine = sessions
+    user = UserDB(username="testuser", email="test@example.com")
+    db.add(user)
+    db.commit()
+    token = session_token(user.id)
+    queries = []
+    event.listen(async_engine.sync_engine, "before_cursor_execute", lambda *args: queries.append(args[2]))
+
+    async def connect_many(n):
+        results = []
+        for _ in range(n):
+            results.append(await dependencies.get_current_user(FakeWebSocket(token)))
+        return results
+
+    token_hits = dependencies.session_token_cache.hits
+    user_hits = dependencies.user_cache.hits
+    users = asyncio.run(connect_many(20))
+
+    assert {u.email for u in users} == {"test@example.com"}
+    assert len(queries) == 1
+    assert dependencies.session_token_cache.hits - token_hits == 19
+    assert dependencies.user_cache.hits - user_hits == 19
+
+
+def test_user_update_invalidates_cached_principal(sessions):
+    db, _ = sessions
+    user = UserDB(username="before", email="test@example.com")
+    db.add(user)
+    db.commit()
+    token = session_token(user.id)
+
+    async def current_username():
+        return (await dependencies.get_current_user(FakeWebSocket(token))).username
+
+    assert asyncio.run(current_username()) == "before"
+    user.username = "after"
+    db.commit()
+    assert asyncio.run(current_username()) == "after"
+
+
+def test_shared_user_load_survives_the_first_request_going_away(sessions):
+    """Concurrent misses share one load; cancelling the request that started it does not fail the others."""
+    db, async_engine = sessions
+    user = UserDB(username="testuser", email="test@example.com")
+    db.add(user)
+    db.commit()
+    token = session_token(user.id)
+
+    async def scenario():
+        first = asyncio.create_task(dependencies.get_current_user(FakeWebSocket(token)))
+        await asyncio.sleep(0)  # the first request starts the load ...
+        second = asyncio.create_task(dependencies.get_current_user(FakeWebSocket(token)))
+        await asyncio.sleep(0)
+        first.cancel()  # ... then goes away
+        return await second
+
+    assert asyncio.run(scenario()).email == "test@example.com"
+
+
+def test_cached_token_does_not_outlive_exp(sessions):
+    """A token about to expire is cached only until its exp, not for the cache's full TTL."""
+    token = session_token(1, expires_in=timedelta(seconds=2))
+    assert dependencies.verify_session_token(token) == 1
+
+    _, cached_until = dependencies.session_token_cache._data[token]
+    assert cached_until - dependencies.session_token_cache.clock() <= 2
+
+    with pytest.raises(HTTPException) as expired:
+        dependencies.verify_session_token(session_token(1, expires_in=timedelta(seconds=-5)))
+    assert expired.value.detail == "Token has expired"
+    assert len(dependencies.session_token_cache) == 1
@@ -0,0 +1,64 @@
+import asyncio
+
+from sqlalchemy import text
+
+from app.db.database import async_database_url, create_async_engines
+
+
+def test_async_database_url():
+    assert async_database_url("sqlite:///./app.db") == "sqlite+aiosqlite:///./app.db"
+    assert async_database_url("postgresql://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+    assert async_database_url("postgres://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+    # An existing driver is replaced, an async one kept
+    assert async_database_url("postgresql+psycopg2://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+    assert async_database_url("sqlite+pysqlite:///./app.db") == "sqlite+aiosqlite:///./app.db"
+    assert async_database_url("sqlite+aiosqlite:///./app.db") == "sqlite+aiosqlite:///./app.db"
+    assert async_database_url("sqlite://") == "sqlite+aiosqlite://"
+
+
+def test_sqlite_production_profile(tmp_path):
+    """Every connection gets the production pragmas and writes go through a single connection."""
+    read_engine, write_engine = create_async_engines(f"sqlite:///{tmp_path / 'app.db'}", sqlite_production_mode=True)
+
+    async def pragmas(engine):
+        async with engine.connect() as conn:
+            return {
+                name: (await conn.execute(text(f"PRAGMA {name}"))).scalar()
+                for name in ("journal_mode", "synchronous", "busy_timeout")
+            }
+
+    async def main():
+        try:
+            return await pragmas(read_engine), await pragmas(write_engine)
+        finally:
+            await read_engine.dispose()
+            await write_engine.dispose()
+
+    read_pragmas, write_pragmas = asyncio.run(main())
+    assert read_engine is not write_engine
+    assert write_engine.pool.size() == 1
+    for found in (read_pragmas, write_pragmas):
+        assert found["journal_mode"] == "wal"
+        assert found["synchronous"] == 1  # NORMAL
+        assert found["busy_timeout"] > 0
+
+
+def test_sqlite_default_profile_shares_one_engine(tmp_path):
+    read_engine, write_engine = create_async_engines(f"sqlite:///{tmp_path / 'app.db'}", sqlite_production_mode=False)
+    assert read_engine is write_engine
+    asyncio.run(read_engine.dispose())
+
+
+def test_upserts_compile_for_sqlite_and_postgres():
+    """The same login upserts are valid on both dialects."""
+    from sqlalchemy.dialects import postgresql, sqlite
+    from app.db.upserts import token_upsert, user_upsert
+
+    for dialect in (sqlite.dialect(), postgresql.dialect()):
+        user_sql = str(user_upsert(dialect.name, "a@example.com", "a").compile(dialect=dialect))
+        token_sql = str(token_upsert(dialect.name, 1, "google", "access").compile(dialect=dialect))
+        assert "ON CONFLICT (email) DO UPDATE" in user_sql
+        assert "ON CONFLICT (user_id, token_authenticator) DO UPDATE" in token_sql
+        assert "coalesce" in token_sql
+        assert "RETURNING" in user_sql
+        assert "RETURNING" in token_sql
@@ -0,0 +1,88 @@
+import importlib.util
+import os
+
+import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.pool import StaticPool
+
+from app.db.database import Base
+from app.db.models import File, KnowledgeStore, Message, Thread, Token
+
+MIGRATION_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "..", "src", "alembic", "versions",
+    "8d3a5c17e2b4_added_indexes_for_chat_and_token_queries.py",
+)
+
+INDEX_NAMES = [
+    "uq_tokens_user_id_token_authenticator",
+    "ix_messages_thread_id_created_at",
+    "ix_threads_user_id_created_at",
+    "ix_files_store_id",
+    "ix_knowledge_stores_user_id",
+]
+
+# The statements the app issues, and the index the planner is expected to pick for each
+QUERIES = [
+    (select(Message).where(Message.thread_id == 1).order_by(Message.created_at), "ix_messages_thread_id_created_at"),
+    (select(Thread).where(Thread.user_id == 1).order_by(Thread.created_at.desc()), "ix_threads_user_id_created_at"),
+    (select(Token).where(Token.user_id == 1), "uq_tokens_user_id_token_authenticator"),
+    (select(Token).where(Token.user_id == 1, Token.token_authenticator == "google"), "uq_tokens_user_id_token_authenticator"),
+    (select(File).where(File.store_id == 1), "ix_files_store_id"),
+    (select(KnowledgeStore).where(KnowledgeStore.user_id == 1), "ix_knowledge_stores_user_id"),
+]
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+def query_plan(conn, statement) -> str:
+    compiled = statement.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+    rows = conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}")).all()
+    return "\n".join(row[-1] for row in rows)
+
+
+def assert_plans_use_indexes(conn):
+    for statement, index_name in QUERIES:
+        plan = query_plan(conn, statement)
+        assert index_name in plan, plan
+        # Rows come back in index order, no separate sort step
+        assert "TEMP B-TREE" not in plan, plan
+
+
+def test_planner_uses_indexes(engine):
+    with engine.connect() as conn:
+        assert_plans_use_indexes(conn)
+
+
+def test_migration_creates_indexes(engine):
+    """Starting from the schema without the indexes, the migration adds them and the planner picks them up."""
+    pytest.importorskip("alembic")
+    from alembic.migration import MigrationContext
+    from alembic.operations import Operations
+
+    spec = importlib.util.spec_from_file_location("add_indexes_migration", MIGRATION_PATH)
+    migration = importlib.util.module_from_spec(spec)
+
+    with engine.begin() as conn:
+        for name in INDEX_NAMES:
+            conn.execute(text(f"DROP INDEX {name}"))
+        # Duplicate tokens from before the unique index are collapsed to the newest row
+        conn.execute(text("INSERT INTO users (id, created_at, username, email) VALUES (1, '2025-01-01', 'u', 'u@example.com')"))
+        for token_id in (1, 2):
+            conn.execute(text(
+                "INSERT INTO tokens (id, created_at, user_id, access_token, token_authenticator) "
+                f"VALUES ({token_id}, '2025-01-01', 1, 'access{token_id}', 'google')"
+            ))
+
+        context = MigrationContext.configure(conn)
+        with Operations.context(context):
+            spec.loader.exec_module(migration)
+            migration.upgrade()
+
+        assert conn.execute(text("SELECT id FROM tokens")).scalars().all() == [2]
+        assert_plans_use_indexes(conn)
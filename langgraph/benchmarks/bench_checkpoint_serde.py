@@ -0,0 +1,124 @@
+"""
+Checkpoint size and encode/decode time, default serialization versus compact (msgpack + zstd + deltas).
+
+    cd langgraph && python benchmarks/bench_checkpoint_serde.py --turns 20
+    cd langgraph && python benchmarks/bench_checkpoint_serde.py --db src/state_db/example.db
+
+Without --db the checkpoints come from a simulated ReAct conversation: every turn the assistant looks rows
+up with getRow, reads the tool result and answers. With --db they are replayed from an existing database.
+Encode time is `put` (including the delta), decode time is `get_tuple` on a saver with nothing cached.
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.graph import START, MessagesState, StateGraph
+
+from utils.checkpointer import CompactSqliteSaver
+
+
+def assistant(state: MessagesState):
+    last = state["messages"][-1]
+    n = len(state["messages"])
+    metadata = {
+        "token_usage": {"completion_tokens": 40, "prompt_tokens": 900 + 60 * n, "total_tokens": 940 + 60 * n},
+        "model_name": "gpt-4o-2024-08-06", "system_fingerprint": "fp_50cad350e4", "finish_reason": "stop",
+        "logprobs": None,
+    }
+    if isinstance(last, HumanMessage):
+        call = {"name": "getRow", "args": {"table": "Contacts", "where": {"company": f"Company {n}"}}, "id": f"call_{n}"}
+        return {"messages": [AIMessage(content="", tool_calls=[call], response_metadata=metadata)]}
+    return {"messages": [AIMessage(content=f"I found {n % 7 + 1} contacts at Company {n}. " * 3,
+                                   response_metadata=metadata)]}
+
+
+def tools(state: MessagesState):
+    call = state["messages"][-1].tool_calls[0]
+    rows = [{"row_number": i + 2, "name": f"Contact {i}", "email": f"contact{i}@company.example",
+             "company": call["args"]["where"]["company"], "phone": f"+1 555 01{i:02}"} for i in range(8)]
+    return {"messages": [ToolMessage(content=json.dumps(rows), name="getRow", tool_call_id=call["id"])]}
+
+
+def simulated(turns: int):
+    builder = StateGraph(MessagesState)
+    builder.add_node("assistant", assistant)
+    builder.add_node("tools", tools)
+    builder.add_edge(START, "assistant")
+    builder.add_conditional_edges("assistant", lambda s: "tools" if s["messages"][-1].tool_calls else "__end__")
+    builder.add_edge("tools", "assistant")
+    saver = SqliteSaver(sqlite3.connect(":memory:", check_same_thread=False))
+    graph = builder.compile(checkpointer=saver)
+    config = {"configurable": {"thread_id": "bench"}}
+    for i in range(turns):
+        graph.invoke({"messages": [HumanMessage(content=f"Who works at Company {i}?")]}, config)
+    return saver
+
+
+def replay(source: SqliteSaver):
+    """Every checkpoint of `source` as put() received it, oldest first"""
+    tuples = sorted(source.list(None), key=lambda t: t.checkpoint["id"])
+    for t in tuples:
+        config = {"configurable": {**t.config["configurable"],
+                                   "checkpoint_id": t.parent_config["configurable"]["checkpoint_id"]
+                                   if t.parent_config else None}}
+        yield config, t.checkpoint, t.metadata
+
+
+def measure(make, path: str, checkpoints):
+    saver = make(path)
+    started = time.perf_counter()
+    for config, checkpoint, metadata in checkpoints:
+        saver.put(config, checkpoint, metadata, {})
+    encode = time.perf_counter() - started
+    size = saver.conn.execute("SELECT sum(length(checkpoint)) FROM checkpoints").fetchone()[0]
+    fresh = make(path)
+    started = time.perf_counter()
+    for config, checkpoint, _ in checkpoints:
+        read = fresh.get_tuple({"configurable": {**config["configurable"], "checkpoint_id": checkpoint["id"]}})
+        assert read.checkpoint["channel_values"] == checkpoint["channel_values"]
+    decode = time.perf_counter() - started
+    return size, encode, decode
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--db", help="replay the checkpoints of this database instead")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        if args.db:
+            # A copy, as opening the database would touch it
+            shutil.copy(args.db, os.path.join(directory, "source.db"))
+            source = SqliteSaver(sqlite3.connect(os.path.join(directory, "source.db"), check_same_thread=False))
+        else:
+            source = simulated(args.turns)
+        checkpoints = list(replay(source))
+    messages = max(len(c["channel_values"].get("messages", [])) for _, c, _ in checkpoints)
+    print(f"{len(checkpoints)} checkpoints, up to {messages} messages")
+
+    savers = {
+        "default": lambda path: SqliteSaver(sqlite3.connect(path, check_same_thread=False)),
+        "compact": lambda path: CompactSqliteSaver(sqlite3.connect(path, check_same_thread=False)),
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, make in savers.items():
+            results[name] = measure(make, os.path.join(directory, f"{name}.db"), checkpoints)
+    n = len(checkpoints)
+    default_size = results["default"][0]
+    for name, (size, encode, decode) in results.items():
+        print(f"{name:<8} {size:>10,} bytes ({size / n:8,.0f}/checkpoint, {default_size / size:5.1f}x)   "
+              f"encode {encode / n * 1e6:6.0f} us   decode {decode / n * 1e6:6.0f} us")
+
+
+if __name__ == "__main__":
+    main()
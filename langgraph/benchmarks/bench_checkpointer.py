@@ -0,0 +1,98 @@
+"""
+Checkpoint write latency with many agent threads writing at once.
+
+    cd langgraph && python benchmarks/bench_checkpointer.py --threads 50 --writes 20
+
+Each of `threads` workers plays one conversation thread and writes `writes` checkpoints (put, then
+put_writes, as the graph does after every node). Reports per-write latency and total throughput for
+SqliteSaver on one shared connection and for PooledSqliteSaver, sync and async.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.base import create_checkpoint, empty_checkpoint
+
+from utils.checkpointer import PooledSqliteSaver, make_checkpointer
+
+
+def checkpoint(step: int):
+    base = empty_checkpoint()
+    base["channel_values"] = {"messages": [
+        HumanMessage(content=f"question {i}") if i % 2 == 0 else AIMessage(content="answer " * 40)
+        for i in range(step + 1)
+    ]}
+    return create_checkpoint(base, None, step)
+
+
+def config(thread_id: str):
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+
+
+def write(saver, thread_id: str, step: int) -> float:
+    started = time.perf_counter()
+    saved = saver.put(config(thread_id), checkpoint(step), {"source": "loop", "step": step}, {})
+    saver.put_writes(saved, [("messages", AIMessage(content="answer"))], f"task{step}")
+    return time.perf_counter() - started
+
+
+async def awrite(saver, thread_id: str, step: int) -> float:
+    started = time.perf_counter()
+    saved = await saver.aput(config(thread_id), checkpoint(step), {"source": "loop", "step": step}, {})
+    await saver.aput_writes(saved, [("messages", AIMessage(content="answer"))], f"task{step}")
+    return time.perf_counter() - started
+
+
+def run_threads(saver, threads: int, writes: int):
+    def conversation(i):
+        return [write(saver, f"t{i}", step) for step in range(writes)]
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return [latency for latencies in pool.map(conversation, range(threads)) for latency in latencies]
+
+
+def run_tasks(saver, threads: int, writes: int):
+    async def conversation(i):
+        return [await awrite(saver, f"t{i}", step) for step in range(writes)]
+
+    async def conversations():
+        return await asyncio.gather(*(conversation(i) for i in range(threads)))
+    return [latency for latencies in asyncio.run(conversations()) for latency in latencies]
+
+
+def report(label: str, run, saver, threads: int, writes: int):
+    started = time.perf_counter()
+    latencies = sorted(run(saver, threads, writes))
+    elapsed = time.perf_counter() - started
+    p50 = statistics.median(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    commits = f"   {saver.writes / saver.commits:5.1f} writes/commit" if isinstance(saver, PooledSqliteSaver) else ""
+    print(f"{label:<16} p50 {p50 * 1000:7.2f} ms   p99 {p99 * 1000:7.2f} ms   "
+          f"{len(latencies) / elapsed:7.0f} writes/s{commits}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=50)
+    parser.add_argument("--writes", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{args.threads} threads x {args.writes} checkpoints (put + put_writes)")
+    with tempfile.TemporaryDirectory() as directory:
+        report("sqlite", run_threads, make_checkpointer(os.path.join(directory, "a.db"), "sqlite"),
+               args.threads, args.writes)
+        with PooledSqliteSaver(os.path.join(directory, "b.db")) as saver:
+            report("pooled", run_threads, saver, args.threads, args.writes)
+        with PooledSqliteSaver(os.path.join(directory, "c.db")) as saver:
+            report("pooled, async", run_tasks, saver, args.threads, args.writes)
+
+
+if __name__ == "__main__":
+    main()
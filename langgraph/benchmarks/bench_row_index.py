@@ -0,0 +1,81 @@
+"""
+CRM row lookups through the row index versus scanning the sheet.
+
+    cd langgraph && python benchmarks/bench_row_index.py --rows 100000 --lookups 1000
+
+Builds a synthetic Contacts sheet, then times exact lookups on a key column (email), word-prefix
+lookups on a name column, the same lookups as a row-by-row scan, and incremental appends and deletes.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from utils.row_index import RowIndex
+
+FIRST = ["Ada", "Grace", "Alan", "Barbara", "Edsger", "Donald", "Frances", "John", "Margaret", "Ken"]
+LAST = ["Lovelace", "Hopper", "Turing", "Liskov", "Dijkstra", "Knuth", "Allen", "Backus", "Hamilton", "Thompson"]
+
+
+def contacts(rows: int):
+    values = [["id", "name", "email", "city"]]
+    for i in range(rows):
+        name = f"{FIRST[i % len(FIRST)]} {LAST[i // len(FIRST) % len(LAST)]} {i}"
+        values.append([str(i), name, f"user{i}@example.com", random.choice(["London", "Paris", "Berlin"])])
+    return values
+
+
+def timed(find, queries):
+    latencies = []
+    for where in queries:
+        started = time.perf_counter()
+        find(where)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return statistics.mean(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+def report(label, mean, p99):
+    print(f"{label:<28} mean {mean * 1000:8.3f} ms   p99 {p99 * 1000:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=1000)
+    args = parser.parse_args()
+    random.seed(0)
+
+    values = contacts(args.rows)
+    started = time.perf_counter()
+    index = RowIndex(values)
+    print(f"rows {args.rows}, index built in {(time.perf_counter() - started) * 1000:.0f} ms")
+    scan = RowIndex(values, indexed=False)
+
+    picks = [random.randrange(args.rows) for _ in range(args.lookups)]
+    by_email = [{"email": f"USER{i}@example.com"} for i in picks]
+    # A word prefix of a real name: "Ada Lovelace 1234" -> "lovelace 123"
+    by_name = [{"name": " ".join(values[i + 1][1].lower().split()[1:])[:-1]} for i in picks]
+    assert all(index.find({}, search=search) for search in by_name), "every name query must match a row"
+    report("email, indexed", *timed(index.find, by_email))
+    report("name prefix, indexed", *timed(lambda search: index.find({}, search=search), by_name))
+    scans = max(1, args.lookups // 100)
+    report("email, scan", *timed(scan.find, by_email[:scans]))
+    report("name prefix, scan", *timed(lambda search: scan.find({}, search=search), by_name[:scans]))
+
+    appended = contacts(args.lookups)[1:]
+    started = time.perf_counter()
+    index.append(appended)
+    print(f"append {len(appended)} rows       {(time.perf_counter() - started) * 1000 / len(appended):8.3f} ms/row")
+    started = time.perf_counter()
+    for number in random.sample(range(2, len(values) + 1), args.lookups):
+        index.delete([min(number, len(values))])
+    print(f"delete {args.lookups} rows       {(time.perf_counter() - started) * 1000 / args.lookups:8.3f} ms/row")
+
+
+if __name__ == "__main__":
+    main()
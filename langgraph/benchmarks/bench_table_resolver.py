@@ -0,0 +1,77 @@
+"""
+Table resolution latency against a large synthetic catalog.
+
+    cd langgraph && python benchmarks/bench_table_resolver.py --spreadsheets 1000 --tabs 5 --lookups 2000
+
+Indexes `spreadsheets` x `tabs` tabs with eight columns each, then times resolving exact, misspelt and
+conversational phrases, and re-indexing one spreadsheet as a catalog refresh would.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from utils.sheets import Table
+from utils.table_resolver import TableResolver
+
+TOPICS = ["leads", "contacts", "deals", "invoices", "tasks", "vendors", "orders", "tickets", "campaigns",
+          "partners", "payments", "meetings", "products", "shipments", "renewals", "candidates"]
+COLUMNS = ["name", "email", "phone", "company", "owner", "status", "amount", "created", "source", "region",
+           "stage", "notes", "due date", "city", "country", "priority"]
+
+
+def spreadsheet(i: int, tabs: int):
+    rng = random.Random(i)
+    name = f"{rng.choice(['Sales', 'Ops', 'Finance', 'Support', 'Hiring'])} {rng.choice(TOPICS)} {i}"
+    return name, {
+        f"{topic} {i}": Table(f"{topic} {i}", j, rng.sample(COLUMNS, 8))
+        for j, topic in enumerate(rng.sample(TOPICS, tabs))
+    }
+
+
+def timed(resolve, phrases):
+    latencies = []
+    for phrase in phrases:
+        started = time.perf_counter()
+        resolve(phrase)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--spreadsheets", type=int, default=1000)
+    parser.add_argument("--tabs", type=int, default=5)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    resolver = TableResolver()
+    started = time.perf_counter()
+    for i in range(args.spreadsheets):
+        resolver.update_spreadsheet(f"s{i}", *spreadsheet(i, args.tabs))
+    print(f"{len(resolver)} tabs indexed in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    numbers = [rng.randrange(args.spreadsheets) for _ in range(args.lookups)]
+    phrases = {
+        "exact": [f"{rng.choice(TOPICS)} {n}" for n in numbers],
+        "misspelt": [f"{rng.choice(TOPICS)[:-1]}x {n}" for n in numbers],
+        "sentence": [f"add Ada to the {rng.choice(TOPICS)} sheet {n} with her email" for n in numbers],
+    }
+    for label, batch in phrases.items():
+        median, p99 = timed(resolver.resolve, batch)
+        print(f"resolve {label:<10} median {median * 1e6:8.1f} us   p99 {p99 * 1e6:8.1f} us")
+
+    started = time.perf_counter()
+    for n in numbers[:100]:
+        resolver.update_spreadsheet(f"s{n}", *spreadsheet(n + args.spreadsheets, args.tabs))
+    print(f"re-index one spreadsheet   {(time.perf_counter() - started) * 1e6 / 100:8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
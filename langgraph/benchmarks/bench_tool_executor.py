@@ -0,0 +1,75 @@
+"""
+Latency of one agent tool step with several getRow calls, one at a time versus concurrently.
+
+    cd langgraph && python benchmarks/bench_tool_executor.py --tables 6 --latency 0.08 --steps 5
+
+Each step asks for every table of a fake spreadsheet whose API calls take `latency` seconds. The snapshot
+cache is cleared between steps so every lookup goes to the (fake) network.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from utils import crm_tools, sheets
+from utils.fake_sheets import FakeSheetsServer
+from utils.tool_executor import ToolExecutor
+
+
+def setup(tables: int, latency: float):
+    server = FakeSheetsServer(latency=latency)
+    server.add_spreadsheet("crm", {
+        f"Table{i}": [["name", "email"]] + [[f"n{j}", f"n{j}@example.com"] for j in range(50)]
+        for i in range(tables)
+    })
+    sheets._client = server.client()
+
+
+def step_calls(tables: int):
+    return [
+        {"name": "getRow", "args": {"table": f"Table{i}", "where": {}}, "id": f"call{i}"}
+        for i in range(tables)
+    ]
+
+
+async def sequential(calls, config):
+    tools = {tool.name: tool for tool in crm_tools.tools}
+    return [await tools[call["name"]].ainvoke({**call, "type": "tool_call"}, config) for call in calls]
+
+
+def measure(run, calls, config, steps: int) -> float:
+    times = []
+    for _ in range(steps):
+        crm_tools.snapshot_cache.clear()
+        started = time.perf_counter()
+        asyncio.run(run(calls, config))
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tables", type=int, default=6)
+    parser.add_argument("--latency", type=float, default=0.08)
+    parser.add_argument("--steps", type=int, default=5)
+    args = parser.parse_args()
+    setup(args.tables, args.latency)
+    config = {"configurable": {"spreadsheet_id": "crm", "google_access_token": "token", "user_id": 1}}
+    calls = step_calls(args.tables)
+
+    print(f"{args.tables} getRow calls per step, {args.latency * 1000:.0f} ms per API call")
+    baseline = measure(sequential, calls, config, args.steps)
+    print(f"one at a time        {baseline * 1000:7.0f} ms")
+    for cap in (2, 4, args.tables):
+        executor = ToolExecutor(crm_tools.tools, max_per_user=cap)
+        elapsed = measure(executor.arun, calls, config, args.steps)
+        print(f"concurrent, cap {cap:<4} {elapsed * 1000:7.0f} ms   {baseline / elapsed:4.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,28 @@
 from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
 from langchain_openai import ChatOpenAI
 
 from langgraph.graph import START, StateGraph, MessagesState
-from langgraph.prebuilt import tools_condition, ToolNode
-import sqlite3
-# In memory
-from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.prebuilt import tools_condition
 import os, getpass
 from dotenv import load_dotenv
 
+from utils.checkpointer import make_checkpointer
+
 load_dotenv(dotenv_path="../.env")
 def _set_env(var: str):
     if not os.environ.get(var):
         os.environ[var] = getpass.getpass(f"{var}: ")
 
 _set_env("OPENAI_API_KEY")
-conn = sqlite3.connect(":memory:", check_same_thread = False)
 
 db_path = "state_db/example.db"
-conn = sqlite3.connect(db_path, check_same_thread=False)
-
-memory = SqliteSaver(conn)
-
-def findtable() -> str:
-    """Finds the table in the CRM.
-    """
-    return "table1"
-
-def getRow() -> list:
-    """Retrieves a row from the table. given the user message.
-    """
-    return ["keshav", "kumar", "keshav@gmail.com"]
-
-def addRow() -> str:
-    """Adds Row to table
-    """
-    return "Row added successfully"
-
-def deleteRow() -> str:
-    """Deletes Row from table
-    """
-    return "Row deleted successfully"
+# CHECKPOINTER=pooled for a WAL connection pool with group commits (see utils.checkpointer)
+# CHECKPOINT_SERDE=compact to store checkpoints compressed, as deltas (see utils.checkpoint_serde)
+memory = make_checkpointer(db_path)
 
-tools = [findtable, getRow, addRow, deleteRow]
+from utils.crm_tools import table_hint, tools
+from utils.mutation_buffer import CRMToolNode
 
 # Define LLM with bound tools
 llm = ChatOpenAI(model="gpt-4o")
@@ -62,13 +42,18 @@ class State(MessagesState):
     data: dict
 
 # Node
-def assistant(state: State):
-   return {"messages": [llm_with_tools.invoke([sys_msg] + state["messages"])]}
+def assistant(state: State, config: RunnableConfig):
+   messages = [sys_msg] + state["messages"]
+   # When the table the user means is clear from the catalog, say so and save a findtable round trip
+   hint = table_hint(state["messages"], config)
+   if hint:
+      messages.append(SystemMessage(content=hint))
+   return {"messages": [llm_with_tools.invoke(messages)]}
 
 # Build graph
 builder = StateGraph(State)
 builder.add_node("assistant", assistant)
-builder.add_node("tools", ToolNode(tools))
+builder.add_node("tools", CRMToolNode(tools))
 builder.add_edge(START, "assistant")
 builder.add_conditional_edges(
     "assistant",
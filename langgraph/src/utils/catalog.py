@@ -0,0 +1,177 @@
+"""
+Catalog of a user's spreadsheets: id, name, tabs and column names, so the
+agent can find a table without listing Drive on every turn.
+
+The first refresh pages through every spreadsheet in the user's Drive
+(`files.list` with `nextPageToken`). Later refreshes, once the catalog is
+older than `CATALOG_TTL_SECONDS`, only ask for files modified since the
+newest one seen and reload the tabs of those; a full listing every
+`CATALOG_FULL_REFRESH_SECONDS` drops spreadsheets that are gone. Each page
+is merged as it arrives, so a long listing is usable part-way through. A
+spreadsheet whose tabs could not be read (a rate limit, an outage) is tried
+again on every refresh until they are. `refresh_in_background` runs a
+refresh on a thread, for callers that should not wait for one.
+
+`Catalog.resolver` indexes the tabs for fuzzy lookups and is kept in step
+one spreadsheet at a time.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from utils.sheets import DRIVE_FILES_API, SheetsCRM, SheetsError, Table, google_request
+from utils.table_resolver import TableResolver
+
+CATALOG_TTL_SECONDS = float(os.getenv("CATALOG_TTL_SECONDS", 300))
+CATALOG_FULL_REFRESH_SECONDS = float(os.getenv("CATALOG_FULL_REFRESH_SECONDS", 3600))
+CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", 100))
+CATALOG_MAX_USERS = int(os.getenv("CATALOG_MAX_USERS", 256))
+
+SPREADSHEET_QUERY = "mimeType='application/vnd.google-apps.spreadsheet' and trashed = false"
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Spreadsheet:
+    id: str
+    name: str
+    modified_time: str
+    tables: Dict[str, Table] = field(default_factory=dict)
+    loaded: bool = True  # False while its tabs could not be read
+
+class Catalog:
+    def __init__(self, ttl: float = CATALOG_TTL_SECONDS, full_refresh: float = CATALOG_FULL_REFRESH_SECONDS,
+                 page_size: int = CATALOG_PAGE_SIZE, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.full_refresh = full_refresh
+        self.page_size = page_size
+        self.clock = clock
+        self.spreadsheets: Dict[str, Spreadsheet] = {}
+        self.refreshed_at: Optional[float] = None
+        self.fully_listed_at: Optional[float] = None
+        self.newest_modified_time = ""
+        self.resolver = TableResolver()
+        self._lock = threading.Lock()  # one refresh at a time; readers see whole pages
+        self.background: Optional[threading.Thread] = None  # the refresh started by refresh_in_background
+
+    def stale(self) -> bool:
+        return self.refreshed_at is None or self.clock() - self.refreshed_at >= self.ttl
+
+    def refresh(self, access_token: str, crm_for: Callable[[str], SheetsCRM], client: httpx.Client = None,
+                force: bool = False):
+        """
+        Bring the catalog up to date if it is older than the TTL. `crm_for(id)`
+        gives the SheetsCRM to load a spreadsheet's tabs with.
+        """
+        with self._lock:
+            if not force and not self.stale():
+                return
+            now = self.clock()
+            full = self.fully_listed_at is None or now - self.fully_listed_at >= self.full_refresh
+            query = SPREADSHEET_QUERY
+            if not full and self.newest_modified_time:
+                query += f" and modifiedTime > '{self.newest_modified_time}'"
+            listed = set()
+            for files in self._pages(access_token, client, query):
+                for file in files:
+                    listed.add(file["id"])
+                    self._merge(crm_for, file)
+            # Not modified since, so not listed again: retry those whose tabs failed to load
+            for spreadsheet in [s for s in self.spreadsheets.values() if not s.loaded and s.id not in listed]:
+                self._load(crm_for, spreadsheet.id, spreadsheet.name, spreadsheet.modified_time)
+            if full:
+                for spreadsheet_id in set(self.spreadsheets) - listed:
+                    del self.spreadsheets[spreadsheet_id]
+                    self.resolver.remove_spreadsheet(spreadsheet_id)
+                self.fully_listed_at = now
+            self.refreshed_at = now
+
+    def refresh_in_background(self, access_token: str, crm_for: Callable[[str], SheetsCRM]):
+        """Start a refresh on a thread if the catalog is stale and one is not already running"""
+        with self._lock:
+            if not self.stale() or (self.background is not None and self.background.is_alive()):
+                return
+            self.background = threading.Thread(target=self._refresh_quietly, args=(access_token, crm_for),
+                                               name="catalog-refresh", daemon=True)
+            self.background.start()
+
+    def _refresh_quietly(self, access_token: str, crm_for: Callable[[str], SheetsCRM]):
+        try:
+            self.refresh(access_token, crm_for)
+        except SheetsError as e:
+            logger.warning("Catalog: background refresh failed: %s", e)
+
+    def _pages(self, access_token: str, client: Optional[httpx.Client], query: str):
+        page_token = None
+        while True:
+            params = {
+                "q": query,
+                "pageSize": self.page_size,
+                "fields": "nextPageToken, files(id, name, modifiedTime)",
+            }
+            if page_token:
+                params["pageToken"] = page_token
+            page = google_request(access_token, "GET", DRIVE_FILES_API, client=client, params=params)
+            yield page.get("files", [])
+            page_token = page.get("nextPageToken")
+            if not page_token:
+                return
+
+    def _merge(self, crm_for: Callable[[str], SheetsCRM], file: dict):
+        known = self.spreadsheets.get(file["id"])
+        self.newest_modified_time = max(self.newest_modified_time, file["modifiedTime"])
+        if known is not None and known.loaded and known.modified_time == file["modifiedTime"]:
+            if known.name != file["name"]:
+                known.name = file["name"]
+                self.resolver.update_spreadsheet(known.id, known.name, known.tables)
+            return
+        self._load(crm_for, file["id"], file["name"], file["modifiedTime"])
+
+    def _load(self, crm_for: Callable[[str], SheetsCRM], spreadsheet_id: str, name: str, modified_time: str):
+        try:
+            tables, loaded = crm_for(spreadsheet_id).tables(refresh=True), True
+        except SheetsError as e:
+            # Listed but unreadable for now; keep the name and what we had, retry next refresh
+            logger.warning("Catalog: could not read tabs of %s: %s", spreadsheet_id, e)
+            known = self.spreadsheets.get(spreadsheet_id)
+            tables, loaded = (known.tables if known is not None else {}), False
+        self.spreadsheets[spreadsheet_id] = Spreadsheet(spreadsheet_id, name, modified_time, tables, loaded)
+        self.resolver.update_spreadsheet(spreadsheet_id, name, tables)
+
+    def find(self, query: str, spreadsheet_id: str = None, limit: int = 10) -> List[Tuple[Spreadsheet, Table]]:
+        """
+        Tables best matching `query` (see `TableResolver.resolve`); every table
+        if nothing matches or the query is empty.
+        """
+        matches = self.resolver.resolve(query, spreadsheet_id, limit) if query.strip() else []
+        spreadsheets = dict(self.spreadsheets)
+        found = [(spreadsheets[m.spreadsheet_id], m.table) for m in matches if m.spreadsheet_id in spreadsheets]
+        return found or [
+            (spreadsheet, table) for spreadsheet in spreadsheets.values()
+            if spreadsheet_id is None or spreadsheet.id == spreadsheet_id
+            for table in spreadsheet.tables.values()
+        ]
+
+_catalogs: "OrderedDict[str, Catalog]" = OrderedDict()
+_catalogs_lock = threading.Lock()
+
+def get_catalog(user: str) -> Catalog:
+    """The catalog of one user (by user id, or access token if there is none)"""
+    with _catalogs_lock:
+        catalog = _catalogs.get(user)
+        if catalog is None:
+            catalog = _catalogs[user] = Catalog()
+            while len(_catalogs) > CATALOG_MAX_USERS:
+                _catalogs.popitem(last=False)
+        _catalogs.move_to_end(user)
+        return catalog
+
+def clear_catalogs():
+    with _catalogs_lock:
+        _catalogs.clear()
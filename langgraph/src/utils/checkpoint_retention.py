@@ -0,0 +1,196 @@
+"""
+Retention for the checkpoint database: deletes old checkpoints and their
+writes, then hands the freed pages back to the filesystem.
+
+The graph saves a full checkpoint after every superstep and nothing ever
+removes one. A policy keeps, per thread and checkpoint namespace:
+
+- the last `keep_last` checkpoints,
+- nothing but the latest checkpoint once checkpoints are older than
+  `latest_only_after`,
+- nothing at all for threads with no checkpoint newer than `drop_inactive_after`
+  (off unless `CHECKPOINT_INACTIVE_DAYS` is set: it deletes conversations).
+
+The latest checkpoint of a thread that is kept is never deleted, so every
+conversation still resumes where it was, and neither are the parents that a
+kept checkpoint stored as a delta is read from (see utils.checkpoint_serde).
+Only checkpoints seen when the deletes were planned are deleted, so one that
+a resumed conversation writes meanwhile is kept. Deletes go in short
+transactions of `batch` checkpoints so a running agent is not blocked, and
+the file shrinks with incremental vacuum. Run it from cron or leave it running:
+
+    cd langgraph/src && python -m utils.checkpoint_retention state_db/example.db --keep-last 20
+    python -m utils.checkpoint_retention state_db/example.db --every 3600
+"""
+import argparse
+import os
+import sqlite3
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+CHECKPOINT_KEEP_LAST = int(os.getenv("CHECKPOINT_KEEP_LAST", 20))
+CHECKPOINT_LATEST_ONLY_DAYS = float(os.getenv("CHECKPOINT_LATEST_ONLY_DAYS", 7))
+CHECKPOINT_INACTIVE_DAYS = os.getenv("CHECKPOINT_INACTIVE_DAYS", "off")  # days, or "off"
+CHECKPOINT_DELETE_BATCH = int(os.getenv("CHECKPOINT_DELETE_BATCH", 500))  # checkpoints per transaction
+CHECKPOINT_VACUUM_PAGES = int(os.getenv("CHECKPOINT_VACUUM_PAGES", 1000))  # pages per incremental vacuum step
+
+# Checkpoint ids are version 6 UUIDs: 100 ns ticks since the Gregorian calendar started
+_UUID_EPOCH = datetime(1582, 10, 15, tzinfo=timezone.utc)
+
+def checkpoint_time(checkpoint_id: str) -> datetime:
+    """When a checkpoint was created, read from its id"""
+    high = uuid.UUID(checkpoint_id).int >> 64
+    ticks = ((high >> 16) << 12) | (high & 0xFFF)
+    return _UUID_EPOCH + timedelta(microseconds=ticks // 10)
+
+def _days(value: str) -> Optional[timedelta]:
+    return None if value == "off" else timedelta(days=float(value))
+
+@dataclass
+class RetentionPolicy:
+    keep_last: Optional[int] = CHECKPOINT_KEEP_LAST
+    latest_only_after: Optional[timedelta] = timedelta(days=CHECKPOINT_LATEST_ONLY_DAYS)
+    drop_inactive_after: Optional[timedelta] = _days(CHECKPOINT_INACTIVE_DAYS)
+
+@dataclass
+class RetentionReport:
+    checkpoints: int = 0
+    writes: int = 0
+    threads: int = 0  # idle, every checkpoint seen deleted
+    bytes_before: int = 0
+    bytes_after: int = 0
+
+    @property
+    def reclaimed(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+    def __str__(self) -> str:
+        return (f"Deleted {self.checkpoints} checkpoint(s) and {self.writes} write(s), "
+                f"{self.threads} thread(s) dropped; {self.bytes_before:,} -> {self.bytes_after:,} bytes "
+                f"({self.reclaimed:,} reclaimed)")
+
+Key = Tuple[str, str, str]  # thread_id, checkpoint_ns, checkpoint_id
+
+def plan(conn: sqlite3.Connection, policy: RetentionPolicy, now: Optional[datetime] = None
+         ) -> Tuple[List[Key], List[str]]:
+    """Checkpoints to delete, and the threads they include every checkpoint of"""
+    now = now or datetime.now(timezone.utc)
+    # Newest first, as SqliteSaver orders them to find a thread's latest checkpoint
+    rows = conn.execute(
+        "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type FROM checkpoints "
+        "ORDER BY thread_id, checkpoint_ns, checkpoint_id DESC"
+    )
+    threads: Dict[str, Dict[str, List[str]]] = {}
+    bases: Dict[Tuple[str, str], Dict[str, str]] = {}  # delta -> the parent it is stored against
+    for thread_id, checkpoint_ns, checkpoint_id, parent_id, type_ in rows:
+        threads.setdefault(thread_id, {}).setdefault(checkpoint_ns, []).append(checkpoint_id)
+        if type_ and type_.endswith("+delta"):
+            bases.setdefault((thread_id, checkpoint_ns), {})[checkpoint_id] = parent_id
+
+    doomed: List[Key] = []
+    dropped: List[str] = []
+    for thread_id, namespaces in threads.items():
+        if policy.drop_inactive_after is not None:
+            active = max(checkpoint_time(ids[0]) for ids in namespaces.values())
+            if now - active > policy.drop_inactive_after:
+                dropped.append(thread_id)
+                doomed.extend((thread_id, checkpoint_ns, checkpoint_id)
+                              for checkpoint_ns, ids in namespaces.items() for checkpoint_id in ids)
+                continue
+        for checkpoint_ns, ids in namespaces.items():
+            kept = ids[:1]
+            for n, checkpoint_id in enumerate(ids[1:], start=2):
+                if policy.keep_last is not None and n > policy.keep_last:
+                    continue
+                if (policy.latest_only_after is not None
+                        and now - checkpoint_time(checkpoint_id) > policy.latest_only_after):
+                    continue
+                kept.append(checkpoint_id)
+            needed = set(kept)
+            delta_bases = bases.get((thread_id, checkpoint_ns), {})
+            for checkpoint_id in kept:
+                # A base already needed is kept itself or has had its own bases walked
+                while checkpoint_id in delta_bases and delta_bases[checkpoint_id] not in needed:
+                    checkpoint_id = delta_bases[checkpoint_id]
+                    needed.add(checkpoint_id)
+            doomed.extend((thread_id, checkpoint_ns, checkpoint_id) for checkpoint_id in ids
+                          if checkpoint_id not in needed)
+    return doomed, dropped
+
+def file_size(path: str) -> int:
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+def enable_incremental_vacuum(conn: sqlite3.Connection) -> bool:
+    """Switch the database to incremental vacuum; True if it needed the one-off full VACUUM"""
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("VACUUM")  # the mode only takes effect on a rebuilt file
+    return True
+
+def incremental_vacuum(conn: sqlite3.Connection, pages: int = CHECKPOINT_VACUUM_PAGES):
+    """Truncate the free pages off the end of the file, `pages` per transaction"""
+    while conn.execute("PRAGMA freelist_count").fetchone()[0]:
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+    # In WAL mode the shrink reaches the database file at the next checkpoint
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+def _delete(conn: sqlite3.Connection, table: str, where: str, params: List[tuple]) -> int:
+    cur = conn.executemany(f"DELETE FROM {table} WHERE {where}", params)
+    return cur.rowcount
+
+def apply_retention(path: str, policy: Optional[RetentionPolicy] = None, batch: int = CHECKPOINT_DELETE_BATCH,
+                    now: Optional[datetime] = None, vacuum: bool = True) -> RetentionReport:
+    """Delete what `policy` does not keep from the checkpoint database at `path`"""
+    policy = policy or RetentionPolicy()
+    report = RetentionReport(bytes_before=file_size(path))
+    conn = sqlite3.connect(path, isolation_level=None)  # autocommit; transactions below are explicit
+    try:
+        conn.execute("PRAGMA busy_timeout=5000")
+        doomed, dropped = plan(conn, policy, now)
+        report.threads = len(dropped)
+        key = "thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?"
+        for start in range(0, len(doomed), batch):
+            keys = doomed[start:start + batch]
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                report.checkpoints += _delete(conn, "checkpoints", key, keys)
+                report.writes += _delete(conn, "writes", key, keys)
+        if vacuum:
+            if enable_incremental_vacuum(conn):
+                print("Enabled incremental vacuum on", path)
+            incremental_vacuum(conn)
+    finally:
+        conn.close()
+    report.bytes_after = file_size(path)
+    return report
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Delete old checkpoints and vacuum the checkpoint database")
+    parser.add_argument("path", help="SQLite checkpoint database, e.g. state_db/example.db")
+    parser.add_argument("--keep-last", default=str(CHECKPOINT_KEEP_LAST),
+                        help="checkpoints kept per thread, or 'off'")
+    parser.add_argument("--latest-only-days", default=str(CHECKPOINT_LATEST_ONLY_DAYS),
+                        help="only the latest checkpoint is kept once older than this, or 'off'")
+    parser.add_argument("--inactive-days", default=CHECKPOINT_INACTIVE_DAYS,
+                        help="threads idle this long are dropped, or 'off'")
+    parser.add_argument("--batch", type=int, default=CHECKPOINT_DELETE_BATCH)
+    parser.add_argument("--no-vacuum", action="store_true")
+    parser.add_argument("--every", type=float, help="keep running, applying retention every this many seconds")
+    args = parser.parse_args(argv)
+    policy = RetentionPolicy(
+        keep_last=None if args.keep_last == "off" else int(args.keep_last),
+        latest_only_after=_days(args.latest_only_days),
+        drop_inactive_after=_days(args.inactive_days),
+    )
+    while True:
+        print(apply_retention(args.path, policy, batch=args.batch, vacuum=not args.no_vacuum))
+        if args.every is None:
+            return
+        time.sleep(args.every)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Compact checkpoint storage: msgpack compressed with zstd and a shared
+dictionary, and `messages` stored as a delta against the parent checkpoint.
+
+The graph checkpoints the whole conversation after every step, so most of a
+checkpoint is the parent's messages again. `DeltaCheckpoints` (a mixin for
+the SqliteSaver classes, see utils.checkpointer) stores only how many of the
+parent's messages are kept and the messages after them; reading a checkpoint
+reads its parents back to the last full one. A full checkpoint is stored at
+least every `CHECKPOINT_KEYFRAME_EVERY` steps, and whenever the parent is not
+the checkpoint this process last wrote for the thread (a fork, or a restart).
+
+The serialization type in the checkpoints table says how a blob is stored:
+"msgpack", plus "+zstd1" when compressed with dictionary 1, plus "+delta" for
+a delta. Plain "msgpack" rows, as written by SqliteSaver, still load.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, NamedTuple, Optional, Tuple
+
+import ormsgpack
+import zstandard
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+CHECKPOINT_SERDE = os.getenv("CHECKPOINT_SERDE", "default")
+CHECKPOINT_ZSTD_LEVEL = int(os.getenv("CHECKPOINT_ZSTD_LEVEL", 3))
+CHECKPOINT_KEYFRAME_EVERY = int(os.getenv("CHECKPOINT_KEYFRAME_EVERY", 16))  # longest chain of deltas
+CHECKPOINT_MESSAGES_CACHE = int(os.getenv("CHECKPOINT_MESSAGES_CACHE", 256))  # checkpoints' messages kept decoded
+
+# Strings every checkpoint of this graph repeats, msgpack-encoded the way they appear in blobs.
+# Compressed blobs can only be read with the exact same bytes: never edit this, add a version 2.
+_DICTIONARY_V1 = ormsgpack.packb([
+    "channel_values", "channel_versions", "versions_seen", "updated_channels", "messages",
+    "__start__", "__input__", "__interrupt__", "branch:to:assistant", "branch:to:tools",
+    "assistant", "tools", "v", "ts", "id", "pending_sends",
+    "langchain_core.messages.human", "HumanMessage", "langchain_core.messages.system", "SystemMessage",
+    "langchain_core.messages.ai", "AIMessage", "langchain_core.messages.tool", "ToolMessage",
+    "model_validate_json", "content", "additional_kwargs", "response_metadata", "type", "name",
+    "example", "human", "ai", "tool", "system", "tool_calls", "invalid_tool_calls", "usage_metadata",
+    "tool_call_id", "artifact", "status", "success", "error", "args", "tool_call", "function",
+    "arguments", "refusal", "token_usage", "completion_tokens", "prompt_tokens", "total_tokens",
+    "completion_tokens_details", "prompt_tokens_details", "accepted_prediction_tokens", "audio_tokens",
+    "reasoning_tokens", "rejected_prediction_tokens", "cached_tokens", "model_name", "system_fingerprint",
+    "finish_reason", "stop", "logprobs", "input_tokens", "output_tokens", "input_token_details",
+    "output_token_details", "audio", "cache_read", "reasoning", "model_provider", "openai", "lc_run--",
+    "call_", "chatcmpl-", "gpt-4o-2024-08-06", "gpt-4o-mini-2024-07-18",
+    "findtable", "getRow", "addRow", "updateRow", "deleteRow", "table", "where", "rows", "row_number",
+    "values", "spreadsheet_id", "Added ", " row(s) to ", "Updated row ", "Deleted ", "Not saved: ",
+    "Error: ", " Please fix your mistakes.", '{"', '": "', '", "', '"}', '[{"', '"}]',
+])
+_DICTIONARIES = {1: zstandard.ZstdCompressionDict(_DICTIONARY_V1, dict_type=zstandard.DICT_TYPE_RAWCONTENT)}
+_DICTIONARY = 1  # used for new blobs
+
+class MessagesDelta(NamedTuple):
+    """A checkpoint's messages: the first `keep` of its parent's, then `tail`"""
+    thread_id: str
+    checkpoint_ns: str
+    parent_id: str
+    keep: int
+    tail: list
+
+def _delta_of(obj: Any) -> Optional[MessagesDelta]:
+    if isinstance(obj, dict):
+        messages = obj.get("channel_values", {}).get("messages")
+        if isinstance(messages, MessagesDelta):
+            return messages
+    return None
+
+class CompactSerializer(JsonPlusSerializer):
+    """
+    JsonPlusSerializer's msgpack, zstd-compressed with a shared dictionary.
+
+    `parents(thread_id, checkpoint_ns, checkpoint_id)` returns the messages of
+    a stored checkpoint; it is set by the saver and needed to load deltas.
+    """
+
+    def __init__(self, level: int = CHECKPOINT_ZSTD_LEVEL, **kwargs):
+        super().__init__(**kwargs)
+        self.level = level
+        self.parents: Optional[Callable[[str, str, str], list]] = None
+        self._local = threading.local()  # zstd contexts are not thread-safe
+
+    def _compressor(self) -> zstandard.ZstdCompressor:
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._local.compressor = zstandard.ZstdCompressor(
+                level=self.level, dict_data=_DICTIONARIES[_DICTIONARY], write_content_size=True,
+            )
+        return compressor
+
+    def _decompressor(self, version: int) -> zstandard.ZstdDecompressor:
+        decompressors = self._local.__dict__.setdefault("decompressors", {})
+        if version not in decompressors:
+            decompressors[version] = zstandard.ZstdDecompressor(dict_data=_DICTIONARIES[version])
+        return decompressors[version]
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        suffix = ""
+        delta = _delta_of(obj)
+        if delta is not None:
+            stored = {"parent": [delta.thread_id, delta.checkpoint_ns, delta.parent_id], "keep": delta.keep,
+                      "tail": delta.tail}
+            obj = {**obj, "channel_values": {**obj["channel_values"], "messages": stored}}
+            suffix = "+delta"
+        type_, data = super().dumps_typed(obj)
+        if type_ != "msgpack":
+            return type_, data
+        compressed = self._compressor().compress(data)
+        if len(compressed) < len(data):
+            return f"msgpack+zstd{_DICTIONARY}{suffix}", compressed
+        return f"msgpack{suffix}", data
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, data_ = data
+        if not type_.startswith("msgpack+"):
+            return super().loads_typed(data)
+        parts = type_.split("+")
+        for part in parts[1:]:
+            if part.startswith("zstd"):
+                data_ = self._decompressor(int(part[4:])).decompress(data_)
+        obj = super().loads_typed(("msgpack", data_))
+        if "delta" in parts:
+            stored = obj["channel_values"]["messages"]
+            if self.parents is None:
+                raise ValueError("Checkpoint stored as a delta needs a saver to load its parent")
+            obj["channel_values"]["messages"] = self.parents(*stored["parent"])[:stored["keep"]] + stored["tail"]
+        return obj
+
+def common_prefix(before: list, after: list) -> int:
+    n = 0
+    for old, new in zip(before, after):
+        if old is not new and old != new:
+            break
+        n += 1
+    return n
+
+class DeltaCheckpoints:
+    """
+    Mixin for SqliteSaver and its subclasses: stores `messages` as a delta
+    against the parent checkpoint, with CompactSerializer.
+    """
+
+    def __init__(self, *args, keyframe_every: int = CHECKPOINT_KEYFRAME_EVERY, **kwargs):
+        kwargs.setdefault("serde", CompactSerializer())
+        super().__init__(*args, **kwargs)
+        self.serde.parents = self._messages_at
+        self.keyframe_every = keyframe_every
+        self._messages: "OrderedDict[tuple, list]" = OrderedDict()  # (thread, ns, checkpoint id) -> messages
+        self._heads: "OrderedDict[tuple, tuple]" = OrderedDict()  # (thread, ns) -> (last written id, chain length)
+        self._delta_lock = threading.Lock()
+
+    def _remember(self, cache: OrderedDict, key: tuple, value: Any):
+        with self._delta_lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > CHECKPOINT_MESSAGES_CACHE:
+                cache.popitem(last=False)
+
+    def _messages_at(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> list:
+        key = (thread_id, checkpoint_ns, checkpoint_id)
+        with self._delta_lock:
+            messages = self._messages.get(key)
+        if messages is not None:
+            return messages
+        # Called while loading a child checkpoint, so on the connection that read it
+        row = self.conn.execute(
+            "SELECT type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+            key,
+        ).fetchone()
+        if row is None:
+            raise ValueError(f"Parent checkpoint {checkpoint_id} of a delta is missing")
+        messages = self.serde.loads_typed(row)["channel_values"].get("messages", [])
+        self._remember(self._messages, key, messages)
+        return messages
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        parent_id = config["configurable"].get("checkpoint_id")
+        messages = checkpoint["channel_values"].get("messages")
+        stored, chain = checkpoint, 0
+        if isinstance(messages, list) and parent_id:
+            with self._delta_lock:
+                head = self._heads.get((thread_id, checkpoint_ns))
+                before = self._messages.get((thread_id, checkpoint_ns, parent_id))
+            if head and head[0] == parent_id and head[1] + 1 < self.keyframe_every and before is not None:
+                keep = common_prefix(before, messages)
+                if keep:
+                    delta = MessagesDelta(thread_id, checkpoint_ns, parent_id, keep, messages[keep:])
+                    stored = {**checkpoint, "channel_values": {**checkpoint["channel_values"], "messages": delta}}
+                    chain = head[1] + 1
+        saved = super().put(config, stored, metadata, new_versions)
+        if isinstance(messages, list):
+            self._remember(self._messages, (thread_id, checkpoint_ns, checkpoint["id"]), list(messages))
+            self._remember(self._heads, (thread_id, checkpoint_ns), (checkpoint["id"], chain))
+        return saved
@@ -0,0 +1,233 @@
+"""
+Checkpointers for the agent graph, chosen with `CHECKPOINTER`:
+
+- "sqlite" (default): langgraph's SqliteSaver on one shared connection. Every
+  read and write of every thread takes the same lock.
+- "pooled": PooledSqliteSaver, the same tables in WAL mode with a pool of
+  reader connections and one writer thread that commits whatever writes have
+  queued up in a single transaction. Sync and async graphs can both use it.
+
+`CHECKPOINT_SERDE` chooses how checkpoints are stored: "default" as
+SqliteSaver does, or "compact" (see utils.checkpoint_serde), which SqliteSaver
+itself cannot read back.
+"""
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Iterator, List, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from utils.checkpoint_serde import CHECKPOINT_SERDE, DeltaCheckpoints
+
+CHECKPOINTER = os.getenv("CHECKPOINTER", "sqlite")
+CHECKPOINT_READERS = int(os.getenv("CHECKPOINT_READERS", 8))
+CHECKPOINT_MAX_BATCH = int(os.getenv("CHECKPOINT_MAX_BATCH", 256))  # writes per commit
+
+class _Statements:
+    """Stands in for a cursor on the write path: records statements for the writer thread"""
+
+    def __init__(self):
+        self.statements: List[tuple] = []
+
+    def execute(self, sql: str, params: Sequence = ()):
+        self.statements.append((sql, [tuple(params)]))
+
+    def executemany(self, sql: str, rows):
+        self.statements.append((sql, [tuple(row) for row in rows]))
+
+    def close(self):
+        pass
+
+class PooledSqliteSaver(SqliteSaver):
+    """
+    SqliteSaver whose reads use a pool of connections and whose writes are
+    group-committed by one writer thread.
+
+    Reads and writes keep SqliteSaver's SQL and serialization, so the database
+    stays readable by it. A write returns once its transaction has committed;
+    writes that arrive while a commit is under way go into the next one, each
+    in its own savepoint so one failing write does not undo the others.
+    """
+
+    def __init__(self, path: str, readers: int = CHECKPOINT_READERS, max_batch: int = CHECKPOINT_MAX_BATCH, **kwargs):
+        if path == ":memory:":
+            raise ValueError("PooledSqliteSaver needs a database file; its connections cannot share :memory:")
+        self._reading = threading.local()  # reader connections checked out by this thread
+        writer = self._connect(path)
+        writer.isolation_level = None  # transactions are managed by the writer thread
+        super().__init__(writer, **kwargs)
+        self.path = path
+        self.max_batch = max_batch
+        with self.lock:
+            self.setup()
+        self._readers: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        for _ in range(readers):
+            self._readers.put(self._connect(path))
+        self._writes: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="checkpoint-writer", daemon=True)
+        self._writer.start()
+        # Async methods run the sync ones here; writers mostly wait for the group commit
+        self._executor = ThreadPoolExecutor(max_workers=readers * 4, thread_name_prefix="checkpoint")
+        self.commits = 0
+        self.writes = 0
+
+    @staticmethod
+    def _connect(path: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # With WAL, NORMAL only loses the last commits on power loss, never corrupts
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # SqliteSaver.list opens a second cursor on `self.conn` while reading
+        reading = getattr(self._reading, "conns", None)
+        return reading[-1] if reading else self._writer_conn
+
+    @conn.setter
+    def conn(self, conn: sqlite3.Connection):
+        self._writer_conn = conn
+
+    @contextmanager
+    def cursor(self, transaction: bool = True) -> Iterator[Any]:
+        if transaction:
+            statements = _Statements()
+            yield statements
+            if statements.statements:
+                self._submit(statements.statements).result()
+            return
+        conn = self._readers.get()
+        stack = self._reading.__dict__.setdefault("conns", [])
+        stack.append(conn)
+        cur = conn.cursor()
+        try:
+            yield cur
+        finally:
+            cur.close()
+            stack.pop()
+            self._readers.put(conn)
+
+    def _submit(self, statements: List[tuple]) -> Future:
+        if not self._writer.is_alive():
+            raise RuntimeError("Checkpointer is closed")
+        future: Future = Future()
+        self._writes.put((statements, future))
+        return future
+
+    def _write_loop(self):
+        while True:
+            item = self._writes.get()
+            if item is None:
+                return
+            batch = [item]
+            # Everything that queued up during the last commit goes into this one
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._writes.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._commit(batch)
+                    return
+                batch.append(item)
+            self._commit(batch)
+
+    def _commit(self, batch: List[tuple]):
+        conn = self._writer_conn
+        errors: List[Optional[BaseException]] = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for statements, _ in batch:
+                conn.execute("SAVEPOINT write")
+                try:
+                    for sql, rows in statements:
+                        conn.executemany(sql, rows)
+                except sqlite3.Error as e:
+                    conn.execute("ROLLBACK TO write")
+                    errors.append(e)
+                else:
+                    errors.append(None)
+                conn.execute("RELEASE write")
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            errors = [e] * len(batch)
+        self.commits += 1
+        self.writes += len(batch)
+        for (_, future), error in zip(batch, errors):
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+    def close(self):
+        """Finish queued writes and close every connection"""
+        if self._writer.is_alive():
+            self._writes.put(None)
+            self._writer.join()
+        self._executor.shutdown(wait=True)
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+        self._writer_conn.close()
+
+    def __enter__(self) -> "PooledSqliteSaver":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Async API: the sync methods on worker threads
+
+    async def _run(self, func, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, lambda: func(*args, **kwargs))
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await self._run(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[dict] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None
+                    ) -> AsyncIterator[CheckpointTuple]:
+        tuples = await self._run(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for checkpoint_tuple in tuples:
+            yield checkpoint_tuple
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await self._run(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[tuple], task_id: str,
+                          task_path: str = "") -> None:
+        await self._run(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await self._run(self.delete_thread, thread_id)
+
+    async def aget_delta_channel_history(self, *, config: RunnableConfig, channels: Sequence[str]):
+        return await self._run(self.get_delta_channel_history, config=config, channels=channels)
+
+class CompactSqliteSaver(DeltaCheckpoints, SqliteSaver):
+    pass
+
+class CompactPooledSqliteSaver(DeltaCheckpoints, PooledSqliteSaver):
+    pass
+
+def make_checkpointer(path: str, kind: str = CHECKPOINTER, serde: str = CHECKPOINT_SERDE):
+    """The checkpointer `kind` ("sqlite" or "pooled") on the database at `path`, storing `serde`"""
+    if serde not in ("default", "compact"):
+        raise ValueError(f"Unknown checkpoint serialization {serde!r}; use 'default' or 'compact'")
+    compact = serde == "compact"
+    if kind == "pooled":
+        return (CompactPooledSqliteSaver if compact else PooledSqliteSaver)(path)
+    if kind == "sqlite":
+        return (CompactSqliteSaver if compact else SqliteSaver)(sqlite3.connect(path, check_same_thread=False))
+    raise ValueError(f"Unknown checkpointer {kind!r}; use 'sqlite' or 'pooled'")
@@ -1,3 +1,155 @@
+"""
+CRM tools for the ReAct agent, backed by Google Sheets (see `utils.sheets`).
 
-def find_table():
-    
+The spreadsheet and the user's Google access token come from the run config:
+
+    {"configurable": {"spreadsheet_id": "...", "google_access_token": "..."}}
+
+Google API calls per tool:
+
+- getRow: a Drive version check, plus a batchGet unless `snapshot_cache`
+  holds the table at that version. Our own writes are patched into the
+  snapshot, so a lookup after one is still served from it.
+- addRow, updateRow, deleteRow: one batchUpdate. Inside the agent graph the
+  writes of a tool step are queued and sent together, so the step pays it
+  once (`utils.mutation_buffer`). Writing also needs the spreadsheet's tabs
+  and column names: 2 more calls, once per spreadsheet, unless the user's
+  catalog has already loaded them.
+- findtable: none while the user's catalog of spreadsheets (`utils.catalog`)
+  is fresh; it is refreshed from Drive when it gets old.
+
+`table_hint`, called before every model turn, never waits on Google: it only
+reads a fresh catalog, and starts a background refresh of a stale one.
+"""
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from langchain_core.messages import BaseMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
+
+from utils.catalog import Catalog, get_catalog
+from utils.mutation_buffer import get_mutations
+from utils.sheets import SheetsCRM, SheetsError
+from utils.snapshot_cache import SnapshotCache
+from utils.tool_executor import async_tool
+
+MAX_ROWS = 50  # rows returned to the model per lookup
+
+# Shared by every user of a spreadsheet; each lookup is still checked against the file version
+snapshot_cache = SnapshotCache()
+
+@lru_cache(maxsize=256)
+def _crm(spreadsheet_id: str, access_token: str) -> SheetsCRM:
+    # One CRM per spreadsheet and token, so the table catalog is loaded once
+    return SheetsCRM(spreadsheet_id, access_token, cache=snapshot_cache)
+
+def get_crm(config: RunnableConfig) -> SheetsCRM:
+    configurable = (config or {}).get("configurable", {})
+    spreadsheet_id = configurable.get("spreadsheet_id")
+    access_token = configurable.get("google_access_token")
+    if not spreadsheet_id or not access_token:
+        raise SheetsError("No CRM spreadsheet is connected for this user")
+    return _crm(spreadsheet_id, access_token)
+
+def user_catalog(config: RunnableConfig, wait: bool = True) -> Catalog:
+    """
+    The user's spreadsheet catalog, refreshed if it has got old. With
+    `wait=False` the refresh runs in the background and the catalog is
+    returned as it is.
+    """
+    configurable = (config or {}).get("configurable", {})
+    access_token = configurable.get("google_access_token")
+    if not access_token:
+        raise SheetsError("No Google account is connected for this user")
+    catalog = get_catalog(configurable.get("user_id") or access_token)
+    crm_for = lambda file_id: _crm(file_id, access_token)
+    if wait:
+        catalog.refresh(access_token, crm_for)
+    else:
+        catalog.refresh_in_background(access_token, crm_for)
+    return catalog
+
+def table_hint(messages: List[BaseMessage], config: RunnableConfig) -> Optional[str]:
+    """
+    A note for the model naming the table the user's latest message is about,
+    when the catalog resolves it unambiguously, so it can skip calling findtable.
+    None while the catalog is stale: this turn does not wait for it to refresh.
+    """
+    if not messages or not isinstance(messages[-1], HumanMessage) or not isinstance(messages[-1].content, str):
+        return None
+    try:
+        catalog = user_catalog(config, wait=False)
+    except SheetsError:
+        return None
+    if catalog.stale():
+        return None
+    spreadsheet_id = (config or {}).get("configurable", {}).get("spreadsheet_id")
+    match = catalog.resolver.unambiguous(messages[-1].content, spreadsheet_id)
+    if match is None:
+        return None
+    where = "" if spreadsheet_id else f" of spreadsheet {match.spreadsheet_name} ({match.spreadsheet_id})"
+    return (
+        f"The user is most likely referring to the table {match.table.title!r}{where}, "
+        f"with columns: {', '.join(match.table.columns)}. Use it without calling findtable "
+        "unless the user says otherwise."
+    )
+
+def findtable(query: str, config: RunnableConfig) -> str:
+    """Finds the tables in the CRM whose name matches the query, with their columns.
+    Pass an empty query to list every table.
+    """
+    spreadsheet_id = (config or {}).get("configurable", {}).get("spreadsheet_id")
+    found = user_catalog(config).find(query, spreadsheet_id)
+    if spreadsheet_id is None:
+        # No CRM chosen yet: search every spreadsheet of the user
+        return "\n".join(
+            f"{spreadsheet.name} ({spreadsheet.id}) / {table.title}: {', '.join(table.columns)}"
+            for spreadsheet, table in found
+        ) or "No spreadsheets found"
+    tables = [table for _, table in found]
+    if not tables:
+        # Not in the Drive listing (yet): ask the spreadsheet itself
+        query = query.strip().lower()
+        tables = list(get_crm(config).tables().values())
+        tables = [table for table in tables if query in table.title.lower()] or tables
+    return "\n".join(f"{table.title}: {', '.join(table.columns)}" for table in tables)
+
+def getRow(table: str, where: Dict[str, str], config: RunnableConfig,
+           search: Optional[Dict[str, str]] = None) -> List[dict]:
+    """Retrieves the rows of a table whose columns have exactly the `where` values, ignoring case,
+    accents and spacing. Pass an empty `where` to get every row. Each row has its row number under "_row".
+    `search` instead matches the start of any word of a column: {"name": "lov"} finds "Ada Lovelace",
+    and {"name": "al"} finds both "Alan" and "Alice", so check which row is meant before changing it.
+    """
+    return get_crm(config).get_rows({table: where}, limit=MAX_ROWS, search={table: search or {}})[table]
+
+def addRow(table: str, rows: List[Dict[str, str]], config: RunnableConfig) -> str:
+    """Adds rows to a table. Each row maps column names to values; missing columns stay empty.
+    """
+    crm, mutations = get_crm(config), get_mutations(config)
+    if mutations is not None:
+        return mutations.add_rows(crm, table, rows).placeholder
+    count = crm.add_rows({table: rows})
+    return f"Added {count} row(s) to {table}"
+
+def updateRow(table: str, row_number: int, values: Dict[str, str], config: RunnableConfig) -> str:
+    """Changes columns of one row of a table, by the row number ("_row") returned by getRow.
+    Columns not in `values` keep their value.
+    """
+    crm, mutations = get_crm(config), get_mutations(config)
+    if mutations is not None:
+        return mutations.update_row(crm, table, row_number, values).placeholder
+    crm.update_rows({table: {row_number: values}})
+    return f"Updated row {row_number} of {table}"
+
+def deleteRow(table: str, row_numbers: List[int], config: RunnableConfig) -> str:
+    """Deletes rows from a table, by the row numbers ("_row") returned by getRow.
+    Row numbers from one step all refer to the table as it was before the step.
+    """
+    crm, mutations = get_crm(config), get_mutations(config)
+    if mutations is not None:
+        return mutations.delete_rows(crm, table, row_numbers).placeholder
+    count = crm.delete_rows({table: row_numbers})
+    return f"Deleted {count} row(s) from {table}"
+
+tools = [async_tool(tool) for tool in (findtable, getRow, addRow, updateRow, deleteRow)]
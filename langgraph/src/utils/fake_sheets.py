@@ -0,0 +1,232 @@
+"""
+In-process stand-in for the parts of the Google Sheets API (and the Drive
+file metadata) the CRM tools use, for tests and benchmarks:
+
+    server = FakeSheetsServer()
+    server.add_spreadsheet("crm", {"Contacts": [["name", "email"], ["Ada", "ada@example.com"]]})
+    crm = SheetsCRM("crm", "token", client=server.client())
+
+Every request is recorded in `server.requests`; `latency` adds a delay per
+request to mimic a real round trip. Drive's `files.list` pages through the
+spreadsheets, filtered by `modifiedTime > '...'` if the query asks.
+"""
+import json
+import re
+import time
+from datetime import datetime, timezone
+from typing import Dict, List
+from urllib.parse import unquote
+
+import httpx
+
+RANGE_RE = re.compile(r"^(?:'((?:[^']|'')*)'|([^!]+))(?:!(\d+):(\d+))?$")
+
+class FakeSheetsServer:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.spreadsheets: Dict[str, Dict[str, dict]] = {}
+        self.names: Dict[str, str] = {}
+        self.versions: Dict[str, int] = {}  # Drive file version, bumped on every change
+        self.modified: Dict[str, int] = {}  # tick of the last change, across all files
+        self.requests: List[tuple] = []
+        self._next_sheet_id = 1
+        self._clock = 0
+
+    def add_spreadsheet(self, spreadsheet_id: str, sheets: Dict[str, List[list]], name: str = None):
+        """Create a spreadsheet from sheet title -> rows (first row = column names)"""
+        self.spreadsheets[spreadsheet_id] = {}
+        self.names[spreadsheet_id] = name or spreadsheet_id
+        self.versions[spreadsheet_id] = 0
+        self._touch(spreadsheet_id)
+        for title, rows in sheets.items():
+            self.add_sheet(spreadsheet_id, title, rows)
+
+    def remove_spreadsheet(self, spreadsheet_id: str):
+        for files in (self.spreadsheets, self.names, self.versions, self.modified):
+            del files[spreadsheet_id]
+
+    def _touch(self, spreadsheet_id: str):
+        self.versions[spreadsheet_id] += 1
+        self._clock += 1
+        self.modified[spreadsheet_id] = self._clock
+
+    def _modified_time(self, spreadsheet_id: str) -> str:
+        modified = datetime.fromtimestamp(1_700_000_000 + self.modified[spreadsheet_id], tz=timezone.utc)
+        return modified.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+    def add_sheet(self, spreadsheet_id: str, title: str, rows: List[list]):
+        self.spreadsheets[spreadsheet_id][title] = {
+            "sheetId": self._next_sheet_id,
+            "rows": [[str(cell) for cell in row] for row in rows],
+        }
+        self._next_sheet_id += 1
+        self._touch(spreadsheet_id)
+
+    def edit(self, spreadsheet_id: str, title: str, rows: List[list]):
+        """Change a sheet behind the client's back, as another user would"""
+        self.spreadsheets[spreadsheet_id][title]["rows"] = [[str(cell) for cell in row] for row in rows]
+        self._touch(spreadsheet_id)
+
+    def rows(self, spreadsheet_id: str, title: str) -> List[list]:
+        return self.spreadsheets[spreadsheet_id][title]["rows"]
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    def client(self) -> httpx.Client:
+        return httpx.Client(transport=self.transport())
+
+    def async_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=self.transport())
+
+    def count(self, kind: str = None) -> int:
+        """Requests made so far, optionally only those of one kind
+        ("get", "batchGet", "batchUpdate", "drive", "driveList")"""
+        return len([r for r in self.requests if kind is None or r[0] == kind])
+
+    # Request handling
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        if self.latency:
+            time.sleep(self.latency)
+        if not request.headers.get("Authorization", "").startswith("Bearer "):
+            return self._error(401, "Request is missing required authentication credential")
+        path = unquote(request.url.path)
+        if path == "/drive/v3/files" and request.method == "GET":
+            return self._drive_list(request.url.params)
+        drive = re.match(r"^/drive/v3/files/([^/]+)$", path)
+        if drive is not None and request.method == "GET":
+            return self._drive_file(drive.group(1))
+        match = re.match(r"^/v4/spreadsheets/([^/:]+)(/values:batchGet|:batchUpdate)?$", path)
+        if match is None:
+            return self._error(404, f"Unknown method {path}")
+        spreadsheet_id, method = match.groups()
+        spreadsheet = self.spreadsheets.get(spreadsheet_id)
+        if spreadsheet is None:
+            return self._error(404, "Requested entity was not found.")
+
+        if method is None and request.method == "GET":
+            self.requests.append(("get", spreadsheet_id))
+            return httpx.Response(200, json=self._get(spreadsheet_id, spreadsheet))
+        if method == "/values:batchGet" and request.method == "GET":
+            self.requests.append(("batchGet", spreadsheet_id))
+            return self._batch_get(spreadsheet_id, spreadsheet, request.url.params.get_list("ranges"))
+        if method == ":batchUpdate" and request.method == "POST":
+            self.requests.append(("batchUpdate", spreadsheet_id))
+            return self._batch_update(spreadsheet_id, spreadsheet, json.loads(request.content)["requests"])
+        return self._error(405, "Method not allowed")
+
+    def _error(self, status: int, message: str) -> httpx.Response:
+        return httpx.Response(status, json={"error": {"code": status, "message": message}})
+
+    def _drive_file(self, file_id: str) -> httpx.Response:
+        if file_id not in self.spreadsheets:
+            return self._error(404, f"File not found: {file_id}.")
+        self.requests.append(("drive", file_id))
+        return httpx.Response(200, json={
+            "id": file_id,
+            "version": str(self.versions[file_id]),
+            "modifiedTime": self._modified_time(file_id),
+        })
+
+    def _drive_list(self, params) -> httpx.Response:
+        self.requests.append(("driveList", params.get("pageToken")))
+        query = params.get("q", "")
+        if "mimeType='application/vnd.google-apps.spreadsheet'" not in query:
+            return self._error(400, "Only spreadsheet listings are supported")
+        since = re.search(r"modifiedTime > '([^']+)'", query)
+        files = [
+            {"id": file_id, "name": self.names[file_id], "modifiedTime": self._modified_time(file_id)}
+            for file_id in sorted(self.spreadsheets, key=self.modified.get)
+            if since is None or self._modified_time(file_id) > since.group(1)
+        ]
+        page_size = int(params.get("pageSize", 100))
+        start = int(params.get("pageToken") or 0)
+        page = {"files": files[start:start + page_size]}
+        if start + page_size < len(files):
+            page["nextPageToken"] = str(start + page_size)
+        return httpx.Response(200, json=page)
+
+    def _get(self, spreadsheet_id: str, spreadsheet: dict) -> dict:
+        return {
+            "spreadsheetId": spreadsheet_id,
+            "sheets": [
+                {"properties": {
+                    "sheetId": sheet["sheetId"],
+                    "title": title,
+                    "gridProperties": {
+                        "rowCount": len(sheet["rows"]),
+                        "columnCount": max((len(row) for row in sheet["rows"]), default=0),
+                    },
+                }}
+                for title, sheet in spreadsheet.items()
+            ],
+        }
+
+    def _batch_get(self, spreadsheet_id: str, spreadsheet: dict, ranges: List[str]) -> httpx.Response:
+        value_ranges = []
+        for a1 in ranges:
+            match = RANGE_RE.match(a1)
+            title = match and (match.group(1).replace("''", "'") if match.group(1) is not None else match.group(2))
+            if not match or title not in spreadsheet:
+                return self._error(400, f"Unable to parse range: {a1}")
+            rows = spreadsheet[title]["rows"]
+            if match.group(3):
+                first, last = int(match.group(3)), int(match.group(4))
+                rows = rows[first - 1:last]
+            value_ranges.append({"range": a1, "majorDimension": "ROWS", "values": self._trim(rows)})
+        return httpx.Response(200, json={"spreadsheetId": spreadsheet_id, "valueRanges": value_ranges})
+
+    @staticmethod
+    def _trim(rows: List[list]) -> List[list]:
+        # Like the real API: no trailing empty cells or rows
+        trimmed = []
+        for row in rows:
+            row = list(row)
+            while row and row[-1] == "":
+                row.pop()
+            trimmed.append(row)
+        while trimmed and not trimmed[-1]:
+            trimmed.pop()
+        return trimmed
+
+    def _batch_update(self, spreadsheet_id: str, spreadsheet: dict, requests: List[dict]) -> httpx.Response:
+        by_id = {sheet["sheetId"]: sheet for sheet in spreadsheet.values()}
+        # All or nothing, like the real API: validate before applying
+        for request in requests:
+            kind, body = next(iter(request.items()))
+            if kind not in ("appendCells", "updateCells", "deleteDimension"):
+                return self._error(400, f"Unsupported request {kind}")
+            sheet_id = {
+                "appendCells": lambda: body.get("sheetId"),
+                "updateCells": lambda: body.get("start", {}).get("sheetId"),
+                "deleteDimension": lambda: body.get("range", {}).get("sheetId"),
+            }[kind]()
+            if sheet_id not in by_id:
+                return self._error(400, f"No grid with id: {sheet_id}")
+        for request in requests:
+            kind, body = next(iter(request.items()))
+            if kind == "appendCells":
+                rows = by_id[body["sheetId"]]["rows"]
+                while rows and not any(cell != "" for cell in rows[-1]):
+                    rows.pop()
+                for row in body["rows"]:
+                    rows.append([
+                        str(next(iter(cell.get("userEnteredValue", {"": ""}).values())))
+                        for cell in row.get("values", [])
+                    ])
+            elif kind == "updateCells":
+                start = body["start"]
+                rows = by_id[start["sheetId"]]["rows"]
+                for r, row in enumerate(body["rows"], start.get("rowIndex", 0)):
+                    while len(rows) <= r:
+                        rows.append([])
+                    for c, cell in enumerate(row.get("values", []), start.get("columnIndex", 0)):
+                        rows[r].extend([""] * (c + 1 - len(rows[r])))
+                        rows[r][c] = str(next(iter(cell.get("userEnteredValue", {"": ""}).values())))
+            else:
+                rows = by_id[body["range"]["sheetId"]]["rows"]
+                del rows[body["range"]["startIndex"]:body["range"]["endIndex"]]
+        if requests:
+            self._touch(spreadsheet_id)
+        return httpx.Response(200, json={"spreadsheetId": spreadsheet_id, "replies": [{} for _ in requests]})
@@ -0,0 +1,152 @@
+"""
+Row writes the agent makes during one tool step, sent to Google as a single
+`batchUpdate` instead of one rate-limited call per tool call.
+
+The CRM tools queue their writes on the buffer in the run config
+(`configurable["crm_mutations"]`) and answer with a placeholder; the tools
+node flushes the buffer once every tool of the step has run and puts each
+write's real outcome in place of its placeholder (see `CRMToolNode`).
+"""
+import asyncio
+import threading
+from typing import Dict, List, Optional
+
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langchain_core.tools import BaseTool
+
+from utils.sheets import SheetsCRM, SheetsError
+from utils.tool_executor import CRM_TOOL_CONCURRENCY, ToolExecutor
+
+class Mutation:
+    """One queued write: kind is "append", "update" or "delete" """
+
+    def __init__(self, id: int, kind: str, table: str, payload):
+        self.id = id
+        self.kind = kind
+        self.table = table
+        self.payload = payload
+        self.result: Optional[str] = None
+
+    @property
+    def placeholder(self) -> str:
+        return f"Queued write #{self.id}; it is saved when this step's tool calls finish"
+
+    def describe(self) -> str:
+        if self.kind == "append":
+            return f"Added {len(self.payload)} row(s) to {self.table}"
+        if self.kind == "update":
+            return f"Updated row {self.payload[0]} of {self.table}"
+        return f"Deleted {len(set(self.payload))} row(s) from {self.table}"
+
+class MutationBuffer:
+    """
+    Writes queued against one spreadsheet. Row numbers are those the agent saw
+    before the step: they stay correct however the writes are combined, because
+    `SheetsCRM.mutate` sends updates, then deletes bottom-up, then appends.
+    """
+
+    def __init__(self):
+        self.crm: Optional[SheetsCRM] = None
+        self.pending: List[Mutation] = []
+        self._next_id = 1
+        self._lock = threading.Lock()  # a step's tool calls run concurrently
+
+    def __enter__(self) -> "MutationBuffer":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+    def _queue(self, crm: SheetsCRM, kind: str, table: str, payload) -> Mutation:
+        with self._lock:
+            if self.crm is not None and self.crm is not crm:
+                raise SheetsError("All writes of a step must go to the same spreadsheet")
+            self.crm = crm
+            mutation = Mutation(self._next_id, kind, table, payload)
+            self._next_id += 1
+            self.pending.append(mutation)
+            return mutation
+
+    # Each write is checked against the table catalog when queued, so mistakes
+    # are reported on the tool call that made them and never reach the batch.
+
+    def add_rows(self, crm: SheetsCRM, table: str, rows: List[dict]) -> Mutation:
+        crm.check_columns(table, rows)
+        return self._queue(crm, "append", table, list(rows))
+
+    def update_row(self, crm: SheetsCRM, table: str, row_number: int, values: Dict[str, str]) -> Mutation:
+        crm.check_columns(table, [values])
+        crm.check_row_numbers(table, [row_number])
+        return self._queue(crm, "update", table, (row_number, dict(values)))
+
+    def delete_rows(self, crm: SheetsCRM, table: str, row_numbers: List[int]) -> Mutation:
+        crm.check_row_numbers(table, row_numbers)
+        return self._queue(crm, "delete", table, list(row_numbers))
+
+    def flush(self) -> List[Mutation]:
+        """Send every queued write in one batchUpdate; returns them with their `result` set"""
+        with self._lock:
+            mutations, self.pending = self.pending, []
+            crm = self.crm
+        if not mutations:
+            return []
+        appends: Dict[str, List[dict]] = {}
+        updates: Dict[str, Dict[int, dict]] = {}
+        deletes: Dict[str, List[int]] = {}
+        for mutation in mutations:
+            if mutation.kind == "append":
+                appends.setdefault(mutation.table, []).extend(mutation.payload)
+            elif mutation.kind == "update":
+                number, values = mutation.payload
+                # Later writes to the same row win, column by column
+                updates.setdefault(mutation.table, {}).setdefault(number, {}).update(values)
+            else:
+                deletes.setdefault(mutation.table, []).extend(mutation.payload)
+        try:
+            crm.mutate(appends=appends, updates=updates, deletes=deletes)
+        except SheetsError as e:
+            # batchUpdate is all or nothing
+            for mutation in mutations:
+                mutation.result = f"Not saved: {e}"
+        else:
+            for mutation in mutations:
+                mutation.result = mutation.describe()
+        return mutations
+
+def get_mutations(config: RunnableConfig) -> Optional[MutationBuffer]:
+    return (config or {}).get("configurable", {}).get("crm_mutations")
+
+class CRMToolNode(RunnableLambda):
+    """
+    Tools node of the agent graph: runs the latest message's tool calls
+    concurrently (`ToolExecutor`) with a MutationBuffer in their config, then
+    flushes the buffer and puts each write's result in place of its placeholder.
+    """
+
+    def __init__(self, tools: List[BaseTool], max_per_user: int = CRM_TOOL_CONCURRENCY):
+        self.executor = ToolExecutor(tools, max_per_user)
+        super().__init__(self._run, afunc=self._arun, name="tools")
+
+    def _step(self, state: dict, config: RunnableConfig):
+        buffer = MutationBuffer()
+        config = {**config, "configurable": {**config.get("configurable", {}), "crm_mutations": buffer}}
+        return state["messages"][-1].tool_calls, config, buffer
+
+    def _output(self, messages: List[ToolMessage], flushed: List[Mutation]) -> dict:
+        results = {mutation.placeholder: mutation.result for mutation in flushed}
+        return {"messages": [
+            ToolMessage(content=results[message.content], name=message.name, tool_call_id=message.tool_call_id)
+            if isinstance(message.content, str) and message.content in results else message
+            for message in messages
+        ]}
+
+    def _run(self, state: dict, config: RunnableConfig) -> dict:
+        calls, config, buffer = self._step(state, config)
+        messages = self.executor.run(calls, config)
+        return self._output(messages, buffer.flush())
+
+    async def _arun(self, state: dict, config: RunnableConfig) -> dict:
+        calls, config, buffer = self._step(state, config)
+        messages = await self.executor.arun(calls, config)
+        return self._output(messages, await asyncio.to_thread(buffer.flush))
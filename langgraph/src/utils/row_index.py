@@ -0,0 +1,194 @@
+"""
+In-memory indexes over the rows of a cached sheet.
+
+Key columns (ids, emails) get a hash index on their normalized value; name
+columns get a sorted prefix index on every word boundary, which serves exact
+lookups and searches by word prefix: "ada lov" finds "Ada Lovelace" and
+"lovelace" does too. Rows can be added, changed or
+deleted in place instead of rebuilding the index.
+"""
+import os
+import unicodedata
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Set
+
+def _column_names(env: str, default: str) -> Set[str]:
+    return {name.strip().lower() for name in os.getenv(env, default).split(",") if name.strip()}
+
+# Header names (case-insensitive) indexed for exact lookups ...
+CRM_KEY_COLUMNS = _column_names("CRM_KEY_COLUMNS", "id,email,e-mail,phone")
+# ... and for exact and word-prefix lookups
+CRM_NAME_COLUMNS = _column_names("CRM_NAME_COLUMNS", "name,full name,first name,last name,company")
+
+def normalize(value) -> str:
+    """Case-, accent- and whitespace-insensitive form of a cell or query value"""
+    text = unicodedata.normalize("NFKD", str(value))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.casefold().split())
+
+def word_suffixes(text: str) -> List[str]:
+    """"ada king lovelace" -> ["ada king lovelace", "king lovelace", "lovelace"]"""
+    words = text.split()
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+def cell_matches(cell, value, prefix: bool = False) -> bool:
+    """Whether a cell equals a lookup value, or with `prefix` has a word starting with it"""
+    cell, value = normalize(cell), normalize(value)
+    if not prefix:
+        return cell == value
+    return any(suffix.startswith(value) for suffix in word_suffixes(cell))
+
+class RowIndex:
+    """
+    Indexes the data rows of `values` (header first, as read from the sheet).
+
+    The index keeps `values` itself up to date on `append`, `update` and `delete`, so it
+    can stay the cached copy of the sheet.
+    """
+
+    def __init__(self, values: List[list], key_columns: Iterable[str] = None,
+                 name_columns: Iterable[str] = None, indexed: bool = True):
+        self.values = values
+        self.header = values[0] if values else []
+        key_columns = CRM_KEY_COLUMNS if key_columns is None else {c.lower() for c in key_columns}
+        name_columns = CRM_NAME_COLUMNS if name_columns is None else {c.lower() for c in name_columns}
+        if not indexed:
+            # One-off scan: skip building the indexes
+            key_columns = name_columns = set()
+        self.key_columns = {i: c for i, c in enumerate(self.header) if c.strip().lower() in key_columns}
+        self.name_columns = {i: c for i, c in enumerate(self.header) if c.strip().lower() in name_columns}
+        # Rows get increasing ids in sheet order; a row's position is the rank of its id
+        self._ids: List[int] = []
+        self._rows: Dict[int, list] = {}
+        self._next_id = 0
+        self._hash: Dict[str, Dict[str, Set[int]]] = {c: {} for c in self.key_columns.values()}
+        self._prefix: Dict[str, List[tuple]] = {c: [] for c in self.name_columns.values()}
+        for row in values[1:]:
+            self._add(row, presorted=True)
+        for entries in self._prefix.values():
+            entries.sort()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _cell(self, row: list, i: int) -> str:
+        return row[i] if i < len(row) else ""
+
+    def _add(self, row: list, presorted: bool = False):
+        row_id = self._next_id
+        self._next_id += 1
+        self._ids.append(row_id)
+        self._index(row_id, row, presorted)
+
+    def _index(self, row_id: int, row: list, presorted: bool = False):
+        self._rows[row_id] = row
+        for i, column in self.key_columns.items():
+            key = normalize(self._cell(row, i))
+            if key:
+                self._hash[column].setdefault(key, set()).add(row_id)
+        for i, column in self.name_columns.items():
+            for suffix in word_suffixes(normalize(self._cell(row, i))):
+                if presorted:
+                    self._prefix[column].append((suffix, row_id))
+                else:
+                    insort(self._prefix[column], (suffix, row_id))
+
+    def _remove(self, row_id: int):
+        row = self._rows.pop(row_id)
+        self._unindex(row_id, row)
+
+    def _unindex(self, row_id: int, row: list):
+        for i, column in self.key_columns.items():
+            key = normalize(self._cell(row, i))
+            ids = self._hash[column].get(key)
+            if ids is not None:
+                ids.discard(row_id)
+                if not ids:
+                    del self._hash[column][key]
+        for i, column in self.name_columns.items():
+            entries = self._prefix[column]
+            for suffix in word_suffixes(normalize(self._cell(row, i))):
+                position = bisect_left(entries, (suffix, row_id))
+                if position < len(entries) and entries[position] == (suffix, row_id):
+                    del entries[position]
+
+    def row_number(self, row_id: int) -> int:
+        """Sheet row number (the header is row 1)"""
+        return bisect_left(self._ids, row_id) + 2
+
+    def append(self, rows: List[list]):
+        """Rows appended to the sheet"""
+        for row in rows:
+            self.values.append(row)
+            self._add(row)
+
+    def update(self, row_number: int, cells: Dict[int, str]):
+        """Cells (column position -> value) written to a row, by row number"""
+        position = row_number - 2
+        if not 0 <= position < len(self._ids):
+            return
+        row_id = self._ids[position]
+        row = list(self._rows[row_id])
+        row.extend([""] * (max(cells, default=-1) + 1 - len(row)))
+        for i, value in cells.items():
+            row[i] = value
+        self._unindex(row_id, self._rows[row_id])
+        self._index(row_id, row)
+        self.values[row_number - 1] = row
+
+    def delete(self, row_numbers: Iterable[int]):
+        """Rows deleted from the sheet, by row number"""
+        for number in sorted(set(row_numbers), reverse=True):
+            position = number - 2
+            if 0 <= position < len(self._ids):
+                self._remove(self._ids.pop(position))
+                del self.values[number - 1]
+
+    def _prefix_ids(self, column: str, value: str) -> Set[int]:
+        entries = self._prefix[column]
+        ids = set()
+        position = bisect_left(entries, (value,))
+        while position < len(entries) and entries[position][0].startswith(value):
+            ids.add(entries[position][1])
+            position += 1
+        return ids
+
+    def find(self, where: Dict[str, str], limit: Optional[int] = None,
+             search: Dict[str, str] = None) -> List[dict]:
+        """
+        Records whose columns equal `where` (ignoring case, accents and spacing)
+        and have a word starting with the `search` value of a column. Each has its
+        row number under "_row". Indexed columns narrow the candidates; the rest
+        is checked row by row.
+        """
+        candidates: Optional[Set[int]] = None
+        checks = []  # (column, value, prefix) to check row by row
+        conditions = [(column, value, False) for column, value in where.items()]
+        conditions += [(column, value, True) for column, value in (search or {}).items()]
+        for column, value, prefix in conditions:
+            if column in self._hash and not prefix:
+                ids = self._hash[column].get(normalize(value), set())
+            elif column in self._prefix:
+                # An equal cell starts with the value too: the check keeps only those
+                ids = self._prefix_ids(column, normalize(value))
+                if not prefix:
+                    checks.append((column, value, prefix))
+            else:
+                checks.append((column, value, prefix))
+                continue
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates:
+                return []
+        ordered = self._ids if candidates is None else sorted(candidates)
+        records = []
+        for row_id in ordered:
+            row = self._rows[row_id]
+            if not any(cell != "" for cell in row):
+                continue  # blank row
+            record = dict(zip(self.header, row + [""] * (len(self.header) - len(row))))
+            if all(cell_matches(record.get(column, ""), value, prefix) for column, value, prefix in checks):
+                record["_row"] = self.row_number(row_id)
+                records.append(record)
+                if limit and len(records) >= limit:
+                    break
+        return records
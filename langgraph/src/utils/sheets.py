@@ -0,0 +1,276 @@
+"""
+Google Sheets access for the CRM tools.
+
+A CRM is one spreadsheet: every sheet (tab) is a table whose first row holds
+the column names. Reads go through `spreadsheets.values.batchGet` and writes
+through `spreadsheets.batchUpdate`, so one call covers any number of tables
+and rows. Reads can be served from a local snapshot (`utils.snapshot_cache`).
+"""
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import httpx
+
+from utils.row_index import RowIndex
+from utils.snapshot_cache import SnapshotCache
+
+SHEETS_API = os.getenv("SHEETS_API", "https://sheets.googleapis.com/v4/spreadsheets")
+DRIVE_FILES_API = os.getenv("DRIVE_FILES_API", "https://www.googleapis.com/drive/v3/files")
+SHEETS_TIMEOUT = float(os.getenv("SHEETS_TIMEOUT", 10.0))
+
+_client: Optional[httpx.Client] = None
+
+def get_http_client() -> httpx.Client:
+    """Shared pooled client for the Sheets API"""
+    global _client
+    if _client is None:
+        _client = httpx.Client(timeout=SHEETS_TIMEOUT)
+    return _client
+
+class SheetsError(Exception):
+    """A Sheets API call failed, or a table or column does not exist"""
+
+def google_request(access_token: str, method: str, url: str, client: httpx.Client = None, **kwargs) -> dict:
+    """One call to a Google API on behalf of the user, JSON response"""
+    client = client or get_http_client()
+    try:
+        response = client.request(
+            method,
+            url,
+            headers={"Authorization": f"Bearer {access_token}"},
+            **kwargs,
+        )
+    except httpx.HTTPError as e:
+        raise SheetsError(f"Sheets API unreachable: {e}")
+    if response.status_code != 200:
+        raise SheetsError(f"Sheets API error {response.status_code}: {response.text}")
+    return response.json()
+
+def quote_title(title: str) -> str:
+    """Sheet title as written in A1 notation"""
+    return "'" + title.replace("'", "''") + "'"
+
+def a1_range(title: str, first_row: int = None, last_row: int = None) -> str:
+    """A1 range of a whole sheet, or of rows `first_row` to `last_row` (1-based, inclusive)"""
+    if first_row is None:
+        return quote_title(title)
+    return f"{quote_title(title)}!{first_row}:{last_row or first_row}"
+
+@dataclass
+class Table:
+    title: str
+    sheet_id: int
+    columns: List[str] = field(default_factory=list)
+
+class SheetsCRM:
+    """
+    Tables of one spreadsheet.
+
+    The table catalog (titles, sheet ids and column names) is loaded on first
+    use and kept; after that every read or write is a single API call.
+
+    With a `cache`, reads are served from a local snapshot for as long as the
+    Drive file version stays the same, at the cost of one metadata call. Our
+    own writes update the snapshot instead of fetching the tables again.
+    """
+
+    def __init__(self, spreadsheet_id: str, access_token: str, client: httpx.Client = None,
+                 cache: SnapshotCache = None):
+        self.spreadsheet_id = spreadsheet_id
+        self.access_token = access_token
+        self.client = client
+        self.cache = cache
+        self._tables: Optional[Dict[str, Table]] = None
+
+    def _request(self, method: str, url: str, **kwargs) -> dict:
+        return google_request(self.access_token, method, url, client=self.client, **kwargs)
+
+    def batch_get(self, ranges: List[str]) -> List[List[list]]:
+        """Values of several ranges in one call, in the order asked"""
+        data = self._request(
+            "GET", f"{SHEETS_API}/{self.spreadsheet_id}/values:batchGet",
+            params={"ranges": ranges, "majorDimension": "ROWS", "valueRenderOption": "FORMATTED_VALUE"},
+        )
+        return [value_range.get("values", []) for value_range in data.get("valueRanges", [])]
+
+    def batch_update(self, requests: List[dict]) -> dict:
+        return self._request("POST", f"{SHEETS_API}/{self.spreadsheet_id}:batchUpdate", json={"requests": requests})
+
+    def _write(self, requests: List[dict], appended: Dict[str, List[list]] = None,
+               deleted: Dict[str, List[int]] = None, updated: Dict[str, Dict[int, Dict[int, str]]] = None):
+        """
+        batchUpdate, then patch the snapshot with what we wrote. The next lookup's
+        version check tells whether that was the only change (see `SnapshotCache.apply`).
+        """
+        base = self.cache.version(self.spreadsheet_id) if self.cache is not None else None
+        try:
+            self.batch_update(requests)
+        except Exception:
+            if self.cache is not None:
+                # It may or may not have been applied: drop the snapshot
+                self.cache.apply(self.spreadsheet_id, None)
+            raise
+        if self.cache is not None:
+            self.cache.apply(self.spreadsheet_id, base, appended, deleted, updated)
+
+    def file_version(self) -> str:
+        """Drive version of the spreadsheet: it changes whenever the content does"""
+        data = self._request(
+            "GET", f"{DRIVE_FILES_API}/{self.spreadsheet_id}", params={"fields": "version,modifiedTime"}
+        )
+        return data.get("version") or data["modifiedTime"]
+
+    def table_values(self, titles: List[str]) -> Dict[str, List[list]]:
+        """Rows (header first) of several tables: from the snapshot if it is current, else one batchGet"""
+        return self._table_values(titles)[1]
+
+    def _table_values(self, titles: List[str]) -> tuple:
+        if self.cache is None:
+            return None, dict(zip(titles, self.batch_get([a1_range(title) for title in titles])))
+        # Version first: a change made while fetching makes the snapshot look older, never newer
+        version = self.file_version()
+        values, missing = self.cache.lookup(self.spreadsheet_id, version, titles)
+        if missing:
+            fetched = dict(zip(missing, self.batch_get([a1_range(title) for title in missing])))
+            self.cache.store(self.spreadsheet_id, version, fetched)
+            values.update(fetched)
+        return version, {title: values[title] for title in titles}
+
+    def tables(self, refresh: bool = False) -> Dict[str, Table]:
+        """Tables by title: sheet properties, then every header row in one batchGet"""
+        if self._tables is None or refresh:
+            data = self._request(
+                "GET", f"{SHEETS_API}/{self.spreadsheet_id}", params={"fields": "sheets.properties(sheetId,title)"}
+            )
+            tables = {
+                sheet["properties"]["title"]: Table(sheet["properties"]["title"], sheet["properties"]["sheetId"])
+                for sheet in data.get("sheets", [])
+            }
+            if tables:
+                headers = self.batch_get([a1_range(title, 1) for title in tables])
+                for table, values in zip(tables.values(), headers):
+                    table.columns = values[0] if values else []
+            self._tables = tables
+        return self._tables
+
+    def table(self, title: str) -> Table:
+        table = self.tables().get(title)
+        if table is None:
+            table = self.tables(refresh=True).get(title)
+        if table is None:
+            raise SheetsError(f"No table named {title!r}. Tables: {', '.join(self.tables())}")
+        return table
+
+    def get_rows(self, queries: Dict[str, Dict[str, str]], limit: int = None,
+                 search: Dict[str, Dict[str, str]] = None) -> Dict[str, List[dict]]:
+        """
+        Rows of several tables in one batchGet. `queries` maps a table title to
+        the column values its rows must have ({} for every row), and `search` to
+        the word prefixes they must have; see `RowIndex.find`.
+        """
+        version, tables = self._table_values(list(queries))
+        results = {}
+        for title, values in tables.items():
+            where, prefixes = queries[title], (search or {}).get(title, {})
+            columns = values[0] if values else []
+            unknown = (set(where) | set(prefixes)) - set(columns)
+            if unknown:
+                raise SheetsError(
+                    f"Table {title!r} has no column {', '.join(sorted(unknown))}. Columns: {', '.join(columns)}"
+                )
+            rows = None
+            if self.cache is not None:
+                rows = self.cache.find(self.spreadsheet_id, version, title, where, limit, prefixes)
+            if rows is None:
+                rows = RowIndex(values, indexed=False).find(where, limit, prefixes)
+            results[title] = rows
+        return results
+
+    def check_columns(self, title: str, records: List[dict]) -> Table:
+        """The table, once every column the records name is known to exist"""
+        table = self.table(title)
+        for record in records:
+            unknown = set(record) - set(table.columns)
+            if unknown:
+                raise SheetsError(
+                    f"Table {title!r} has no column {', '.join(sorted(unknown))}. "
+                    f"Columns: {', '.join(table.columns)}"
+                )
+        return table
+
+    def check_row_numbers(self, title: str, numbers: List[int]) -> Table:
+        table = self.table(title)
+        if any(number < 2 for number in numbers):
+            raise SheetsError("Row numbers start at 2; row 1 holds the column names")
+        return table
+
+    def mutate(self, appends: Dict[str, List[dict]] = None, updates: Dict[str, Dict[int, dict]] = None,
+               deletes: Dict[str, List[int]] = None) -> dict:
+        """
+        Append, change and delete rows of several tables in one batchUpdate.
+
+        Row numbers in `updates` (row -> column name -> value) and `deletes` are
+        those before the call: updates go first, then deletes bottom-up so earlier
+        deletions do not shift the rows still to delete, then appends at the end.
+        Returns how many rows were appended, updated and deleted.
+        """
+        requests = []
+        appended, updated, deleted = {}, {}, {}
+        for title, rows in (updates or {}).items():
+            table = self.check_columns(title, list(rows.values()))
+            self.check_row_numbers(title, list(rows))
+            positions = {column: i for i, column in enumerate(table.columns)}
+            for number, record in sorted(rows.items()):
+                if not record:
+                    continue
+                cells = {positions[column]: str(value) for column, value in record.items()}
+                updated.setdefault(title, {})[number] = cells
+                requests.extend({"updateCells": {
+                    "start": {"sheetId": table.sheet_id, "rowIndex": number - 1, "columnIndex": i},
+                    "rows": [{"values": [{"userEnteredValue": {"stringValue": value}}]}],
+                    "fields": "userEnteredValue",
+                }} for i, value in sorted(cells.items()))
+        for title, numbers in (deletes or {}).items():
+            table = self.check_row_numbers(title, numbers)
+            if numbers:
+                deleted[title] = sorted(set(numbers), reverse=True)
+            for number in deleted.get(title, []):
+                requests.append({"deleteDimension": {"range": {
+                    "sheetId": table.sheet_id,
+                    "dimension": "ROWS",
+                    "startIndex": number - 1,
+                    "endIndex": number,
+                }}})
+        for title, records in (appends or {}).items():
+            table = self.check_columns(title, records)
+            if not records:
+                continue
+            appended[title] = [[str(record.get(column, "")) for column in table.columns] for record in records]
+            requests.append({"appendCells": {
+                "sheetId": table.sheet_id,
+                "rows": [
+                    {"values": [{"userEnteredValue": {"stringValue": cell}} for cell in row]}
+                    for row in appended[title]
+                ],
+                "fields": "userEnteredValue",
+            }})
+        if requests:
+            self._write(requests, appended=appended, deleted=deleted, updated=updated)
+        return {
+            "appended": sum(len(rows) for rows in appended.values()),
+            "updated": sum(len(rows) for rows in updated.values()),
+            "deleted": sum(len(numbers) for numbers in deleted.values()),
+        }
+
+    def add_rows(self, rows: Dict[str, List[dict]]) -> int:
+        """Append rows (column name -> value) to several tables in one batchUpdate"""
+        return self.mutate(appends=rows)["appended"]
+
+    def update_rows(self, rows: Dict[str, Dict[int, dict]]) -> int:
+        """Set cells of rows, by table, row number and column name, in one batchUpdate"""
+        return self.mutate(updates=rows)["updated"]
+
+    def delete_rows(self, rows: Dict[str, List[int]]) -> int:
+        """Delete rows, by sheet row number, from several tables in one batchUpdate"""
+        return self.mutate(deletes=rows)["deleted"]
@@ -0,0 +1,246 @@
+"""
+Local snapshots of spreadsheet tables, so repeated lookups during an agent
+run do not pull the same sheet from Google again.
+
+Snapshots are keyed by spreadsheet id and labelled with the Drive file
+version they were fetched at. Callers look tables up with the version the
+file has now (one cheap Drive metadata call); a snapshot of any other
+version is dropped and the tables are fetched again. Snapshots live in
+memory and, with a `path`, also in a SQLite file that survives restarts.
+
+Lookups go through a `RowIndex` per table, which our own writes update in
+place (`apply`). A write is one change to the file, so it moves the Drive
+version on by exactly one: the patched snapshot is kept if the next version
+seen is the one it expects, and dropped if anyone else changed the file as
+well, or if two of our writes overlapped.
+"""
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from utils.row_index import RowIndex
+
+SHEETS_SNAPSHOT_DB = os.getenv("SHEETS_SNAPSHOT_DB")  # unset: memory only
+SHEETS_SNAPSHOT_MAX_SPREADSHEETS = int(os.getenv("SHEETS_SNAPSHOT_MAX_SPREADSHEETS", 64))
+
+class Snapshot:
+    def __init__(self, version: str):
+        self.version = version
+        self.tables: Dict[str, List[list]] = {}
+        self.sizes: Dict[str, int] = {}  # bytes each table took to fetch
+        self.indexes: Dict[str, RowIndex] = {}  # built on first lookup
+        self.expected: Optional[str] = None  # the version our own writes patched it to
+        self.patched: Set[str] = set()  # tables those writes changed
+
+class SnapshotCache:
+    def __init__(self, path: str = SHEETS_SNAPSHOT_DB, max_spreadsheets: int = SHEETS_SNAPSHOT_MAX_SPREADSHEETS):
+        self.path = path
+        self.max_spreadsheets = max_spreadsheets
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.bytes_saved = 0
+        self.bytes_fetched = 0
+        self._memory: "OrderedDict[str, Snapshot]" = OrderedDict()
+        self._lock = threading.Lock()  # tools run in worker threads
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sheet_snapshots ("
+                " spreadsheet_id TEXT NOT NULL,"
+                " title TEXT NOT NULL,"
+                " version TEXT NOT NULL,"
+                " sheet_values TEXT NOT NULL,"
+                " PRIMARY KEY (spreadsheet_id, title))"
+            )
+            self._db.commit()
+
+    def lookup(self, spreadsheet_id: str, version: str, titles: List[str]) -> Tuple[Dict[str, List[list]], List[str]]:
+        """Tables of the snapshot at `version`, and the titles it does not have"""
+        with self._lock:
+            snapshot = self._snapshot(spreadsheet_id, version)
+            found, missing = {}, []
+            for title in titles:
+                if title in snapshot.tables:
+                    found[title] = snapshot.tables[title]
+                    self.hits += 1
+                    self.bytes_saved += snapshot.sizes[title]
+                else:
+                    missing.append(title)
+                    self.misses += 1
+            return found, missing
+
+    def store(self, spreadsheet_id: str, version: str, tables: Dict[str, List[list]]):
+        """Add freshly fetched tables to the snapshot at `version`, replacing any it has"""
+        with self._lock:
+            snapshot = self._snapshot(spreadsheet_id, version)
+            if snapshot.expected is not None:
+                # Fetched around our write: it may or may not be in them
+                return
+            rows = []
+            for title, values in tables.items():
+                encoded = json.dumps(values)
+                snapshot.tables[title] = values
+                snapshot.sizes[title] = len(encoded)
+                snapshot.indexes.pop(title, None)
+                self.bytes_fetched += len(encoded)
+                rows.append((spreadsheet_id, title, version, encoded))
+            if self._db is not None and rows:
+                self._db.executemany("INSERT OR REPLACE INTO sheet_snapshots VALUES (?, ?, ?, ?)", rows)
+                self._db.commit()
+
+    def find(self, spreadsheet_id: str, version: str, title: str, where: Dict[str, str],
+             limit: int = None, search: Dict[str, str] = None) -> Optional[List[dict]]:
+        """Look rows up in the indexed snapshot of a table; None if the table is not cached"""
+        with self._lock:
+            snapshot = self._snapshot(spreadsheet_id, version)
+            index = self._index(snapshot, title)
+            return None if index is None else index.find(where, limit, search)
+
+    def version(self, spreadsheet_id: str) -> Optional[str]:
+        """The version the snapshot is at, counting our writes; read before writing, for `apply`"""
+        with self._lock:
+            snapshot = self._memory.get(spreadsheet_id)
+            return None if snapshot is None else snapshot.expected or snapshot.version
+
+    def apply(self, spreadsheet_id: str, base: Optional[str], appended: Dict[str, List[list]] = None,
+              deleted: Dict[str, List[int]] = None, updated: Dict[str, Dict[int, Dict[int, str]]] = None):
+        """
+        Apply our own write, sent with the snapshot at version `base`, to the
+        snapshot and its indexes, which then expect the version after `base`. If
+        the snapshot has moved on since (another of our writes was applied first),
+        or `base` is None, it is dropped.
+
+        Updates (row number -> column position -> value) are applied first, then
+        deletes, then appends, the order `SheetsCRM.mutate` sends them in.
+        """
+        with self._lock:
+            snapshot = self._memory.get(spreadsheet_id)
+            if snapshot is None:
+                return
+            if base is None or not base.isdigit() or (snapshot.expected or snapshot.version) != base:
+                self._drop(spreadsheet_id)
+                return
+            for title in set(updated or {}) | set(deleted or {}) | set(appended or {}):
+                index = self._index(snapshot, title)
+                if index is None:
+                    continue
+                rows = (updated or {}).get(title, {})
+                numbers = (deleted or {}).get(title, [])
+                if any(number > len(index) + 1 for number in rows):
+                    # Written past the rows we have: fetch it again rather than guess
+                    self._forget(spreadsheet_id, snapshot, title)
+                    continue
+                for number, cells in rows.items():
+                    index.update(number, cells)
+                values = snapshot.tables[title]
+                snapshot.sizes[title] -= sum(
+                    len(json.dumps(values[n - 1])) for n in set(numbers) if 1 < n <= len(values)
+                )
+                index.delete(numbers)
+                if title in (appended or {}):
+                    if len(values) > 1 and not any(values[-1]):
+                        # Appends go after the last row with data, which we no longer know
+                        self._forget(spreadsheet_id, snapshot, title)
+                        continue
+                    snapshot.sizes[title] += len(json.dumps(appended[title]))
+                    index.append(appended[title])
+                snapshot.patched.add(title)
+            snapshot.expected = str(int(base) + 1)
+
+    def _forget(self, spreadsheet_id: str, snapshot: Snapshot, title: str):
+        snapshot.tables.pop(title, None)
+        snapshot.sizes.pop(title, None)
+        snapshot.indexes.pop(title, None)
+        snapshot.patched.discard(title)
+        if self._db is not None:
+            self._db.execute("DELETE FROM sheet_snapshots WHERE spreadsheet_id = ? AND title = ?",
+                             (spreadsheet_id, title))
+            self._db.commit()
+
+    def _index(self, snapshot: Snapshot, title: str) -> Optional[RowIndex]:
+        index = snapshot.indexes.get(title)
+        if index is None and title in snapshot.tables:
+            index = snapshot.indexes[title] = RowIndex(snapshot.tables[title])
+        return index
+
+    def invalidate(self, spreadsheet_id: str):
+        """Forget a spreadsheet, e.g. after writing to it"""
+        with self._lock:
+            self._drop(spreadsheet_id)
+
+    def _snapshot(self, spreadsheet_id: str, version: str) -> Snapshot:
+        snapshot = self._memory.get(spreadsheet_id)
+        if snapshot is not None and snapshot.expected == version:
+            self._confirm(spreadsheet_id, snapshot)
+        elif snapshot is not None and snapshot.version != version:
+            self._drop(spreadsheet_id)
+            snapshot = None
+        if snapshot is None:
+            snapshot = self._load(spreadsheet_id, version)
+            self._memory[spreadsheet_id] = snapshot
+            while len(self._memory) > self.max_spreadsheets:
+                self._memory.popitem(last=False)
+        self._memory.move_to_end(spreadsheet_id)
+        return snapshot
+
+    def _confirm(self, spreadsheet_id: str, snapshot: Snapshot):
+        """Our write was the only change: the patched snapshot is the new version"""
+        snapshot.version, snapshot.expected = snapshot.expected, None
+        if self._db is not None:
+            self._db.execute(
+                "UPDATE sheet_snapshots SET version = ? WHERE spreadsheet_id = ?", (snapshot.version, spreadsheet_id)
+            )
+            self._db.executemany(
+                "UPDATE sheet_snapshots SET sheet_values = ? WHERE spreadsheet_id = ? AND title = ?",
+                [(json.dumps(snapshot.tables[title]), spreadsheet_id, title) for title in snapshot.patched],
+            )
+            self._db.commit()
+        snapshot.patched.clear()
+
+    def _load(self, spreadsheet_id: str, version: str) -> Snapshot:
+        snapshot = Snapshot(version)
+        if self._db is None:
+            return snapshot
+        rows = self._db.execute(
+            "SELECT title, version, sheet_values FROM sheet_snapshots WHERE spreadsheet_id = ?",
+            (spreadsheet_id,),
+        ).fetchall()
+        if any(row_version != version for _, row_version, _ in rows):
+            self._drop(spreadsheet_id)
+            return snapshot
+        for title, _, encoded in rows:
+            snapshot.tables[title] = json.loads(encoded)
+            snapshot.sizes[title] = len(encoded)
+        return snapshot
+
+    def _drop(self, spreadsheet_id: str):
+        if self._memory.pop(spreadsheet_id, None) is not None:
+            self.invalidations += 1
+        if self._db is not None:
+            self._db.execute("DELETE FROM sheet_snapshots WHERE spreadsheet_id = ?", (spreadsheet_id,))
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM sheet_snapshots")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "spreadsheets": len(self._memory),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "bytes_saved": self.bytes_saved,
+            "bytes_fetched": self.bytes_fetched,
+        }
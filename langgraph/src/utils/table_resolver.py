@@ -0,0 +1,162 @@
+"""
+Local resolution of a phrase like "the leads sheet" to a spreadsheet tab.
+
+Every tab in the catalog is indexed by the words of its title, its
+spreadsheet's name and its column names (weighted in that order), and every
+word by its trigrams, so misspelt or partial words still match. Resolving
+a phrase is a handful of dictionary lookups, cheap enough to run on every
+user message before the model is called.
+"""
+import heapq
+import math
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+from utils.row_index import normalize
+from utils.sheets import Table
+
+TITLE_WEIGHT = 3.0
+NAME_WEIGHT = 2.0
+COLUMN_WEIGHT = 1.0
+MIN_SIMILARITY = 0.45  # trigram Jaccard similarity below which words do not match
+COMMON_FRACTION = 0.1  # words in more of the tabs than this are skipped when the phrase has rarer ones
+
+# Words that say "a table" rather than which one
+STOPWORDS = {
+    "a", "all", "an", "and", "at", "for", "from", "in", "into", "my", "of", "on", "our", "please", "sheet",
+    "sheets", "spreadsheet", "tab", "table", "tables", "the", "this", "to", "with",
+}
+
+def words(text: str) -> List[str]:
+    """Normalized words of a text, plural "s" dropped"""
+    tokens = re.findall(r"[a-z0-9]+", normalize(text))
+    return [token[:-1] if len(token) > 3 and token.endswith("s") and not token.endswith("ss") else token
+            for token in tokens]
+
+def trigrams(word: str) -> Set[str]:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+@dataclass
+class Match:
+    score: float
+    spreadsheet_id: str
+    spreadsheet_name: str
+    table: Table
+    named: bool = False  # a word of the phrase is in the tab title or spreadsheet name
+
+class TableResolver:
+    def __init__(self):
+        self._tables: Dict[Tuple[str, str], Tuple[str, Table]] = {}  # (spreadsheet id, title) -> (name, table)
+        self._by_spreadsheet: Dict[str, Set[Tuple[str, str]]] = {}
+        self._postings: Dict[str, Dict[Tuple[str, str], float]] = {}  # word -> tab -> weight
+        self._trigrams: Dict[str, Set[str]] = {}  # trigram -> words
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._tables)
+
+    def update_spreadsheet(self, spreadsheet_id: str, name: str, tables: Dict[str, Table]):
+        """(Re)index the tabs of one spreadsheet; the other spreadsheets are left alone"""
+        with self._lock:
+            self._remove(spreadsheet_id)
+            keys = self._by_spreadsheet[spreadsheet_id] = set()
+            for table in tables.values():
+                key = (spreadsheet_id, table.title)
+                keys.add(key)
+                self._tables[key] = (name, table)
+                weights: Dict[str, float] = {}
+                for weight, texts in ((COLUMN_WEIGHT, table.columns), (NAME_WEIGHT, [name]),
+                                      (TITLE_WEIGHT, [table.title])):
+                    for text in texts:
+                        for word in words(text):
+                            weights[word] = max(weights.get(word, 0.0), weight)
+                for word, weight in weights.items():
+                    if word not in self._postings:
+                        self._postings[word] = {}
+                        for trigram in trigrams(word):
+                            self._trigrams.setdefault(trigram, set()).add(word)
+                    self._postings[word][key] = weight
+
+    def remove_spreadsheet(self, spreadsheet_id: str):
+        with self._lock:
+            self._remove(spreadsheet_id)
+
+    def _remove(self, spreadsheet_id: str):
+        keys = self._by_spreadsheet.pop(spreadsheet_id, set())
+        if not keys:
+            return
+        for key in keys:
+            name, table = self._tables.pop(key)
+            for word in set(words(table.title) + words(name) + [w for c in table.columns for w in words(c)]):
+                postings = self._postings.get(word)
+                if postings is None:
+                    continue
+                postings.pop(key, None)
+                if not postings:
+                    del self._postings[word]
+                    for trigram in trigrams(word):
+                        similar = self._trigrams.get(trigram)
+                        if similar is not None:
+                            similar.discard(word)
+                            if not similar:
+                                del self._trigrams[trigram]
+
+    def _similar_words(self, word: str) -> Dict[str, float]:
+        if word in self._postings:
+            return {word: 1.0}
+        query = trigrams(word)
+        shared: Dict[str, int] = {}
+        for trigram in query:
+            for candidate in self._trigrams.get(trigram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        similar = {}
+        for candidate, count in shared.items():
+            similarity = count / (len(query) + len(trigrams(candidate)) - count)
+            if similarity >= MIN_SIMILARITY:
+                similar[candidate] = similarity
+        return similar
+
+    def resolve(self, phrase: str, spreadsheet_id: str = None, limit: int = 5) -> List[Match]:
+        """Tabs best matching a phrase, best first; only those of one spreadsheet if given"""
+        query = [word for word in words(phrase) if word not in STOPWORDS]
+        with self._lock:
+            # Common words (e.g. an "email" column everywhere) cost the most to score and
+            # barely move the ranking; they are only used when nothing rarer matched
+            common = max(10, COMMON_FRACTION * len(self._tables))
+            expanded = [self._similar_words(word) for word in dict.fromkeys(query)]
+            if any(len(self._postings[w]) <= common for similar in expanded for w in similar):
+                expanded = [{w: s for w, s in similar.items() if len(self._postings[w]) <= common}
+                            for similar in expanded]
+            scores: Dict[Tuple[str, str], float] = {}
+            named: Set[Tuple[str, str]] = set()
+            for similar_words in expanded:
+                best: Dict[Tuple[str, str], float] = {}
+                for similar, similarity in similar_words.items():
+                    postings = self._postings[similar]
+                    # Words found in fewer tabs say more about which tab is meant
+                    rarity = math.log(1 + len(self._tables) / len(postings))
+                    for key, weight in postings.items():
+                        if spreadsheet_id is None or key[0] == spreadsheet_id:
+                            best[key] = max(best.get(key, 0.0), weight * similarity * rarity)
+                            if weight >= NAME_WEIGHT:
+                                named.add(key)
+                for key, score in best.items():
+                    scores[key] = scores.get(key, 0.0) + score
+            ranked = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            return [
+                Match(score, key[0], self._tables[key][0], self._tables[key][1], key in named)
+                for key, score in ranked
+            ]
+
+    def unambiguous(self, phrase: str, spreadsheet_id: str = None, margin: float = 2.0) -> Optional[Match]:
+        """The best tab, if the phrase names it and it scores `margin` times better than the runner-up"""
+        matches = self.resolve(phrase, spreadsheet_id, limit=2)
+        if not matches or not matches[0].named:
+            return None  # nothing, or only column names, matched
+        best = matches[0]
+        if len(matches) > 1 and best.score < margin * matches[1].score:
+            return None
+        return best
@@ -0,0 +1,113 @@
+"""
+Runs the tool calls of one model message concurrently.
+
+Calls from one message do not depend on each other (the model has not seen
+any of their results yet), so they are started together, with at most
+`CRM_TOOL_CONCURRENCY` in flight per user across all of that user's runs
+(on the same event loop, for async runs) to stay within the user's Google
+API quota. Results come back in the order
+of the calls, and a call that fails becomes an error ToolMessage without
+affecting the others. An `interrupt()` (or any other GraphBubbleUp) is not a
+failure and propagates to the graph, as it does from ToolNode.
+
+Tools are async-capable: `async_tool` gives a sync tool a coroutine that
+runs it in a worker thread. The Sheets client and the caches behind the CRM
+tools are thread-safe, blocking code.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+from weakref import WeakValueDictionary
+
+from langchain_core.messages import ToolCall, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool, StructuredTool
+from langgraph.errors import GraphBubbleUp
+
+CRM_TOOL_CONCURRENCY = int(os.getenv("CRM_TOOL_CONCURRENCY", 4))
+CRM_TOOL_THREADS = int(os.getenv("CRM_TOOL_THREADS", 32))
+
+# Tools wait on the network, not the CPU: the event loop's default pool (CPUs + 4 threads)
+# would cap a busy server far below what the per-user limits allow
+_threads = ThreadPoolExecutor(max_workers=CRM_TOOL_THREADS, thread_name_prefix="crm-tool")
+
+def async_tool(func: Callable) -> BaseTool:
+    """A tool from a sync function, with a coroutine running it in a worker thread"""
+    @functools.wraps(func)
+    async def run(*args, **kwargs):
+        call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(_threads, call)
+    return StructuredTool.from_function(func=func, coroutine=run)
+
+def user_key(config: RunnableConfig) -> str:
+    configurable = (config or {}).get("configurable", {})
+    return str(configurable.get("user_id") or configurable.get("google_access_token") or "")
+
+class ToolExecutor:
+    def __init__(self, tools: List[BaseTool], max_per_user: int = CRM_TOOL_CONCURRENCY):
+        self.tools: Dict[str, BaseTool] = {tool.name: tool for tool in tools}
+        self.max_per_user = max_per_user
+        # Per-user limits live as long as some call of that user holds them
+        self._thread_limits: "WeakValueDictionary[str, threading.BoundedSemaphore]" = WeakValueDictionary()
+        # An asyncio.Semaphore only works on one event loop, so these are per loop and user
+        self._task_limits: "WeakValueDictionary[Tuple[asyncio.AbstractEventLoop, str], asyncio.Semaphore]" = (
+            WeakValueDictionary())
+        self._lock = threading.Lock()
+
+    def _limit(self, limits: WeakValueDictionary, key, make: Callable):
+        with self._lock:
+            limit = limits.get(key)
+            if limit is None:
+                limit = limits[key] = make(self.max_per_user)
+            return limit
+
+    def _error(self, call: ToolCall, error: Exception) -> ToolMessage:
+        return ToolMessage(
+            content=f"Error: {error}\n Please fix your mistakes.",
+            name=call["name"],
+            tool_call_id=call["id"],
+            status="error",
+        )
+
+    def _tool(self, call: ToolCall) -> BaseTool:
+        tool = self.tools.get(call["name"])
+        if tool is None:
+            raise ValueError(f"{call['name']} is not a valid tool, try one of [{', '.join(self.tools)}].")
+        return tool
+
+    def _invoke(self, call: ToolCall, config: RunnableConfig, limit: threading.BoundedSemaphore) -> ToolMessage:
+        try:
+            tool = self._tool(call)
+            with limit:
+                return tool.invoke({**call, "type": "tool_call"}, config)
+        except GraphBubbleUp:
+            raise
+        except Exception as e:
+            return self._error(call, e)
+
+    async def _ainvoke(self, call: ToolCall, config: RunnableConfig, limit: asyncio.Semaphore) -> ToolMessage:
+        try:
+            tool = self._tool(call)
+            async with limit:
+                return await tool.ainvoke({**call, "type": "tool_call"}, config)
+        except GraphBubbleUp:
+            raise
+        except Exception as e:
+            return self._error(call, e)
+
+    def run(self, calls: List[ToolCall], config: RunnableConfig) -> List[ToolMessage]:
+        """Run calls in worker threads; results in call order"""
+        if not calls:
+            return []
+        limit = self._limit(self._thread_limits, user_key(config), threading.BoundedSemaphore)
+        with ThreadPoolExecutor(max_workers=min(len(calls), self.max_per_user)) as pool:
+            return list(pool.map(lambda call: self._invoke(call, config, limit), calls))
+
+    async def arun(self, calls: List[ToolCall], config: RunnableConfig) -> List[ToolMessage]:
+        """Run calls as tasks; results in call order"""
+        limit = self._limit(self._task_limits, (asyncio.get_running_loop(), user_key(config)), asyncio.Semaphore)
+        return list(await asyncio.gather(*(self._ainvoke(call, config, limit) for call in calls)))
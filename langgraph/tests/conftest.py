@@ -0,0 +1,45 @@
+import os
+import sys
+
+import pytest
+
+# The agent code imports its modules relative to src/, as the LangGraph server does
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from utils import catalog, crm_tools, sheets  # noqa: E402
+from utils.fake_sheets import FakeSheetsServer  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def crm_state():
+    """The CRM tools keep process-wide caches: every test starts without them"""
+    crm_tools._crm.cache_clear()
+    crm_tools.snapshot_cache.clear()
+    catalog.clear_catalogs()
+    yield
+    crm_tools._crm.cache_clear()
+    crm_tools.snapshot_cache.clear()
+    catalog.clear_catalogs()
+
+
+@pytest.fixture
+def crm_sheets():
+    """Tables of the "crm" spreadsheet on `server`; override in a module for other data"""
+    return {
+        "Contacts": [["name", "email"], ["Ada", "ada@example.com"], ["Grace", "grace@example.com"]],
+        "Deals": [["deal", "amount"], ["Engine", "1000"]],
+    }
+
+
+@pytest.fixture
+def server(crm_sheets):
+    server = FakeSheetsServer()
+    server.add_spreadsheet("crm", crm_sheets)
+    return server
+
+
+@pytest.fixture
+def config(server, monkeypatch):
+    """Run config of a user whose CRM is the "crm" spreadsheet on `server`"""
+    monkeypatch.setattr(sheets, "_client", server.client())
+    return {"configurable": {"spreadsheet_id": "crm", "google_access_token": "token"}}
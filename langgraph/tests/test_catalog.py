@@ -0,0 +1,122 @@
+import pytest
+
+from utils import crm_tools
+from utils.catalog import Catalog
+from utils.fake_sheets import FakeSheetsServer
+from utils.sheets import SheetsCRM
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def server():
+    server = FakeSheetsServer()
+    for i in range(5):
+        server.add_spreadsheet(f"s{i}", {"Sheet1": [["a", "b"]]}, name=f"Book {i}")
+    server.add_spreadsheet("crm", {"Contacts": [["name", "email"]], "Deals": [["deal"]]}, name="Sales CRM")
+    return server
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def refresh(server, catalog, **kwargs):
+    client = server.client()
+    catalog.refresh("token", lambda file_id: SheetsCRM(file_id, "token", client=client), client=client, **kwargs)
+
+
+def test_first_refresh_pages_through_every_spreadsheet(server, clock):
+    catalog = Catalog(page_size=2, clock=clock)
+    refresh(server, catalog)
+    assert server.count("driveList") == 3
+    assert len(catalog.spreadsheets) == 6
+    assert catalog.spreadsheets["crm"].name == "Sales CRM"
+    assert catalog.spreadsheets["crm"].tables["Contacts"].columns == ["name", "email"]
+    assert [(s.id, t.title) for s, t in catalog.find("deal")] == [("crm", "Deals")]
+    assert [t.title for _, t in catalog.find("sales")] == ["Contacts", "Deals"]
+    assert len(catalog.find("")) == 7
+
+
+def test_catalog_is_reused_within_the_ttl(server, clock):
+    catalog = Catalog(ttl=60, clock=clock)
+    refresh(server, catalog)
+    requests = server.count()
+    clock.now = 59
+    refresh(server, catalog)
+    assert server.count() == requests
+
+
+def test_later_refreshes_only_reload_changed_spreadsheets(server, clock):
+    catalog = Catalog(ttl=60, clock=clock)
+    refresh(server, catalog)
+    server.add_sheet("crm", "Leads", [["name", "source"]])
+    server.add_spreadsheet("new", {"Tasks": [["task"]]}, name="Todo")
+    clock.now = 60
+    gets = server.count("get")
+    refresh(server, catalog)
+    # One listing page of just the two changed files, and their tabs
+    assert server.count("driveList") == 2
+    assert server.count("get") == gets + 2
+    assert catalog.spreadsheets["crm"].tables["Leads"].columns == ["name", "source"]
+    assert catalog.spreadsheets["new"].name == "Todo"
+
+
+def test_full_refresh_drops_removed_spreadsheets(server, clock):
+    catalog = Catalog(ttl=60, full_refresh=600, clock=clock)
+    refresh(server, catalog)
+    server.remove_spreadsheet("s0")
+    clock.now = 60
+    refresh(server, catalog)
+    assert "s0" in catalog.spreadsheets
+    clock.now = 600
+    refresh(server, catalog)
+    assert "s0" not in catalog.spreadsheets
+
+
+def test_spreadsheets_whose_tabs_failed_to_load_are_retried(server, clock, monkeypatch):
+    handle = server.handle
+
+    def rate_limited(request):
+        if request.url.path == "/v4/spreadsheets/crm":
+            return server._error(429, "Quota exceeded")
+        return handle(request)
+
+    catalog = Catalog(ttl=60, full_refresh=600, clock=clock)
+    monkeypatch.setattr(server, "handle", rate_limited)
+    refresh(server, catalog)
+    assert catalog.spreadsheets["crm"].name == "Sales CRM" and catalog.spreadsheets["crm"].tables == {}
+    # Still failing: tried again on the next (incremental) refresh, which does not list it
+    clock.now = 60
+    refresh(server, catalog)
+    assert not catalog.spreadsheets["crm"].loaded
+    monkeypatch.setattr(server, "handle", handle)
+    clock.now = 120
+    refresh(server, catalog)
+    assert catalog.spreadsheets["crm"].loaded
+    assert [(s.id, t.title) for s, t in catalog.find("deal")] == [("crm", "Deals")]
+    # A full refresh lists it again with the same modifiedTime, and still reloads it
+    catalog = Catalog(ttl=60, full_refresh=600, clock=clock)
+    monkeypatch.setattr(server, "handle", rate_limited)
+    refresh(server, catalog)
+    monkeypatch.setattr(server, "handle", handle)
+    clock.now = 600 + 120
+    refresh(server, catalog)
+    assert catalog.spreadsheets["crm"].tables.keys() == {"Contacts", "Deals"}
+
+
+def test_findtable_without_a_chosen_spreadsheet_searches_them_all(server, config):
+    del config["configurable"]["spreadsheet_id"]
+    config["configurable"]["user_id"] = 1
+    assert crm_tools.findtable("deal", config) == "Sales CRM (crm) / Deals: deal"
+    requests = server.count()
+    config["configurable"]["spreadsheet_id"] = "crm"
+    assert crm_tools.findtable("contacts", config) == "Contacts: name, email"
+    assert server.count() == requests
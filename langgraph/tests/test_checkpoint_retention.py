@@ -0,0 +1,133 @@
+import random
+import sqlite3
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from utils import checkpoint_retention
+from utils.checkpoint_retention import RetentionPolicy, apply_retention, checkpoint_time, main
+
+NOW = datetime(2026, 6, 1, tzinfo=timezone.utc)
+
+
+def checkpoint_id(days_ago: float, seq: int = 0) -> str:
+    """A version 6 UUID like the graph's, created `days_ago` before NOW"""
+    at = NOW - timedelta(days=days_ago, microseconds=-seq)
+    ticks = int((at - datetime(1582, 10, 15, tzinfo=timezone.utc)) / timedelta(microseconds=1)) * 10
+    version, variant = 6 << 76, 2 << 62
+    value = ((ticks >> 12) << 80) | version | ((ticks & 0xFFF) << 64) | variant | random.getrandbits(62)
+    return str(uuid.UUID(int=value))
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+    saver = SqliteSaver(sqlite3.connect(path, check_same_thread=False))
+
+    def put(thread_id, *ages, size=100):
+        parent, ids = None, []
+        for seq, days_ago in enumerate(ages):
+            checkpoint = empty_checkpoint()
+            checkpoint["id"] = checkpoint_id(days_ago, seq)
+            checkpoint["channel_values"] = {"messages": ["x" * size] * (seq + 1)}
+            config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": "", "checkpoint_id": parent}}
+            saved = saver.put(config, checkpoint, {"step": seq}, {})
+            saver.put_writes(saved, [("messages", "y" * size)], f"task{seq}")
+            parent = checkpoint["id"]
+            ids.append(parent)
+        return ids
+
+    def remaining(thread_id):
+        return len(list(saver.list({"configurable": {"thread_id": thread_id}})))
+
+    yield path, saver, put, remaining
+    saver.conn.close()
+
+
+def test_checkpoint_time():
+    checkpoint = empty_checkpoint()
+    assert abs(checkpoint_time(checkpoint["id"]) - datetime.fromisoformat(checkpoint["ts"])) < timedelta(milliseconds=1)
+    assert checkpoint_time(checkpoint_id(3)) == NOW - timedelta(days=3)
+
+
+def test_keep_last_keeps_newest_checkpoints_and_their_writes(db):
+    path, saver, put, remaining = db
+    put("t1", 0.5, 0.4, 0.3, 0.2, 0.1, 0)
+    latest = saver.get_tuple({"configurable": {"thread_id": "t1"}})
+    report = apply_retention(path, RetentionPolicy(keep_last=2, latest_only_after=None, drop_inactive_after=None), now=NOW)
+    assert (report.checkpoints, report.writes, report.threads) == (4, 4, 0)
+    assert remaining("t1") == 2
+    after = saver.get_tuple({"configurable": {"thread_id": "t1"}})
+    assert after.checkpoint == latest.checkpoint and after.pending_writes == latest.pending_writes
+    assert saver.conn.execute("SELECT count(*) FROM writes").fetchone()[0] == 2
+
+
+def test_age_policies(db):
+    path, saver, put, remaining = db
+    put("idle", 100, 95)
+    old = put("old", 20, 15, 10)
+    put("active", 20, 10, 1, 0)
+    policy = RetentionPolicy(keep_last=None, latest_only_after=timedelta(days=7), drop_inactive_after=timedelta(days=30))
+    report = apply_retention(path, policy, now=NOW)
+    assert (report.checkpoints, report.threads) == (6, 1)
+    assert (remaining("idle"), remaining("old"), remaining("active")) == (0, 1, 2)
+    assert saver.get_tuple({"configurable": {"thread_id": "old"}}).checkpoint["id"] == old[-1]
+
+
+def test_checkpoints_written_after_planning_are_kept(db, monkeypatch):
+    path, saver, put, remaining = db
+    ids = put("idle", 100, 95)
+    planned = checkpoint_retention.plan
+
+    def plan_then_resume(conn, policy, now=None):
+        doomed, dropped = planned(conn, policy, now)
+        # The conversation resumes before the deletes run
+        checkpoint = empty_checkpoint()
+        checkpoint["id"] = checkpoint_id(0)
+        config = {"configurable": {"thread_id": "idle", "checkpoint_ns": "", "checkpoint_id": ids[-1]}}
+        saver.put_writes(saver.put(config, checkpoint, {"step": 2}, {}), [("messages", "y")], "task2")
+        return doomed, dropped
+
+    monkeypatch.setattr(checkpoint_retention, "plan", plan_then_resume)
+    policy = RetentionPolicy(keep_last=None, latest_only_after=None, drop_inactive_after=timedelta(days=30))
+    report = apply_retention(path, policy, now=NOW)
+    assert (report.checkpoints, report.writes) == (2, 2)
+    latest = saver.get_tuple({"configurable": {"thread_id": "idle"}})
+    assert remaining("idle") == 1 and latest.checkpoint["id"] != ids[-1] and len(latest.pending_writes) == 1
+
+
+def test_idle_threads_are_kept_by_default(db, capsys):
+    path, saver, put, remaining = db
+    put("idle", 400, 300, 200)
+    assert RetentionPolicy().drop_inactive_after is None
+    main([path, "--keep-last", "1"])
+    assert "0 thread(s) dropped" in capsys.readouterr().out
+    assert remaining("idle") == 1
+
+
+def test_batched_deletes_reclaim_space_with_incremental_vacuum(db, capsys):
+    path, saver, put, remaining = db
+    for i in range(10):
+        put(f"t{i}", *range(20, 0, -1), size=2000)
+    report = apply_retention(path, RetentionPolicy(keep_last=3, latest_only_after=None, drop_inactive_after=None),
+                             batch=7, now=NOW)
+    assert report.checkpoints == 170 and all(remaining(f"t{i}") == 3 for i in range(10))
+    assert report.reclaimed > report.bytes_before // 2
+    assert "Enabled incremental vacuum" in capsys.readouterr().out
+    assert saver.conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+    put("t0", *range(10, 0, -1), size=2000)
+    report = apply_retention(path, RetentionPolicy(keep_last=3, latest_only_after=None, drop_inactive_after=None), now=NOW)
+    assert report.checkpoints == 10 and report.reclaimed > 0
+    assert "Enabled" not in capsys.readouterr().out
+
+
+def test_cli(db, capsys):
+    path, saver, put, remaining = db
+    put("t1", 3, 2, 1)
+    main([path, "--keep-last", "1", "--latest-only-days", "off", "--inactive-days", "off"])
+    assert "Deleted 2 checkpoint(s) and 2 write(s)" in capsys.readouterr().out
+    assert remaining("t1") == 1
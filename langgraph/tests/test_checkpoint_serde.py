@@ -0,0 +1,120 @@
+import asyncio
+import sqlite3
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.graph import START, MessagesState, StateGraph
+
+from utils.checkpoint_retention import RetentionPolicy, apply_retention
+from utils.checkpoint_serde import CompactSerializer
+from utils.checkpointer import CompactPooledSqliteSaver, CompactSqliteSaver, make_checkpointer
+
+
+def echo_graph(checkpointer):
+    builder = StateGraph(MessagesState)
+    builder.add_node("echo", lambda state: {"messages": [AIMessage(content="echo: " + state["messages"][-1].content)]})
+    builder.add_edge(START, "echo")
+    return builder.compile(checkpointer=checkpointer)
+
+
+def converse(graph, thread_id, turns):
+    config = {"configurable": {"thread_id": thread_id}}
+    for i in range(turns):
+        graph.invoke({"messages": [HumanMessage(content=f"row {i} of the Contacts table, please")]}, config)
+    return config
+
+
+def history(saver, config):
+    return [(t.checkpoint["id"], t.checkpoint["channel_values"]) for t in saver.list(config)]
+
+
+def types(saver):
+    return [row[0] for row in saver.conn.execute("SELECT type FROM checkpoints ORDER BY checkpoint_id")]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "checkpoints.db")
+
+
+def test_serializer_round_trips():
+    serde = CompactSerializer()
+    value = {"messages": [HumanMessage(content="hello " * 50)], "count": 3}
+    type_, data = serde.dumps_typed(value)
+    assert type_ == "msgpack+zstd1"
+    assert len(data) < len(JsonPlusSerializer().dumps_typed(value)[1])
+    assert serde.loads_typed((type_, data)) == value
+    assert serde.dumps_typed(1) == ("msgpack", JsonPlusSerializer().dumps_typed(1)[1])  # too small to compress
+    assert serde.loads_typed(JsonPlusSerializer().dumps_typed(value)) == value
+    assert serde.loads_typed(serde.dumps_typed(None)) is None
+
+
+def test_messages_are_stored_as_deltas(path):
+    saver = CompactSqliteSaver(sqlite3.connect(path, check_same_thread=False), keyframe_every=4)
+    config = converse(echo_graph(saver), "t1", 6)
+    expected = history(saver, config)
+    assert len(expected[0][1]["messages"]) == 12
+    stored = types(saver)
+    assert "msgpack+zstd1+delta" in stored
+    # Never more than 3 deltas in a row
+    assert max(len(run) for run in "".join("d" if "delta" in t else " " for t in stored).split()) <= 3
+
+    # Read back by a saver with nothing cached, following each chain in the database
+    fresh = CompactSqliteSaver(sqlite3.connect(path, check_same_thread=False))
+    assert history(fresh, config) == expected
+
+    plain = SqliteSaver(sqlite3.connect(":memory:", check_same_thread=False))
+    converse(echo_graph(plain), "t1", 6)
+    saved = sum(len(row[0]) for row in saver.conn.execute("SELECT checkpoint FROM checkpoints"))
+    default = sum(len(row[0]) for row in plain.conn.execute("SELECT checkpoint FROM checkpoints"))
+    assert saved * 3 < default
+
+
+def test_fork_stores_a_full_checkpoint(path):
+    saver = CompactSqliteSaver(sqlite3.connect(path, check_same_thread=False))
+    graph = echo_graph(saver)
+    config = converse(graph, "t1", 3)
+    earlier = list(saver.list(config))[3].config
+    forked = graph.invoke({"messages": [HumanMessage(content="instead")]}, earlier)
+    assert [m.content for m in forked["messages"]][-2:] == ["instead", "echo: instead"]
+    fresh = CompactSqliteSaver(sqlite3.connect(path, check_same_thread=False))
+    assert fresh.get_tuple(config).checkpoint["channel_values"] == saver.get_tuple(config).checkpoint["channel_values"]
+
+
+def test_pooled_async_graph(path):
+    with CompactPooledSqliteSaver(path, readers=2) as saver:
+        graph = echo_graph(saver)
+
+        async def run(thread_id):
+            config = {"configurable": {"thread_id": thread_id}}
+            for i in range(4):
+                await graph.ainvoke({"messages": [HumanMessage(content=f"turn {i}")]}, config)
+            return len((await graph.aget_state(config)).values["messages"])
+
+        async def runs():
+            return await asyncio.gather(*(run(f"t{i}") for i in range(5)))
+
+        assert asyncio.run(runs()) == [8] * 5
+        assert "msgpack+zstd1+delta" in types(saver)
+    with CompactPooledSqliteSaver(path, readers=2) as fresh:
+        assert len(fresh.get_tuple({"configurable": {"thread_id": "t3"}}).checkpoint["channel_values"]["messages"]) == 8
+
+
+def test_retention_keeps_delta_bases(path):
+    saver = CompactSqliteSaver(sqlite3.connect(path, check_same_thread=False), keyframe_every=100)
+    config = converse(echo_graph(saver), "t1", 4)
+    latest = saver.get_tuple(config).checkpoint
+    report = apply_retention(path, RetentionPolicy(keep_last=1, latest_only_after=None, drop_inactive_after=None))
+    # Only the first checkpoint, which has no messages, is not a base of the latest one
+    assert report.checkpoints == 1
+    fresh = CompactSqliteSaver(sqlite3.connect(path, check_same_thread=False))
+    assert fresh.get_tuple(config).checkpoint == latest
+
+
+def test_make_checkpointer_serde(path):
+    assert isinstance(make_checkpointer(path, "sqlite", "compact"), CompactSqliteSaver)
+    assert type(make_checkpointer(path, "sqlite", "default")) is SqliteSaver
+    with pytest.raises(ValueError):
+        make_checkpointer(path, "sqlite", "pickle")
@@ -0,0 +1,93 @@
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.graph import START, StateGraph
+from typing_extensions import TypedDict
+
+from utils.checkpointer import PooledSqliteSaver, make_checkpointer
+
+
+class State(TypedDict):
+    count: int
+
+
+def counter_graph(checkpointer):
+    builder = StateGraph(State)
+    builder.add_node("add", lambda state: {"count": state["count"] + 1})
+    builder.add_edge(START, "add")
+    return builder.compile(checkpointer=checkpointer)
+
+
+@pytest.fixture
+def saver(tmp_path):
+    with PooledSqliteSaver(str(tmp_path / "checkpoints.db"), readers=4) as saver:
+        yield saver
+
+
+def put(saver, thread_id):
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    return saver.put(config, empty_checkpoint(), {"source": "input", "step": -1}, {})
+
+
+def test_graph_state_round_trips(saver):
+    graph = counter_graph(saver)
+    config = {"configurable": {"thread_id": "t1"}}
+    graph.invoke({"count": 1}, config)
+    graph.invoke({"count": graph.get_state(config).values["count"]}, config)
+    assert graph.get_state(config).values == {"count": 3}
+    assert len(list(graph.get_state_history(config))) == 6
+
+
+def test_async_graph(saver):
+    graph = counter_graph(saver)
+
+    async def run(thread_id):
+        config = {"configurable": {"thread_id": thread_id}}
+        await graph.ainvoke({"count": 1}, config)
+        return (await graph.aget_state(config)).values["count"]
+
+    async def runs():
+        return await asyncio.gather(*(run(f"t{i}") for i in range(20)))
+
+    assert asyncio.run(runs()) == [2] * 20
+
+
+def test_concurrent_writes_are_committed_in_batches(saver):
+    with ThreadPoolExecutor(max_workers=50) as pool:
+        configs = list(pool.map(lambda i: put(saver, f"t{i}"), range(500)))
+    assert {config["configurable"]["thread_id"] for config in configs} == {f"t{i}" for i in range(500)}
+    assert all(saver.get_tuple(config) is not None for config in configs)
+    assert saver.writes == 500
+    assert saver.commits < saver.writes
+
+
+def test_failed_write_does_not_undo_its_batch(saver):
+    incomplete = saver._submit([("INSERT INTO writes (thread_id) VALUES (?)", [("t",)])])  # NOT NULL columns
+    missing = saver._submit([("INSERT INTO no_such_table VALUES (?)", [(1,)])])
+    put(saver, "after")
+    with pytest.raises(sqlite3.IntegrityError):
+        incomplete.result()
+    with pytest.raises(sqlite3.OperationalError):
+        missing.result()
+    assert saver.get_tuple({"configurable": {"thread_id": "after"}}) is not None
+
+
+def test_database_stays_readable_by_sqlite_saver(saver):
+    put(saver, "t1")
+    reader = SqliteSaver(sqlite3.connect(saver.path, check_same_thread=False))
+    assert reader.get_tuple({"configurable": {"thread_id": "t1"}}) is not None
+
+
+def test_make_checkpointer(tmp_path):
+    assert isinstance(make_checkpointer(str(tmp_path / "a.db"), "sqlite"), SqliteSaver)
+    pooled = make_checkpointer(str(tmp_path / "b.db"), "pooled")
+    assert isinstance(pooled, PooledSqliteSaver)
+    pooled.close()
+    with pytest.raises(ValueError):
+        make_checkpointer(str(tmp_path / "c.db"), "redis")
+    with pytest.raises(ValueError):
+        PooledSqliteSaver(":memory:")
@@ -0,0 +1,132 @@
+import pytest
+
+from utils import crm_tools
+from utils.sheets import SheetsCRM, SheetsError
+
+
+@pytest.fixture
+def crm_sheets():
+    return {
+        "Contacts": [
+            ["name", "email", "company"],
+            ["Ada Lovelace", "ada@example.com", "Analytical"],
+            ["Grace Hopper", "grace@example.com", "Navy"],
+            ["Alan Turing", "alan@example.com", "Bletchley"],
+        ],
+        "Deals": [
+            ["deal", "contact", "amount"],
+            ["Engine", "Ada Lovelace", "1000"],
+        ],
+        "Bob's Notes": [
+            ["note"],
+        ],
+    }
+
+
+@pytest.fixture
+def crm(server):
+    return SheetsCRM("crm", "token", client=server.client())
+
+
+def test_catalog_is_loaded_once(server, crm):
+    tables = crm.tables()
+    assert list(tables) == ["Contacts", "Deals", "Bob's Notes"]
+    assert tables["Deals"].columns == ["deal", "contact", "amount"]
+    # Sheet properties, then every header row in one batchGet
+    assert server.count() == 2
+    crm.tables()
+    assert server.count() == 2
+
+
+def test_get_rows_of_several_tables_is_one_batch_get(server, crm):
+    rows = crm.get_rows({"Contacts": {"company": "navy"}, "Deals": {}})
+    assert rows["Contacts"] == [
+        {"_row": 3, "name": "Grace Hopper", "email": "grace@example.com", "company": "Navy"}
+    ]
+    assert [row["deal"] for row in rows["Deals"]] == ["Engine"]
+    assert server.requests == [("batchGet", "crm")]
+
+
+def test_add_rows_to_several_tables_is_one_batch_update(server, crm):
+    crm.tables()
+    before = server.count()
+    count = crm.add_rows({
+        "Contacts": [{"name": "Edsger Dijkstra", "email": "ewd@example.com"}, {"name": "Barbara Liskov"}],
+        "Deals": [{"deal": "Compiler", "contact": "Grace Hopper", "amount": "500"}],
+    })
+    assert count == 3
+    assert server.count() == before + 1 and server.count("batchUpdate") == 1
+    assert server.rows("crm", "Contacts")[-2:] == [
+        ["Edsger Dijkstra", "ewd@example.com", ""],
+        ["Barbara Liskov", "", ""],
+    ]
+    assert server.rows("crm", "Deals")[-1] == ["Compiler", "Grace Hopper", "500"]
+
+
+def test_unknown_column_is_rejected_before_writing(server, crm):
+    with pytest.raises(SheetsError, match="no column phone"):
+        crm.add_rows({"Contacts": [{"name": "X", "phone": "123"}]})
+    assert server.count("batchUpdate") == 0
+
+
+def test_delete_rows_bottom_up_in_one_batch_update(server, crm):
+    crm.tables()
+    assert crm.delete_rows({"Contacts": [2, 4]}) == 2
+    assert server.count("batchUpdate") == 1
+    assert server.rows("crm", "Contacts") == [
+        ["name", "email", "company"],
+        ["Grace Hopper", "grace@example.com", "Navy"],
+    ]
+    with pytest.raises(SheetsError):
+        crm.delete_rows({"Contacts": [1]})
+
+
+def test_unknown_table_reloads_the_catalog_once(server, crm):
+    crm.tables()
+    server.add_sheet("crm", "Leads", [["name"]])
+    assert crm.table("Leads").columns == ["name"]
+    with pytest.raises(SheetsError, match="No table named 'Nope'"):
+        crm.table("Nope")
+
+
+def test_quoted_titles(crm):
+    assert crm.get_rows({"Bob's Notes": {}}) == {"Bob's Notes": []}
+
+
+def test_tools(server, config):
+    assert crm_tools.findtable("deal", config) == "Deals: deal, contact, amount"
+    rows = crm_tools.getRow("Contacts", {"name": "ada lovelace"}, config)
+    assert [row["_row"] for row in rows] == [2]
+    assert crm_tools.addRow("Deals", [{"deal": "Bombe", "contact": "Alan Turing"}], config) == "Added 1 row(s) to Deals"
+    assert crm_tools.deleteRow("Contacts", [rows[0]["_row"]], config) == "Deleted 1 row(s) from Contacts"
+    # One Drive listing, then the tabs were loaded once for all four calls; the lookup checked
+    # the file version before its batchGet, and each write is its batchUpdate alone
+    assert server.count() == 1 + 2 + 2 + 1 + 1
+    assert server.count("drive") == 1
+
+
+def test_each_tool_call_is_one_round_trip_once_warm(server, config):
+    crm_tools.findtable("", config)
+    crm_tools.getRow("Deals", {}, config)
+    requests = server.count()
+    assert crm_tools.addRow("Deals", [{"deal": "Bombe"}], config) == "Added 1 row(s) to Deals"
+    assert crm_tools.updateRow("Deals", 3, {"amount": "500"}, config) == "Updated row 3 of Deals"
+    assert server.count() == requests + 2
+    # Our own writes are in the snapshot: the lookup only checks the version
+    assert crm_tools.getRow("Deals", {"deal": "bombe"}, config)[0]["amount"] == "500"
+    assert server.count() == requests + 3
+
+
+def test_get_row_matches_exactly_unless_searching(server, config):
+    assert crm_tools.getRow("Contacts", {"name": "Al"}, config) == []
+    assert [row["name"] for row in crm_tools.getRow("Contacts", {}, config, search={"name": "a"})] == [
+        "Ada Lovelace", "Alan Turing",
+    ]
+    assert [row["_row"] for row in crm_tools.getRow("Contacts", {"name": "alan turing"}, config)] == [4]
+    with pytest.raises(SheetsError, match="no column phone"):
+        crm_tools.getRow("Contacts", {"phone": "1"}, config)
+
+
+def test_tools_need_a_connected_spreadsheet():
+    with pytest.raises(SheetsError):
+        crm_tools.getRow("Contacts", {}, {"configurable": {}})
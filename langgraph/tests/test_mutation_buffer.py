@@ -0,0 +1,110 @@
+import pytest
+from langchain_core.messages import AIMessage
+from langgraph.graph import START, MessagesState, StateGraph
+
+from utils import crm_tools
+from utils.mutation_buffer import CRMToolNode, MutationBuffer
+from utils.sheets import SheetsCRM, SheetsError
+
+
+@pytest.fixture
+def crm_sheets():
+    return {
+        "Contacts": [
+            ["name", "email"],
+            ["Ada", "ada@example.com"],
+            ["Grace", "grace@example.com"],
+            ["Alan", "alan@example.com"],
+            ["Edsger", "edsger@example.com"],
+        ],
+        "Deals": [["deal", "amount"]],
+    }
+
+
+def tool_step(config, *calls):
+    message = AIMessage(content="", tool_calls=[
+        {"name": name, "args": args, "id": f"call{i}"} for i, (name, args) in enumerate(calls)
+    ])
+    builder = StateGraph(MessagesState)
+    builder.add_node("tools", CRMToolNode(crm_tools.tools))
+    builder.add_edge(START, "tools")
+    return builder.compile().invoke({"messages": [message]}, config)["messages"][1:]
+
+
+def test_tool_step_writes_in_one_batch_update(server, config):
+    messages = tool_step(
+        config,
+        ("deleteRow", {"table": "Contacts", "row_numbers": [2]}),
+        ("addRow", {"table": "Deals", "rows": [{"deal": "Engine", "amount": "1000"}]}),
+        ("updateRow", {"table": "Contacts", "row_number": 4, "values": {"email": "turing@example.com"}}),
+        ("deleteRow", {"table": "Contacts", "row_numbers": [5, 2]}),
+        ("addRow", {"table": "Contacts", "rows": [{"name": "Barbara"}]}),
+    )
+    assert [message.content for message in messages] == [
+        "Deleted 1 row(s) from Contacts",
+        "Added 1 row(s) to Deals",
+        "Updated row 4 of Contacts",
+        "Deleted 2 row(s) from Contacts",
+        "Added 1 row(s) to Contacts",
+    ]
+    assert [message.tool_call_id for message in messages] == [f"call{i}" for i in range(5)]
+    assert server.count("batchUpdate") == 1
+    # Row numbers all referred to the sheet before the step
+    assert server.rows("crm", "Contacts") == [
+        ["name", "email"],
+        ["Grace", "grace@example.com"],
+        ["Alan", "turing@example.com"],
+        ["Barbara", ""],
+    ]
+    assert server.rows("crm", "Deals") == [["deal", "amount"], ["Engine", "1000"]]
+
+
+def test_bad_write_fails_alone_before_the_batch(server, config):
+    messages = tool_step(
+        config,
+        ("addRow", {"table": "Deals", "rows": [{"stage": "won"}]}),
+        ("addRow", {"table": "Deals", "rows": [{"deal": "Bombe"}]}),
+    )
+    assert "has no column stage" in messages[0].content
+    assert messages[1].content == "Added 1 row(s) to Deals"
+    assert server.rows("crm", "Deals") == [["deal", "amount"], ["Bombe", ""]]
+
+
+def test_lookup_matching_nothing(server, config):
+    # An empty result is list content, which is never a write's placeholder
+    messages = tool_step(config, ("getRow", {"table": "Contacts", "where": {"name": "Nobody"}}))
+    assert messages[0].content == [] and messages[0].status == "success"
+
+
+def test_failed_batch_reports_every_write(server):
+    crm = SheetsCRM("crm", "token", client=server.client())
+    with MutationBuffer() as buffer:
+        first = buffer.add_rows(crm, "Deals", [{"deal": "Engine"}])
+        second = buffer.delete_rows(crm, "Contacts", [2])
+        del server.spreadsheets["crm"]["Deals"]  # the batch now names a sheet that is gone
+    assert first.result.startswith("Not saved: Sheets API error 400")
+    assert second.result == first.result
+    assert len(server.rows("crm", "Contacts")) == 5
+
+
+def test_writes_outside_a_tool_step_are_sent_at_once(server, config):
+    assert crm_tools.updateRow("Contacts", 2, {"name": "Ada Lovelace"}, config) == "Updated row 2 of Contacts"
+    assert server.rows("crm", "Contacts")[1] == ["Ada Lovelace", "ada@example.com"]
+    with pytest.raises(SheetsError, match="Row numbers start at 2"):
+        crm_tools.updateRow("Contacts", 1, {"name": "x"}, config)
+
+
+def test_routine_mistakes_become_tool_errors(server, config):
+    # SheetsError must not end the agent run: the model reads it and tries again
+    messages = tool_step(
+        config,
+        ("getRow", {"table": "Nope", "where": {}}),
+        ("addRow", {"table": "Nope", "rows": [{"name": "Barbara"}]}),
+        ("getRow", {"table": "Contacts", "where": {"name": "Ada"}}),
+    )
+    assert [message.status for message in messages] == ["error", "error", "success"]
+    assert "Sheets API error 400" in messages[0].content
+    assert "No table named 'Nope'" in messages[1].content
+    disconnected = tool_step({"configurable": {"google_access_token": "token"}},
+                             ("getRow", {"table": "Contacts", "where": {}}))
+    assert disconnected[0].status == "error" and "No CRM spreadsheet" in disconnected[0].content
@@ -0,0 +1,65 @@
+from utils.row_index import RowIndex, cell_matches, normalize
+
+
+def contacts():
+    return [
+        ["name", "email", "city"],
+        ["Ada Lovelace", "Ada@Example.com", "London"],
+        ["Grace  Hopper", "grace@example.com", "New York"],
+        [],
+        ["José Núñez", "jose@example.com", "London"],
+    ]
+
+
+def names(records):
+    return [record["name"] for record in records]
+
+
+def test_normalize():
+    assert normalize("  José   NÚÑEZ ") == "jose nunez"
+    assert cell_matches("Ada Lovelace", "love", prefix=True)
+    assert not cell_matches("Ada Lovelace", "love")
+    assert not cell_matches("Ada Lovelace", "ovelace", prefix=True)
+
+
+def test_where_matches_exactly_and_search_by_word_prefix():
+    index = RowIndex(contacts())
+    assert names(index.find({"email": "ada@example.COM"})) == ["Ada Lovelace"]
+    assert index.find({"email": "ada"}) == []
+    assert names(index.find({"name": "grace hopper"})) == ["Grace  Hopper"]
+    assert names(index.find({"name": "josé nuñez"})) == ["José Núñez"]
+    assert index.find({"name": "hop"}) == []
+    assert names(index.find({}, search={"name": "hop"})) == ["Grace  Hopper"]
+    assert names(index.find({}, search={"name": "grace h"})) == ["Grace  Hopper"]
+    assert names(index.find({}, search={"email": "grace"})) == ["Grace  Hopper"]
+    # Unindexed columns are checked on the candidates; blank rows never match
+    assert names(index.find({"city": "london"})) == ["Ada Lovelace", "José Núñez"]
+    assert names(index.find({"city": "london"}, search={"name": "j"})) == ["José Núñez"]
+    assert [record["_row"] for record in index.find({})] == [2, 3, 5]
+    assert len(index.find({}, limit=2)) == 2
+
+
+def test_scan_without_indexes_matches_the_same_rows():
+    indexed, scanned = RowIndex(contacts()), RowIndex(contacts(), indexed=False)
+    for where in ({"email": "GRACE@example.com"}, {"name": "ada lovelace"}, {"city": "London"}, {}):
+        assert indexed.find(where) == scanned.find(where)
+        assert indexed.find(where, search={"name": "lov"}) == scanned.find(where, search={"name": "lov"})
+
+
+def test_append_and_delete_update_rows_and_indexes():
+    values = contacts()
+    index = RowIndex(values)
+    index.append([["Alan Turing", "alan@example.com", "London"]])
+    assert index.find({}, search={"name": "turing"})[0]["_row"] == 6
+    index.delete([2, 4])
+    assert values[1:] == [
+        ["Grace  Hopper", "grace@example.com", "New York"],
+        ["José Núñez", "jose@example.com", "London"],
+        ["Alan Turing", "alan@example.com", "London"],
+    ]
+    assert index.find({}, search={"name": "ada"}) == []
+    assert index.find({"email": "ada@example.com"}) == []
+    assert [(record["name"], record["_row"]) for record in index.find({"city": "london"})] == [
+        ("José Núñez", 3), ("Alan Turing", 4),
+    ]
+    assert RowIndex(values).find({}) == index.find({})
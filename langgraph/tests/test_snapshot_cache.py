@@ -0,0 +1,153 @@
+import pytest
+
+from utils.sheets import SheetsCRM
+from utils.snapshot_cache import SnapshotCache
+
+
+def crm_for(server, cache):
+    return SheetsCRM("crm", "token", client=server.client(), cache=cache)
+
+
+def test_unchanged_sheet_is_served_from_the_snapshot(server):
+    cache = SnapshotCache()
+    crm = crm_for(server, cache)
+    first = crm.get_rows({"Contacts": {"name": "ada"}})
+    assert crm.get_rows({"Contacts": {"name": "ada"}}) == first
+    assert crm.get_rows({"Contacts": {"name": "grace"}})["Contacts"][0]["_row"] == 3
+    # Every lookup checks the version; the sheet itself was fetched once
+    assert server.count("drive") == 3
+    assert server.count("batchGet") == 1
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+    assert stats["hit_rate"] == pytest.approx(2 / 3)
+    assert stats["bytes_saved"] == 2 * stats["bytes_fetched"] > 0
+
+
+def test_only_missing_tables_are_fetched(server):
+    crm = crm_for(server, SnapshotCache())
+    crm.get_rows({"Contacts": {}})
+    crm.get_rows({"Contacts": {}, "Deals": {}})
+    assert server.count("batchGet") == 2
+    assert [r for r in server.requests if r[0] == "batchGet"] == [("batchGet", "crm")] * 2
+
+
+def test_changed_sheet_is_fetched_again(server):
+    cache = SnapshotCache()
+    crm = crm_for(server, cache)
+    crm.get_rows({"Contacts": {}})
+    server.edit("crm", "Contacts", [["name", "email"], ["Alan", "alan@example.com"]])
+    rows = crm.get_rows({"Contacts": {}})["Contacts"]
+    assert [row["name"] for row in rows] == ["Alan"]
+    assert server.count("batchGet") == 2
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_own_writes_update_the_snapshot_in_place(server):
+    cache = SnapshotCache()
+    crm = crm_for(server, cache)
+    crm.get_rows({"Contacts": {}})
+    index = cache._memory["crm"].indexes["Contacts"]
+    crm.add_rows({"Contacts": [{"name": "Barbara", "email": "barbara@example.com"}]})
+    crm.delete_rows({"Contacts": [2]})
+    rows = crm.get_rows({"Contacts": {}})["Contacts"]
+    assert [(row["name"], row["_row"]) for row in rows] == [("Grace", 2), ("Barbara", 3)]
+    assert crm.get_rows({"Contacts": {"email": "BARBARA@example.com"}})["Contacts"][0]["_row"] == 3
+    crm.update_rows({"Contacts": {2: {"email": "hopper@example.com"}}})
+    assert crm.get_rows({"Contacts": {"email": "grace@example.com"}})["Contacts"] == []
+    assert crm.get_rows({"Contacts": {"email": "hopper@example.com"}})["Contacts"][0]["name"] == "Grace"
+    # The first lookup and the catalog the writes needed; the rest were hits on the patched index
+    assert server.count("batchGet") == 1 + 1
+    assert cache.stats()["misses"] == 1
+    assert cache._memory["crm"].indexes["Contacts"] is index
+
+
+def test_write_past_the_cached_rows_is_fetched_again(server):
+    cache = SnapshotCache()
+    crm = crm_for(server, cache)
+    crm.get_rows({"Contacts": {}, "Deals": {}})
+    crm.update_rows({"Contacts": {10: {"name": "Barbara"}}})
+    rows = crm.get_rows({"Contacts": {}, "Deals": {}})
+    assert [(row["name"], row["_row"]) for row in rows["Contacts"]][-1] == ("Barbara", 10)
+    # Only Contacts was fetched again
+    assert server.count("batchGet") == 1 + 1 + 1
+
+
+def test_edit_racing_our_write_is_not_hidden(server):
+    cache = SnapshotCache()
+    crm = crm_for(server, cache)
+    crm.get_rows({"Contacts": {}, "Deals": {}})
+    batch_update = server._batch_update
+
+    def edited_first(*args):
+        # Someone else changes Deals just before our write lands
+        server.edit("crm", "Deals", [["deal", "amount"], ["Bombe", "500"]])
+        return batch_update(*args)
+
+    server._batch_update = edited_first
+    crm.add_rows({"Contacts": [{"name": "Barbara"}]})
+    server._batch_update = batch_update
+    assert [row["deal"] for row in crm.get_rows({"Deals": {}})["Deals"]] == ["Bombe"]
+    assert crm.get_rows({"Contacts": {}})["Contacts"][-1]["name"] == "Barbara"
+
+
+def test_overlapping_writes_drop_the_snapshot(server):
+    cache = SnapshotCache()
+    crm = crm_for(server, cache)
+    crm.get_rows({"Contacts": {}})
+    crm.tables()
+    batch_update = server._batch_update
+
+    def another_write_in_flight(*args):
+        server._batch_update = batch_update
+        crm_for(server, cache).add_rows({"Contacts": [{"name": "Alan"}]})
+        return batch_update(*args)
+
+    server._batch_update = another_write_in_flight
+    crm.add_rows({"Contacts": [{"name": "Barbara"}]})
+    assert "crm" not in cache._memory
+    rows = crm.get_rows({"Contacts": {}})["Contacts"]
+    assert [row["name"] for row in rows] == ["Ada", "Grace", "Alan", "Barbara"]
+
+
+def test_write_after_someone_elses_edit(server):
+    cache = SnapshotCache()
+    crm = crm_for(server, cache)
+    crm.get_rows({"Contacts": {}})
+    server.edit("crm", "Contacts", [["name", "email"], ["Alan", "alan@example.com"]])
+    crm.add_rows({"Contacts": [{"name": "Barbara"}]})
+    rows = crm.get_rows({"Contacts": {}})["Contacts"]
+    assert [row["name"] for row in rows] == ["Alan", "Barbara"]
+    assert server.count("batchGet") == 1 + 1 + 1  # rows, catalog, the write
+
+
+def test_disk_snapshot_survives_a_restart(server, tmp_path):
+    path = str(tmp_path / "snapshots.db")
+    crm_for(server, SnapshotCache(path=path)).get_rows({"Contacts": {}})
+
+    cache = SnapshotCache(path=path)  # new process
+    rows = crm_for(server, cache).get_rows({"Contacts": {}})["Contacts"]
+    assert len(rows) == 2
+    assert server.count("batchGet") == 1
+    assert cache.stats()["hits"] == 1
+
+    # Own writes are persisted with the new version once a lookup has confirmed it
+    crm_for(server, cache).add_rows({"Contacts": [{"name": "Barbara"}]})
+    crm_for(server, cache).get_rows({"Contacts": {}})
+    cache = SnapshotCache(path=path)
+    rows = crm_for(server, cache).get_rows({"Contacts": {}})["Contacts"]
+    assert rows[-1]["name"] == "Barbara"
+    assert server.count("batchGet") == 1 + 1  # the write loaded the catalog
+
+    # A stale disk snapshot is dropped, not served
+    server.edit("crm", "Contacts", [["name", "email"]])
+    cache = SnapshotCache(path=path)
+    assert crm_for(server, cache).get_rows({"Contacts": {}})["Contacts"] == []
+    assert server.count("batchGet") == 3
+
+
+def test_memory_is_bounded(server):
+    server.add_spreadsheet("other", {"Sheet1": [["a"], ["1"]]})
+    cache = SnapshotCache(max_spreadsheets=1)
+    crm_for(server, cache).get_rows({"Contacts": {}})
+    SheetsCRM("other", "token", client=server.client(), cache=cache).get_rows({"Sheet1": {}})
+    assert cache.stats()["spreadsheets"] == 1
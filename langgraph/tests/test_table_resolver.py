@@ -0,0 +1,80 @@
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from utils import crm_tools
+from utils.catalog import get_catalog
+from utils.sheets import Table
+from utils.table_resolver import TableResolver, words
+
+
+def resolver():
+    resolver = TableResolver()
+    resolver.update_spreadsheet("crm", "Sales CRM", {
+        "Leads": Table("Leads", 1, ["name", "email", "source"]),
+        "Contacts": Table("Contacts", 2, ["name", "email", "company"]),
+        "Deals": Table("Deals", 3, ["deal", "contact", "amount"]),
+    })
+    resolver.update_spreadsheet("hr", "Hiring pipeline", {
+        "Candidates": Table("Candidates", 1, ["name", "email", "lead source"]),
+    })
+    return resolver
+
+
+def titles(matches):
+    return [(match.spreadsheet_id, match.table.title) for match in matches]
+
+
+def test_words():
+    assert words("The LEADS sheet, Café-Contacts") == ["the", "lead", "sheet", "cafe", "contact"]
+
+
+def test_tab_titles_outrank_names_and_columns():
+    index = resolver()
+    assert titles(index.resolve("the leads sheet"))[:2] == [("crm", "Leads"), ("hr", "Candidates")]
+    assert titles(index.resolve("hiring"))[0] == ("hr", "Candidates")
+    assert titles(index.resolve("amount"))[0] == ("crm", "Deals")
+    assert index.resolve("the sheet") == []
+
+
+def test_misspelt_words_still_match():
+    index = resolver()
+    assert titles(index.resolve("contcts"))[0] == ("crm", "Contacts")
+    assert titles(index.resolve("candidate tab"))[0] == ("hr", "Candidates")
+
+
+def test_unambiguous_needs_a_named_and_clear_winner():
+    index = resolver()
+    assert index.unambiguous("add Ada to the leads sheet").table.title == "Leads"
+    assert index.unambiguous("what is in my email column") is None  # only column names
+    assert index.unambiguous("leads", spreadsheet_id="hr") is None
+    assert index.unambiguous("sales") is None  # three tabs of one spreadsheet tie
+
+
+def test_updates_are_incremental():
+    index = resolver()
+    index.update_spreadsheet("crm", "Sales CRM", {"Pipeline": Table("Pipeline", 4, ["stage"])})
+    assert titles(index.resolve("leads")) == [("hr", "Candidates")]
+    assert titles(index.resolve("pipeline"))[:2] == [("crm", "Pipeline"), ("hr", "Candidates")]
+    index.remove_spreadsheet("hr")
+    assert len(index) == 1
+    assert index.resolve("candidates") == []
+
+
+def test_table_hint(server, config):
+    server.add_sheet("crm", "Leads", [["name", "email"]])
+    message = HumanMessage(content="Add Ada to the leads sheet")
+    # No catalog yet: no hint, and the turn does not wait for the refresh it starts
+    server.latency = 0.2
+    started = time.perf_counter()
+    assert crm_tools.table_hint([message], config) is None
+    assert time.perf_counter() - started < 0.1
+    get_catalog("token").background.join()
+    server.latency = 0.0
+    requests = server.count()
+    hint = crm_tools.table_hint([message], config)
+    assert server.count() == requests
+    assert "'Leads'" in hint and "name, email" in hint
+    assert crm_tools.table_hint([HumanMessage(content="hello")], config) is None
+    assert crm_tools.table_hint([AIMessage(content="the leads sheet")], config) is None
+    assert crm_tools.table_hint([HumanMessage(content="leads")], {"configurable": {}}) is None
@@ -0,0 +1,155 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import START, MessagesState, StateGraph
+from langgraph.types import Command, interrupt
+
+from utils import crm_tools
+from utils.mutation_buffer import CRMToolNode
+from utils.tool_executor import ToolExecutor, async_tool
+
+
+class Probe:
+    """Counts how many calls run at once"""
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+
+    def __exit__(self, *exc_info):
+        with self.lock:
+            self.running -= 1
+
+
+@pytest.fixture
+def probe():
+    return Probe()
+
+
+@pytest.fixture
+def executor(probe):
+    def slow(seconds: float, config: RunnableConfig) -> str:
+        """Sleeps"""
+        with probe:
+            time.sleep(seconds)
+        return f"slept {seconds}"
+
+    def broken(config: RunnableConfig) -> str:
+        """Fails"""
+        raise RuntimeError("boom")
+
+    return ToolExecutor([async_tool(slow), async_tool(broken)], max_per_user=2)
+
+
+def calls(*args):
+    return [{"name": name, "args": args, "id": f"call{i}"} for i, (name, args) in enumerate(args)]
+
+
+def user_config(user):
+    return {"configurable": {"user_id": user}}
+
+
+STEP = calls(
+    ("slow", {"seconds": 0.05}),
+    ("broken", {}),
+    ("slow", {"seconds": 0.01}),
+    ("nope", {}),
+    ("slow", {"seconds": 0.03}),
+)
+
+
+def check_step(messages):
+    assert [message.tool_call_id for message in messages] == [f"call{i}" for i in range(5)]
+    assert [message.content for message in messages[::2]] == ["slept 0.05", "slept 0.01", "slept 0.03"]
+    assert messages[1].status == "error" and "boom" in messages[1].content
+    assert messages[3].status == "error" and "not a valid tool" in messages[3].content
+
+
+def test_async_calls_run_concurrently_in_order(executor, probe):
+    check_step(asyncio.run(executor.arun(STEP, user_config(1))))
+    assert probe.peak == 2
+
+
+def test_sync_calls_run_concurrently_in_order(executor, probe):
+    check_step(executor.run(STEP, user_config(1)))
+    assert probe.peak == 2
+
+
+def test_cap_is_per_user_across_runs(executor, probe):
+    step = calls(*[("slow", {"seconds": 0.02})] * 4)
+
+    async def runs(*users):
+        await asyncio.gather(*(executor.arun(step, user_config(user)) for user in users))
+
+    asyncio.run(runs(1, 1))
+    assert probe.peak == 2
+    probe.peak = 0
+    asyncio.run(runs(1, 2))
+    assert probe.peak == 4
+
+
+def test_one_user_on_two_event_loops(executor, probe):
+    step = calls(*[("slow", {"seconds": 0.02})] * 4)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(asyncio.run(executor.arun(step, user_config(1)))))
+               for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [[message.content for message in messages] for messages in results] == [["slept 0.02"] * 4] * 2
+
+
+@pytest.mark.parametrize("run_async", [False, True])
+def test_interrupt_pauses_the_graph(run_async):
+    def confirm(deal: str) -> str:
+        """Asks the user first"""
+        return f"{deal}: {interrupt(f'Delete {deal}?')}"
+
+    builder = StateGraph(MessagesState)
+    builder.add_node("tools", CRMToolNode([async_tool(confirm)]))
+    builder.add_edge(START, "tools")
+    graph = builder.compile(checkpointer=MemorySaver())
+    config = {"configurable": {"thread_id": "t1"}}
+    message = AIMessage(content="", tool_calls=calls(("confirm", {"deal": "Engine"})))
+
+    def invoke(value):
+        return asyncio.run(graph.ainvoke(value, config)) if run_async else graph.invoke(value, config)
+
+    paused = invoke({"messages": [message]})
+    assert paused["__interrupt__"][0].value == "Delete Engine?"
+    assert len(paused["messages"]) == 1
+    assert invoke(Command(resume="yes"))["messages"][-1].content == "Engine: yes"
+
+
+def test_agent_tool_step_runs_lookups_together(server, config):
+    server.latency = 0.05
+    builder = StateGraph(MessagesState)
+    builder.add_node("tools", CRMToolNode(crm_tools.tools))
+    builder.add_edge(START, "tools")
+    graph = builder.compile()
+    message = AIMessage(content="", tool_calls=calls(
+        ("getRow", {"table": "Contacts", "where": {}}),
+        ("getRow", {"table": "Deals", "where": {}}),
+        ("addRow", {"table": "Deals", "rows": [{"deal": "Bombe"}]}),
+    ))
+    started = time.perf_counter()
+    result = asyncio.run(graph.ainvoke({"messages": [message]}, config))
+    elapsed = time.perf_counter() - started
+    messages = result["messages"][1:]
+    assert '"Ada"' in messages[0].content and '"Engine"' in messages[1].content
+    assert messages[2].content == "Added 1 row(s) to Deals"
+    # Run one at a time: 2 round trips per lookup, 2 to load the catalog for the write, then
+    # 1 for the write itself, 0.35 s in all; together the first three calls overlap
+    assert elapsed < 0.3